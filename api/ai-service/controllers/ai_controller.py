@@ -1,4 +1,6 @@
-from fastapi import APIRouter
+import json
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from ..service.ai_service import AIService
 
@@ -9,14 +11,45 @@ ai_service = AIService()
 class ParseRequest(BaseModel):
     request_text: str
 
+class ParseBatchRequest(BaseModel):
+    request_texts: list[str]
+
 @router.post("/parse_ride_request")
-def parse_ride_request(request: ParseRequest):
+async def parse_ride_request(request: ParseRequest):
     # Placeholder logic for parsing ride request using AI
     try:
-        response = ai_service.parse_ride_request(request.request_text)
+        response = await ai_service.parse_ride_request(request.request_text)
         return {
             "message": "Ride request parsed successfully",
             "parsed_details": response
         }
     except Exception as e:
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
+
+@router.post("/parse_ride_request:batch")
+async def parse_ride_request_batch(request: ParseBatchRequest):
+    # Up to 10000 texts, e.g. a scheduled-rides import. Streams one JSON line
+    # per text as soon as it is parsed, tagged with its index in the request.
+    try:
+        items = ai_service.parse_ride_request_batch(request.request_texts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        (json.dumps(item) + "\n" async for item in items),
+        media_type="application/x-ndjson",
+    )
+
+@router.get("/cache/stats")
+def get_parse_cache_stats():
+    # Hit ratio and upstream LLM calls saved by the parse cache
+    return ai_service.cache.stats()
+
+@router.get("/parser/stats")
+def get_local_parser_stats():
+    # How many requests the local rules answered without the LLM
+    return ai_service.local_parser.stats()
+
+@router.get("/llm/stats")
+def get_llm_stats():
+    # Calls, timeouts, failures, circuit breaker state and local fallbacks
+    return ai_service.llm_stats()
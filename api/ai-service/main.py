@@ -1,5 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from common.metrics import MetricsMiddleware, create_metrics_router
+from common.tracing import TracingMiddleware, create_debug_traces_router
+from common.profiling import ProfilingMiddleware, create_debug_profile_router
 from .controllers import ai_controller
 
 app = FastAPI(title="AI Service API", version="1.0.0")
@@ -13,7 +16,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, status and in-flight metrics, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Span waterfalls of recent slow requests, served at /debug/traces
+app.add_middleware(TracingMiddleware)
+# Outermost, so a profiled request includes the other middleware; needs PROFILING_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(ai_controller.router)
+app.include_router(create_metrics_router())
+app.include_router(create_debug_traces_router())
+app.include_router(create_debug_profile_router())
 
 @app.get("/")
 def root():
@@ -1,29 +1,144 @@
+import asyncio
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
 import os
+from collections.abc import AsyncIterator
+from dotenv import load_dotenv
 
+# Load .env before the modules below read their settings from the environment
 load_dotenv()
 
+from common.tracing import span
+from .llm_client import GuardedLLMClient, LLMClient, LLMUnavailableError, create_llm_client
+from .local_parser import LocalRideParser
+from .parse_cache import ParseCache, normalize_request_text
+
+# Texts packed into one LLM call by the batch parser
+AI_LLM_BATCH_SIZE = int(os.getenv("AI_LLM_BATCH_SIZE", "25"))
+# Packed calls one batch keeps in flight; all calls still share the client's concurrency limit
+AI_LLM_BATCH_CONCURRENCY = int(os.getenv("AI_LLM_BATCH_CONCURRENCY", "4"))
+# A packed call writes an answer per text, so it gets a longer deadline than a single parse
+AI_LLM_BATCH_TIMEOUT_SECONDS = float(os.getenv("AI_LLM_BATCH_TIMEOUT_SECONDS", "30"))
+MAX_BATCH_TEXTS = 10000
+
 class AIService:
-    def __init__(self):
-        api_key = os.getenv("OPENAI_API_KEY")
-        self.client = OpenAI(api_key=api_key) if api_key else None
+    def __init__(self, llm_client: LLMClient | None = None, cache: ParseCache | None = None,
+                 local_parser: LocalRideParser | None = None):
+        llm_client = llm_client or create_llm_client()
+        if llm_client is not None and not isinstance(llm_client, GuardedLLMClient):
+            llm_client = GuardedLLMClient(llm_client)
+        self.llm_client = llm_client
+        self.cache = cache or ParseCache()
+        self.local_parser = local_parser or LocalRideParser()
+        self.fallbacks = 0
 
-    def parse_ride_request(self, request_text: str) -> dict:
+    async def parse_ride_request(self, request_text: str) -> dict:
         # Get input text from user: request_text
 
+        # Common phrasings are answered by the local rules in microseconds
+        with span("local parse"):
+            local = self.local_parser.parse_confident(request_text)
+        if local is not None:
+            return local.details()
+
         # If no OpenAI API key is provided, use simple text parsing
-        if not self.client:
-            return self._parse_with_simple_logic(request_text)
+        if not self.llm_client:
+            return self._parse_locally(request_text)
+
+        # Riders send the same few phrasings all day; only new ones reach the model
+        try:
+            with span("cached llm parse"):
+                return await self.cache.get_or_compute(request_text, self._parse_with_llm)
+        except LLMUnavailableError:
+            # Slow, failing or switched off by the breaker: answer locally
+            # instead of making the rider wait. Not cached, so the model is
+            # asked again once it recovers.
+            self.fallbacks += 1
+            return self._parse_locally(request_text)
+
+    def parse_ride_request_batch(self, request_texts: list[str]) -> AsyncIterator[dict]:
+        """Parse many texts, yielding `{"index", "source", "parsed_details" or "error"}` as each is done.
+
+        Texts the local parser is sure about and cached texts come back
+        first. The rest are de-duplicated and packed AI_LLM_BATCH_SIZE to a
+        prompt, and those calls run concurrently, so results arrive in
+        completion order rather than input order.
+        """
+        if len(request_texts) > MAX_BATCH_TEXTS:
+            raise ValueError(f"At most {MAX_BATCH_TEXTS} texts can be parsed per request")
+        return self._parse_batch(request_texts)
+
+    async def _parse_batch(self, request_texts: list[str]) -> AsyncIterator[dict]:
+        ready = []
+        # normalized text -> indexes of the texts waiting for the model
+        pending: dict[str, list[int]] = {}
+        for index, request_text in enumerate(request_texts):
+            local = self.local_parser.parse_confident(request_text)
+            if local is not None:
+                ready.append({"index": index, "source": "local", "parsed_details": local.details()})
+            elif not self.llm_client:
+                ready.append({"index": index, **self._parse_batch_item_locally(request_text, "local")})
+            elif (cached := self.cache.get(request_text)) is not None:
+                ready.append({"index": index, "source": "cache", "parsed_details": cached})
+            else:
+                pending.setdefault(normalize_request_text(request_text), []).append(index)
+
+        # Start the model calls before streaming the answers that are already known
+        texts = [request_texts[indexes[0]] for indexes in pending.values()]
+        semaphore = asyncio.Semaphore(AI_LLM_BATCH_CONCURRENCY)
+        calls = [
+            asyncio.create_task(self._parse_packed(texts[start:start + AI_LLM_BATCH_SIZE], semaphore))
+            for start in range(0, len(texts), AI_LLM_BATCH_SIZE)
+        ]
+        try:
+            for item in ready:
+                yield item
+            for call in asyncio.as_completed(calls):
+                for request_text, item in await call:
+                    # Duplicates in the batch share the first one's answer
+                    for index in pending[normalize_request_text(request_text)]:
+                        yield {"index": index, **item}
+        finally:
+            # The client went away mid-stream: stop paying for answers nobody reads
+            for call in calls:
+                call.cancel()
+
+    async def _parse_packed(self, request_texts: list[str], semaphore: asyncio.Semaphore) -> list[tuple[str, dict]]:
+        async with semaphore:
+            try:
+                answers = await self._parse_with_llm_packed(request_texts)
+            except (LLMUnavailableError, ValueError):
+                # Unavailable, or a reply that isn't the JSON asked for: answer locally
+                answers = {}
+        items = []
+        for i, request_text in enumerate(request_texts):
+            answer = answers.get(i)
+            if answer is None:
+                self.fallbacks += 1
+                items.append((request_text, self._parse_batch_item_locally(request_text, "fallback")))
+            elif answer.get("pickup_location") and answer.get("dropoff_location"):
+                details = {"pickup_location": answer["pickup_location"], "dropoff_location": answer["dropoff_location"]}
+                self.cache.put(request_text, details)
+                items.append((request_text, {"source": "llm", "parsed_details": details}))
+            else:
+                items.append((request_text, {"source": "llm", "error": "Failed to extract necessary ride request details"}))
+        return items
+
+    def _parse_batch_item_locally(self, request_text: str, source: str) -> dict:
+        item = {"source": source}
+        try:
+            item["parsed_details"] = self._parse_locally(request_text)
+        except ValueError as e:
+            item["error"] = str(e)
+        return item
+
+    def llm_stats(self) -> dict:
+        if not self.llm_client:
+            return {"enabled": False, "fallbacks": self.fallbacks}
+        return {"enabled": True, "fallbacks": self.fallbacks, **self.llm_client.stats()}
 
+    async def _parse_with_llm(self, request_text: str) -> dict:
         # Pass this text to an AI model (e.g., OpenAI GPT) to extract pickup and dropoff locations
-        response_from_llm = self.client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {
-                    "role": "user",
-                    "content": f"""You are an AI for a rideshare app. Extract ONLY:
+        content = await self.llm_client.complete(f"""You are an AI for a rideshare app. Extract ONLY:
 - pickup_location
 - dropoff_location
 
@@ -36,13 +151,9 @@ Return strictly JSON with:
 pickup_location, dropoff_location
 
 User text: "{request_text}"
-""",
-                    "response_format": {"type": "json_object"}
-                }
-            ]
-        )
+""")
 
-        parsed_json = json.loads(response_from_llm.choices[0].message.content)
+        parsed_json = json.loads(content)
 
         if not parsed_json.get("pickup_location") or not parsed_json.get("dropoff_location"):
             raise ValueError("Failed to extract necessary ride request details")
@@ -53,6 +164,42 @@ User text: "{request_text}"
             "dropoff_location": parsed_json.get("dropoff_location")
         }
 
+    async def _parse_with_llm_packed(self, request_texts: list[str]) -> dict[int, dict]:
+        # One prompt for many texts: the instructions are paid for once, and
+        # each answer carries the id of the text it belongs to
+        requests = json.dumps([{"id": i, "text": text} for i, text in enumerate(request_texts)])
+        content = await self.llm_client.complete(f"""You are an AI for a rideshare app. For EACH ride request below, extract ONLY:
+- pickup_location
+- dropoff_location
+
+Ignore any time references because the users are requesting rides NOW.
+
+If a request does not clearly contain two distinct locations,
+return an error message for that request instead of guessing.
+
+Return strictly JSON with a "results" list holding one object per request:
+{{"id": <request id>, "pickup_location": ..., "dropoff_location": ...}}
+or {{"id": <request id>, "error": ...}}
+
+Requests (JSON): {requests}
+""", timeout=AI_LLM_BATCH_TIMEOUT_SECONDS)
+
+        parsed_json = json.loads(content)
+        results = parsed_json.get("results") if isinstance(parsed_json, dict) else None
+        if not isinstance(results, list):
+            raise ValueError("LLM reply has no results list")
+        return {
+            result["id"]: result for result in results
+            if isinstance(result, dict) and isinstance(result.get("id"), int) and 0 <= result["id"] < len(request_texts)
+        }
+
+    def _parse_locally(self, request_text: str) -> dict:
+        # Without the model, a low-confidence local parse still beats the simple split
+        local = self.local_parser.parse(request_text)
+        if local is not None and local.confidence > 0:
+            return local.details()
+        return self._parse_with_simple_logic(request_text)
+
     def _parse_with_simple_logic(self, request_text: str) -> dict:
         """Simple text parsing fallback when OpenAI API is not available"""
         # Look for common patterns like "from X to Y" or "X to Y"
@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import random
+import re
+from abc import ABC, abstractmethod
+from collections.abc import Callable
+from openai import AsyncOpenAI
+from common.metrics import OutboundTimer
+from .circuit_breaker import CircuitBreaker
+
+AI_LLM_MODEL = os.getenv("AI_LLM_MODEL", "gpt-4o")
+# "openai" uses OpenAI when OPENAI_API_KEY is set; "stub" answers locally, for testing without an API key
+AI_LLM_CLIENT = os.getenv("AI_LLM_CLIENT", "openai")
+# Deadline for one LLM call, counted from when it gets a free slot
+AI_LLM_TIMEOUT_SECONDS = float(os.getenv("AI_LLM_TIMEOUT_SECONDS", "5"))
+AI_LLM_MAX_CONCURRENCY = int(os.getenv("AI_LLM_MAX_CONCURRENCY", "16"))
+# Longest wait for a free slot before the caller falls back instead
+AI_LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("AI_LLM_QUEUE_TIMEOUT_SECONDS", "1"))
+AI_STUB_LATENCY_MS = float(os.getenv("AI_STUB_LATENCY_MS", "0"))
+AI_STUB_FAILURE_RATE = float(os.getenv("AI_STUB_FAILURE_RATE", "0"))
+
+_USER_TEXT = re.compile(r'User text: "(.*)"', re.DOTALL)
+_PACKED_REQUESTS = re.compile(r"Requests \(JSON\): (\[.*\])", re.DOTALL)
+
+
+class LLMUnavailableError(Exception):
+    """The LLM did not answer in time, failed, or is switched off by the circuit breaker."""
+
+
+class LLMClient(ABC):
+    """A chat model that answers one user prompt at a time."""
+
+    @abstractmethod
+    async def complete(self, prompt: str, timeout: float | None = None) -> str:
+        """Send the prompt as a user message and return the reply text.
+
+        `timeout` is the deadline in seconds, the client's own when None.
+        """
+
+
+class OpenAIChatClient(LLMClient):
+    def __init__(self, api_key: str, model: str = AI_LLM_MODEL, timeout: float = AI_LLM_TIMEOUT_SECONDS):
+        # The guard owns retries and deadlines; the SDK must not retry behind its back
+        self.client = AsyncOpenAI(api_key=api_key, timeout=timeout, max_retries=0)
+        self.model = model
+
+    async def complete(self, prompt: str, timeout: float | None = None) -> str:
+        # None would mean no timeout at all to the SDK, so only pass a real one
+        options = {"timeout": timeout} if timeout is not None else {}
+        response = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            response_format={"type": "json_object"},
+            **options
+        )
+        return response.choices[0].message.content
+
+
+def _stub_parse(prompt: str) -> dict:
+    # Good enough to stand in for the model: "[from] X to Y" in the quoted user
+    # text, or in each of the packed requests
+    packed = _PACKED_REQUESTS.search(prompt)
+    if packed:
+        return {"results": [{"id": item["id"], **_stub_parse_text(item["text"])} for item in json.loads(packed.group(1))]}
+    match = _USER_TEXT.search(prompt)
+    return _stub_parse_text(match.group(1) if match else prompt)
+
+
+def _stub_parse_text(text: str) -> dict:
+    text = re.sub(r"^.*?\bfrom\s+", "", text, count=1, flags=re.IGNORECASE)
+    pickup, separator, dropoff = text.partition(" to ")
+    if not separator or not pickup.strip() or not dropoff.strip():
+        return {"error": "Could not find two distinct locations"}
+    return {"pickup_location": pickup.strip(" .!?").title(), "dropoff_location": dropoff.strip(" .!?").title()}
+
+
+class StubLLMClient(LLMClient):
+    """Local stand-in for the model, with injectable latency and failures and a call counter.
+
+    `item_latency_ms` is added per answer in a packed reply, since a real
+    model spends most of its time generating output.
+    """
+
+    def __init__(self, latency_ms: float = AI_STUB_LATENCY_MS, failure_rate: float = AI_STUB_FAILURE_RATE,
+                 responder: Callable[[str], dict] | None = None, item_latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.item_latency_ms = item_latency_ms
+        self.failure_rate = failure_rate
+        self.responder = responder or _stub_parse
+        self.calls = 0
+
+    async def complete(self, prompt: str, timeout: float | None = None) -> str:
+        self.calls += 1
+        response = self.responder(prompt)
+        latency_ms = self.latency_ms + self.item_latency_ms * len(response.get("results", [response]))
+        if latency_ms > 0:
+            await asyncio.sleep(latency_ms / 1000)
+        if random.random() < self.failure_rate:
+            raise RuntimeError("Stub LLM failure")
+        return json.dumps(response)
+
+
+class GuardedLLMClient(LLMClient):
+    """Wraps an LLM client with a bounded wait for a slot, a per-call deadline and a circuit breaker.
+
+    Every failure mode surfaces as LLMUnavailableError, so callers have one
+    thing to catch before falling back to a local answer.
+    """
+
+    def __init__(self, client: LLMClient, timeout: float = AI_LLM_TIMEOUT_SECONDS,
+                 max_concurrency: int = AI_LLM_MAX_CONCURRENCY, breaker: CircuitBreaker | None = None,
+                 queue_timeout: float = AI_LLM_QUEUE_TIMEOUT_SECONDS):
+        self.client = client
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self.breaker = breaker or CircuitBreaker()
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.waiting = 0
+        self.calls = 0
+        self.timeouts = 0
+        self.failures = 0
+        self.rejected = 0
+        self.busy = 0
+
+    async def complete(self, prompt: str, timeout: float | None = None) -> str:
+        """The reply, within `timeout` seconds (the client's deadline by default) of getting a slot."""
+        timeout = timeout or self.timeout
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            # Every slot is taken by calls that are slow but may well succeed:
+            # answer locally rather than queue without bound, and leave the
+            # breaker to judge the calls that do run
+            self.busy += 1
+            raise LLMUnavailableError(f"No free LLM slot within {self.queue_timeout}s")
+        finally:
+            self.waiting -= 1
+        try:
+            # Waiting for a slot is load here, not a sign the model is down, so
+            # the breaker and the deadline only cover the call itself
+            if not self.breaker.allow():
+                self.rejected += 1
+                raise LLMUnavailableError("LLM circuit is open")
+            self.calls += 1
+            self.in_flight += 1
+            with OutboundTimer("llm", "complete") as timer:
+                try:
+                    content = await asyncio.wait_for(self.client.complete(prompt, timeout), timeout)
+                except asyncio.CancelledError:
+                    timer.outcome = "cancelled"
+                    self.breaker.abandon()
+                    raise
+                except asyncio.TimeoutError:
+                    timer.outcome = "timeout"
+                    self.timeouts += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(f"LLM did not answer within {timeout}s")
+                except Exception as e:
+                    self.failures += 1
+                    self.breaker.record_failure()
+                    raise LLMUnavailableError(f"LLM call failed: {str(e)}") from e
+                finally:
+                    self.in_flight -= 1
+        finally:
+            self._semaphore.release()
+        self.breaker.record_success()
+        return content
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "timeout_seconds": self.timeout,
+            "in_flight": self.in_flight,
+            "waiting_for_slot": self.waiting,
+            "queue_timeout_seconds": self.queue_timeout,
+            "rejected_busy": self.busy,
+            "calls": self.calls,
+            "timeouts": self.timeouts,
+            "failures": self.failures,
+            "rejected_by_breaker": self.rejected,
+            "breaker": self.breaker.stats(),
+        }
+
+
+def create_llm_client() -> LLMClient | None:
+    """The configured model client, or None to parse with the local rules only."""
+    if AI_LLM_CLIENT == "stub":
+        return StubLLMClient()
+    api_key = os.getenv("OPENAI_API_KEY")
+    return OpenAIChatClient(api_key) if api_key else None
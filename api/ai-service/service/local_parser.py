@@ -0,0 +1,210 @@
+import json
+import os
+import re
+import string
+from dataclasses import dataclass
+from .parse_cache import normalize_request_text
+
+# Parses at or above this confidence are answered locally; the rest go to the LLM
+AI_LOCAL_PARSER_MIN_CONFIDENCE = float(os.getenv("AI_LOCAL_PARSER_MIN_CONFIDENCE", "0.8"))
+# Optional JSON file of extra places: {"Canonical Name": ["alias", ...]}
+AI_GAZETTEER_PATH = os.getenv("AI_GAZETTEER_PATH", "")
+
+# Places riders name in every city, with the ways they say them
+DEFAULT_PLACES = {
+    "Airport": ["airport", "the airport", "airport terminal", "departures", "arrivals"],
+    "Train Station": ["train station", "the train station", "railway station", "rail station", "station", "the station"],
+    "Bus Station": ["bus station", "the bus station", "bus terminal", "the bus terminal"],
+    "Downtown": ["downtown", "city center", "city centre", "the city center", "the city centre", "town center"],
+    "City Hall": ["city hall"],
+    "Hospital": ["hospital", "the hospital", "emergency room", "the er"],
+    "University Campus": ["campus", "the campus", "university", "the university", "uni"],
+    "Shopping Mall": ["mall", "the mall", "shopping mall", "shopping center", "shopping centre"],
+    "Stadium": ["stadium", "the stadium"],
+    "Convention Center": ["convention center", "convention centre", "the convention center"],
+    "Ferry Terminal": ["ferry terminal", "the ferry terminal", "ferry", "the ferry", "the docks"],
+}
+
+# Full confidence for phrasings that say which side is which, less for a bare "X to Y"
+_EXPLICIT = 1.0
+_BARE = 0.9
+# Each side scores as a known place, something that reads like a place, or a slot that probably
+# swallowed other words; a bare "X to Y" only passes when one side is a known place
+_KNOWN_PLACE = 1.0
+_PLAUSIBLE_PLACE = 0.85
+_SUSPICIOUS_PLACE = 0.4
+_MAX_PLACE_WORDS = 6
+_CONNECTIVE_WORDS = {"to", "from", "me", "i", "i'm", "im", "going", "heading", "headed", "take", "pick"}
+_VAGUE_PLACES = {"here", "there", "somewhere", "anywhere", "wherever", "this place", "that place"}
+
+_LEADING_FILLER = re.compile(
+    r"^(?:(?:hi|hey|hello|ok|okay|yo|please|pls|um|uh)\b[,!]?\s*)*"
+    r"(?:(?:can|could|would|will) you\s+|i(?: need| want| would like|'d like) (?:a ride|a car|a lift)?\s*,?\s*)?"
+)
+_TRAILING_FILLER = re.compile(
+    r"(?:,?\s*\b(?:please|pls|thanks|thank you|now|right now|asap|immediately|quickly|"
+    r"in \d+ (?:min|mins|minutes)|at \d{1,2}(?::\d{2})? ?(?:am|pm)?|tonight|today)\b)+$"
+)
+_ARTICLE = re.compile(r"^(?:the|a)\s+")
+
+_PICK_ME_UP = r"(?:pick me up|get me|grab me|collect me)\s+(?:at|from|in)"
+_TAKE_ME = r"(?:take|drive|bring|get|drop|ride) me(?: off)?"
+_I_AM_AT = r"(?:i'?m|i am|im)(?: currently| now| right now)?\s+(?:at|in|near|outside|by)"
+_GOING_TO = r"(?:going|heading|headed|need to go|want to go|need to get|want to get|trying to get)\s+to"
+
+# Tried in order; the first match wins
+_RULES = [
+    ("pick_me_up_then_take_me", _EXPLICIT, re.compile(
+        rf"{_PICK_ME_UP}\s+(?P<pickup>.+?),?\s+(?:and\s+|then\s+)?{_TAKE_ME}\s+(?:to|at)\s+(?P<dropoff>.+)$")),
+    ("take_me_to_from", _EXPLICIT, re.compile(
+        rf"{_TAKE_ME}\s+to\s+(?P<dropoff>.+?),?\s+from\s+(?P<pickup>.+)$")),
+    ("take_me_from_to", _EXPLICIT, re.compile(
+        rf"{_TAKE_ME}\s+from\s+(?P<pickup>.+?)\s+to\s+(?P<dropoff>.+)$")),
+    ("take_me_to_pick_me_up", _EXPLICIT, re.compile(
+        rf"{_TAKE_ME}\s+to\s+(?P<dropoff>.+?),?\s+(?:and\s+)?{_PICK_ME_UP}\s+(?P<pickup>.+)$")),
+    ("i_am_at_going_to", _EXPLICIT, re.compile(
+        rf"{_I_AM_AT}\s+(?P<pickup>.+?),?\s+(?:and\s+|but\s+)?(?:i'?m\s+|i am\s+|im\s+)?{_GOING_TO}\s+(?P<dropoff>.+)$")),
+    ("going_to_from", _EXPLICIT, re.compile(
+        rf"{_GOING_TO}\s+(?P<dropoff>.+?)\s+from\s+(?P<pickup>.+)$")),
+    ("from_to", _EXPLICIT, re.compile(
+        r"\bfrom\s+(?P<pickup>.+?)\s+to\s+(?P<dropoff>.+)$")),
+]
+_BARE_SEPARATOR = re.compile(r"\s+(?:to|->|→)\s+")
+
+
+class Gazetteer:
+    """Word trie of known place names and their aliases.
+
+    Lookups walk the trie one word at a time, so a slot is resolved in time
+    proportional to its length however many places are known, and a bare
+    "X to Y" with several "to"s can be split where both sides are places.
+    """
+
+    _END = ""
+
+    def __init__(self, places: dict[str, list[str]] | None = None):
+        self._root: dict = {}
+        self.size = 0
+        for canonical, aliases in (places or {}).items():
+            self.add(canonical, canonical)
+            for alias in aliases:
+                self.add(alias, canonical)
+
+    def add(self, alias: str, canonical: str):
+        node = self._root
+        for word in normalize_request_text(alias).split():
+            node = node.setdefault(word, {})
+        if self._END not in node:
+            self.size += 1
+        node[self._END] = canonical
+
+    def lookup(self, text: str) -> str | None:
+        """Canonical name when the whole text is a known place, with or without a leading article."""
+        for candidate in (text, _ARTICLE.sub("", text)):
+            node = self._root
+            for word in candidate.split():
+                node = node.get(word)
+                if node is None:
+                    break
+            else:
+                if self._END in node:
+                    return node[self._END]
+        return None
+
+    @classmethod
+    def from_env(cls) -> "Gazetteer":
+        places = {name: list(aliases) for name, aliases in DEFAULT_PLACES.items()}
+        if AI_GAZETTEER_PATH:
+            with open(AI_GAZETTEER_PATH) as f:
+                for name, aliases in json.load(f).items():
+                    places.setdefault(name, []).extend(aliases)
+        return cls(places)
+
+
+@dataclass
+class LocalParse:
+    pickup_location: str
+    dropoff_location: str
+    confidence: float
+    rule: str
+
+    def details(self) -> dict:
+        return {"pickup_location": self.pickup_location, "dropoff_location": self.dropoff_location}
+
+
+class LocalRideParser:
+    """Rule-based parser for the phrasings riders use most.
+
+    Tries precompiled patterns ("pick me up at X and take me to Y", "take me
+    to Y from X", "I'm at X going to Y", "from X to Y", then a bare "X to Y")
+    and resolves each side against the gazetteer. The result carries a
+    confidence so the caller can hand unclear requests to the LLM.
+    """
+
+    def __init__(self, gazetteer: Gazetteer | None = None, min_confidence: float = AI_LOCAL_PARSER_MIN_CONFIDENCE):
+        self.gazetteer = gazetteer or Gazetteer.from_env()
+        self.min_confidence = min_confidence
+        self.hits = 0
+        self.low_confidence = 0
+        self.no_match = 0
+
+    def parse(self, request_text: str) -> LocalParse | None:
+        """Best local reading of the request, or None when no rule applies."""
+        text = _TRAILING_FILLER.sub("", _LEADING_FILLER.sub("", normalize_request_text(request_text))).strip(" ,")
+        for rule, weight, pattern in _RULES:
+            match = pattern.search(text)
+            if match:
+                return self._build(rule, weight, match.group("pickup"), match.group("dropoff"))
+        return self._parse_bare(text)
+
+    def parse_confident(self, request_text: str) -> LocalParse | None:
+        """The local parse if it is good enough to skip the LLM, counting how often it is."""
+        result = self.parse(request_text)
+        if result is None:
+            self.no_match += 1
+        elif result.confidence < self.min_confidence:
+            self.low_confidence += 1
+        else:
+            self.hits += 1
+            return result
+        return None
+
+    def _parse_bare(self, text: str) -> LocalParse | None:
+        # "airport to back to the future museum": prefer the split whose sides are known places
+        best = None
+        for separator in _BARE_SEPARATOR.finditer(text):
+            candidate = self._build("bare_to", _BARE, text[:separator.start()], text[separator.end():])
+            if best is None or candidate.confidence > best.confidence:
+                best = candidate
+        return best
+
+    def _build(self, rule: str, weight: float, pickup: str, dropoff: str) -> LocalParse:
+        pickup, pickup_score = self._resolve(pickup)
+        dropoff, dropoff_score = self._resolve(dropoff)
+        confidence = weight * (pickup_score + dropoff_score) / 2
+        if pickup.lower() == dropoff.lower():
+            confidence = 0.0
+        return LocalParse(pickup, dropoff, round(confidence, 4), rule)
+
+    def _resolve(self, slot: str) -> tuple[str, float]:
+        slot = _TRAILING_FILLER.sub("", slot.strip(" ,")).strip(" ,")
+        known = self.gazetteer.lookup(slot)
+        if known is not None:
+            return known, _KNOWN_PLACE
+        words = slot.split()
+        if not words:
+            return "", 0.0
+        if len(words) > _MAX_PLACE_WORDS or _CONNECTIVE_WORDS.intersection(words) or slot in _VAGUE_PLACES:
+            return string.capwords(slot), _SUSPICIOUS_PLACE
+        return string.capwords(slot), _PLAUSIBLE_PLACE
+
+    def stats(self) -> dict:
+        parses = self.hits + self.low_confidence + self.no_match
+        return {
+            "min_confidence": self.min_confidence,
+            "gazetteer_names": self.gazetteer.size,
+            "local_hits": self.hits,
+            "low_confidence": self.low_confidence,
+            "no_match": self.no_match,
+            "local_hit_ratio": round(self.hits / parses, 4) if parses else 0.0,
+        }
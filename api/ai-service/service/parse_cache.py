@@ -0,0 +1,123 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+
+AI_PARSE_CACHE_MAX_ENTRIES = int(os.getenv("AI_PARSE_CACHE_MAX_ENTRIES", "10000"))
+AI_PARSE_CACHE_TTL_SECONDS = float(os.getenv("AI_PARSE_CACHE_TTL_SECONDS", "3600"))
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s.!?,;]+$")
+
+
+def normalize_request_text(text: str) -> str:
+    """Cache key for a ride request: case, spacing and trailing punctuation don't change its meaning."""
+    return _TRAILING_PUNCTUATION.sub("", " ".join(text.lower().split()))
+
+
+class ParseCache:
+    """Bounded LRU cache of parsed ride requests with single-flight misses.
+
+    Texts that normalize to the same key share one entry. When several
+    requests miss on the same key at once, the first starts a task that
+    computes the result and every request awaits that task, so identical
+    concurrent requests cost a single upstream call. A request that is
+    cancelled stops waiting without cancelling the task the others share.
+    Only successful parses are stored; an error is handed to the requests
+    that were waiting for it and then forgotten. Used from the event loop
+    only.
+    """
+
+    def __init__(self, max_entries: int = AI_PARSE_CACHE_MAX_ENTRIES, ttl_seconds: float = AI_PARSE_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # key -> (expires at, parsed request), least recently used first
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def _lookup(self, key: str) -> dict | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return dict(entry[1])
+            del self._entries[key]
+            self.expirations += 1
+        return None
+
+    def get(self, text: str) -> dict | None:
+        """The cached parse, for callers that compute misses themselves and `put` them back."""
+        cached = self._lookup(normalize_request_text(text))
+        if cached is None:
+            self.misses += 1
+        return cached
+
+    def put(self, text: str, result: dict):
+        self._store(normalize_request_text(text), result)
+
+    async def get_or_compute(self, text: str, compute: Callable[[str], Awaitable[dict]]) -> dict:
+        key = normalize_request_text(text)
+        cached = self._lookup(key)
+        if cached is not None:
+            return cached
+        task = self._in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._in_flight[key] = asyncio.create_task(self._compute(key, text, compute))
+            # Retrieve the outcome even if every waiter is gone by then
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            self.coalesced += 1
+        # Shielded, so a caller that is cancelled or times out (the first one
+        # included) leaves the call running for the others
+        return dict(await asyncio.shield(task))
+
+    async def _compute(self, key: str, text: str, compute: Callable[[str], Awaitable[dict]]) -> dict:
+        try:
+            result = await compute(text)
+        except BaseException:
+            self.errors += 1
+            raise
+        finally:
+            del self._in_flight[key]
+        self._store(key, result)
+        return result
+
+    def _store(self, key: str, result: dict):
+        if self.enabled:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "errors": self.errors,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "in_flight": len(self._in_flight),
+            "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            # Every hit and every request that shared another's call is an upstream call not made
+            "saved_upstream_calls": self.hits + self.coalesced,
+            "upstream_calls": self.misses,
+        }
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Texts/sec and LLM cost: POST /ai/parse_ride_request:batch vs. looping over /ai/parse_ride_request.
+
+Drives the AI service app in-process over ASGI with the stub LLM client,
+which takes --latency-ms per call plus --item-latency-ms per answer it
+writes (a real model's time goes mostly into generating output). Every
+text is distinct, so the parse cache never helps; --local-share of them use
+a phrasing the local parser answers without the model. Reports texts/sec,
+LLM calls, and prompt characters sent per text as a stand-in for input
+tokens, the part of the bill packing saves. httpx's ASGI transport
+buffers whole responses, so the batch stream is read straight from the
+endpoint's body iterator to time its first line.
+
+    python benchmarks/bench_ai_batch.py --texts 5000 --concurrency 16 --batch-sizes 10 25 50
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+ai_main = importlib.import_module("ai-service.main")
+ai_controller = importlib.import_module("ai-service.controllers.ai_controller")
+ai_service_module = importlib.import_module("ai-service.service.ai_service")
+llm_client = importlib.import_module("ai-service.service.llm_client")
+
+
+def make_texts(count: int, local_share: float) -> list[str]:
+    rng = random.Random(21)
+    return [
+        f"Take me to the airport from {i} Main Street" if rng.random() < local_share
+        else f"{i} Oak Street to Warehouse {i}"
+        for i in range(count)
+    ]
+
+
+class CountingResponder:
+    def __init__(self):
+        self.prompt_chars = 0
+
+    def __call__(self, prompt: str) -> dict:
+        self.prompt_chars += len(prompt)
+        return llm_client._stub_parse(prompt)
+
+
+def install_service(args) -> tuple:
+    responder = CountingResponder()
+    stub = llm_client.StubLLMClient(args.latency_ms, 0.0, responder, item_latency_ms=args.item_latency_ms)
+    guarded = llm_client.GuardedLLMClient(stub, timeout=600, max_concurrency=args.concurrency)
+    ai_controller.ai_service = ai_service_module.AIService(llm_client=guarded)
+    return stub, responder
+
+
+async def run_single(client, texts: list[str], args) -> int:
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def parse(text):
+        async with semaphore:
+            response = await client.post("/ai/parse_ride_request", json={"request_text": text})
+            return "parsed_details" in response.json()
+
+    return sum(await asyncio.gather(*(parse(text) for text in texts)))
+
+
+async def run_batch(texts: list[str]) -> tuple[int, float]:
+    parsed = 0
+    first = None
+    start = time.perf_counter()
+    response = await ai_controller.parse_ride_request_batch(ai_controller.ParseBatchRequest(request_texts=texts))
+    async for line in response.body_iterator:
+        first = first or time.perf_counter() - start
+        parsed += "parsed_details" in json.loads(line)
+    return parsed, first
+
+
+def report(name: str, texts: list[str], elapsed: float, parsed: int, stub, responder, extra: str = ""):
+    print(
+        f"{name:>14}: {len(texts) / elapsed:>9,.0f} texts/s | {elapsed:6.2f}s | parsed {parsed}/{len(texts)} | "
+        f"LLM calls {stub.calls:>5} | prompt chars/text {responder.prompt_chars / len(texts):7.1f}{extra}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=5000)
+    parser.add_argument("--local-share", type=float, default=0.5, help="Share of texts the local parser answers")
+    parser.add_argument("--concurrency", type=int, default=16, help="LLM calls in flight at once, in both modes")
+    parser.add_argument("--latency-ms", type=float, default=300.0, help="Stub LLM latency per call")
+    parser.add_argument("--item-latency-ms", type=float, default=20.0, help="Stub LLM latency per answer")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[10, 25, 50])
+    args = parser.parse_args()
+    texts = make_texts(args.texts, args.local_share)
+
+    transport = httpx.ASGITransport(app=ai_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai-service", timeout=None) as client:
+        stub, responder = install_service(args)
+        start = time.perf_counter()
+        parsed = await run_single(client, texts, args)
+        report("single", texts, time.perf_counter() - start, parsed, stub, responder)
+
+        for batch_size in args.batch_sizes:
+            ai_service_module.AI_LLM_BATCH_SIZE = batch_size
+            ai_service_module.AI_LLM_BATCH_CONCURRENCY = args.concurrency
+            stub, responder = install_service(args)
+            start = time.perf_counter()
+            parsed, first = await run_batch(texts)
+            report(f"batch of {batch_size}", texts, time.perf_counter() - start, parsed, stub, responder,
+                   f" | first result after {first * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
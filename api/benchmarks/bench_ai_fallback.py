@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""POST /ai/parse_ride_request latency while the LLM is healthy, slow or failing.
+
+Drives the AI service app in-process over ASGI with the stub LLM client in
+three states. Every request text is distinct, so the parse cache never
+helps. Reports latency percentiles, how many requests fell back to the
+local parser, and the circuit breaker state afterwards. With a deadline of
+--timeout seconds, p99 should stay near that deadline even when the model
+takes far longer, and drop to the local parser's cost once the breaker
+opens.
+
+    python benchmarks/bench_ai_fallback.py --requests 2000 --concurrency 100 --timeout 0.5
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+ai_main = importlib.import_module("ai-service.main")
+ai_controller = importlib.import_module("ai-service.controllers.ai_controller")
+ai_service_module = importlib.import_module("ai-service.service.ai_service")
+llm_client = importlib.import_module("ai-service.service.llm_client")
+circuit_breaker = importlib.import_module("ai-service.service.circuit_breaker")
+
+SCENARIOS = {
+    "healthy": {"latency_ms": 50, "failure_rate": 0.0},
+    "slow": {"latency_ms": 20000, "failure_rate": 0.0},
+    "failing": {"latency_ms": 50, "failure_rate": 1.0},
+}
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run(name: str, args) -> None:
+    stub = llm_client.StubLLMClient(**SCENARIOS[name])
+    guarded = llm_client.GuardedLLMClient(
+        stub, timeout=args.timeout, max_concurrency=args.llm_concurrency,
+        breaker=circuit_breaker.CircuitBreaker(reset_seconds=3600),
+    )
+    service = ai_service_module.AIService(llm_client=guarded)
+    ai_controller.ai_service = service
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def parse(i):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/ai/parse_ride_request", json={"request_text": f"{i} Main Street to Airport Terminal {i}"})
+            latencies.append((time.perf_counter() - start) * 1000)
+            return "parsed_details" in response.json()
+
+    transport = httpx.ASGITransport(app=ai_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://ai-service", timeout=None) as client:
+        start = time.perf_counter()
+        parsed = sum(await asyncio.gather(*(parse(i) for i in range(args.requests))))
+        elapsed = time.perf_counter() - start
+
+    stats = service.llm_stats()
+    print(
+        f"{name:>8}: p50 {statistics.median(latencies):8.1f} ms  p95 {percentile(latencies, 95):8.1f} ms  "
+        f"p99 {percentile(latencies, 99):8.1f} ms  max {max(latencies):8.1f} ms | {args.requests / elapsed:>7,.0f} req/s | "
+        f"parsed {parsed}/{args.requests}, LLM calls {stub.calls}, fallbacks {stats['fallbacks']}, "
+        f"breaker {stats['breaker']['state']}"
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="Client requests in flight at once")
+    parser.add_argument("--llm-concurrency", type=int, default=llm_client.AI_LLM_MAX_CONCURRENCY)
+    parser.add_argument("--timeout", type=float, default=0.5, help="Per-call LLM deadline in seconds")
+    parser.add_argument("--scenarios", nargs="+", choices=sorted(SCENARIOS), default=list(SCENARIOS))
+    args = parser.parse_args()
+    for name in args.scenarios:
+        await run(name, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
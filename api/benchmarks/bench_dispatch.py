@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""Batch dispatch solvers: latency and total pickup distance.
+
+Scatters R pending requests and D available drivers over a city, builds the
+distance matrix and solves the assignment with the Hungarian and greedy
+solvers used by BatchDispatcher. Reports how long each takes, how many
+pairs each matches, and the total pickup distance.
+
+    python benchmarks/bench_dispatch.py --sizes 50x80 200x200 500x1000
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+dispatcher = importlib.import_module("ride-service.service.dispatcher")
+
+
+def run(requests: int, drivers: int, max_pickup_km: float, seed: int):
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    cost = dispatcher.distance_matrix(
+        40.55 + rng.random(requests) * 0.35, -74.10 + rng.random(requests) * 0.35,
+        40.55 + rng.random(drivers) * 0.35, -74.10 + rng.random(drivers) * 0.35,
+    )
+    matrix_ms = (time.perf_counter() - start) * 1000
+    line = f"{requests:>5}x{drivers:<5} matrix {matrix_ms:7.2f} ms"
+    for name, solve in (("hungarian", dispatcher.solve_hungarian), ("greedy", dispatcher.solve_greedy)):
+        start = time.perf_counter()
+        pairs = solve(cost, max_pickup_km)
+        elapsed = (time.perf_counter() - start) * 1000
+        total = sum(cost[row, col] for row, col in pairs)
+        line += f" | {name} {elapsed:8.2f} ms {len(pairs):>5} pairs {total:8.1f} km"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", default=["50x80", "100x100", "200x200", "200x1000", "500x500"],
+                        help="REQUESTSxDRIVERS")
+    parser.add_argument("--max-pickup-km", type=float, default=dispatcher.DISPATCH_MAX_PICKUP_KM)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    for size in args.sizes:
+        requests, drivers = (int(part) for part in size.lower().split("x"))
+        run(requests, drivers, args.max_pickup_km, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Heartbeat throughput and nearest-driver latency of the driver location index.
+
+Places N drivers uniformly over a city-sized box, then replays random-walk
+heartbeats (most stay in their grid cell, some cross into a neighbour) on a
+single core and reports updates/sec. Finishes with k-nearest queries from
+random pickup points. The target is 100k updates/sec.
+
+    python benchmarks/bench_driver_locations.py --drivers 10000 100000
+"""
+import argparse
+import importlib
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+driver_locations = importlib.import_module("ride-service.service.driver_locations")
+
+# Roughly New York City
+LAT_MIN, LAT_MAX = 40.55, 40.90
+LON_MIN, LON_MAX = -74.10, -73.75
+
+
+def run(drivers: int, updates: int, queries: int, k: int, radius_km: float):
+    rng = random.Random(42)
+    index = driver_locations.DriverLocationIndex()
+    ids = [f"driver-{i}" for i in range(drivers)]
+    positions = [[rng.uniform(LAT_MIN, LAT_MAX), rng.uniform(LON_MIN, LON_MAX)] for _ in ids]
+    for driver_id, (lat, lon) in zip(ids, positions):
+        index.update(driver_id, lat, lon)
+
+    # Precompute the heartbeats so only index.update is timed; each step is
+    # up to ~50 m, a few seconds of driving
+    heartbeats = []
+    for i in range(updates):
+        position = positions[i % drivers]
+        position[0] += rng.uniform(-0.0005, 0.0005)
+        position[1] += rng.uniform(-0.0005, 0.0005)
+        heartbeats.append((ids[i % drivers], position[0], position[1]))
+
+    update = index.update
+    start = time.perf_counter()
+    for driver_id, lat, lon in heartbeats:
+        update(driver_id, lat, lon)
+    elapsed = time.perf_counter() - start
+
+    latencies = []
+    for _ in range(queries):
+        lat, lon = rng.uniform(LAT_MIN, LAT_MAX), rng.uniform(LON_MIN, LON_MAX)
+        query_start = time.perf_counter()
+        index.nearest(lat, lon, k, radius_km)
+        latencies.append(time.perf_counter() - query_start)
+    latencies.sort()
+
+    print(
+        f"{drivers:>8} drivers | {updates / elapsed:>10,.0f} updates/s | "
+        f"k={k} nearest p50 {statistics.median(latencies) * 1e6:7.1f} us "
+        f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:7.1f} us"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--drivers", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--updates", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=5.0)
+    args = parser.parse_args()
+    for drivers in args.drivers:
+        run(drivers, args.updates, args.queries, args.k, args.radius_km)
+
+
+if __name__ == "__main__":
+    main()
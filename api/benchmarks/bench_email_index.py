@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Login latency vs. user count for the user service's email index.
+
+Populates UserService with N users (sharing one low-cost bcrypt hash so
+setup stays fast), then times get_user_by_email and login_user for random
+existing emails. With the index both should stay flat as N grows.
+
+    python benchmarks/bench_email_index.py --sizes 1000 10000 100000 1000000
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Match the cost of the benchmark hashes so logins don't trigger a rehash
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import bcrypt
+from common.user_events import UserEventPublisher
+
+user_service_module = importlib.import_module("user-service.service.user_service")
+user_model = importlib.import_module("user-service.models.user_model")
+user_repository = importlib.import_module("user-service.repository.user_repository")
+hashing = importlib.import_module("user-service.security.hashing")
+
+
+def populate(service, count: int, hashed_password: str):
+    now = datetime.now(timezone.utc)
+    for i in range(len(service.repository.users), count):
+        service.repository.add(user_model.User.model_construct(
+            id=f"user-{i}",
+            username=f"user{i}",
+            email=f"user{i}@example.com",
+            hashed_password=hashed_password,
+            created_at=now,
+            updated_at=now,
+            dob=None,
+            role="rider",
+            is_logged_in=False,
+        ))
+
+
+def time_calls(fn, emails, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        email = random.choice(emails)
+        start = time.perf_counter()
+        fn(email)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def time_logins(service, emails, repeat: int) -> list[float]:
+    async def run():
+        samples = []
+        for _ in range(repeat):
+            email = random.choice(emails)
+            start = time.perf_counter()
+            await service.login_user(email, "password")
+            samples.append(time.perf_counter() - start)
+        return samples
+    return asyncio.run(run())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--lookups", type=int, default=20_000)
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    hashed_password = bcrypt.hashpw(b"password", bcrypt.gensalt(rounds=4)).decode("utf-8")
+    service = user_service_module.UserService(
+        event_publisher=UserEventPublisher(subscribers=[]),
+        repository=user_repository.InMemoryUserRepository(),
+    )
+
+    print(f"{'users':>10} {'lookup p50 (us)':>16} {'lookup p99 (us)':>16} {'login p50 (ms)':>15}")
+    for size in sorted(args.sizes):
+        populate(service, size, hashed_password)
+        emails = [f"user{random.randrange(size)}@example.com" for _ in range(1000)]
+        lookups = sorted(time_calls(service.get_user_by_email, emails, args.lookups))
+        logins = time_logins(service, emails, args.logins)
+        print(f"{size:>10} {statistics.median(lookups) * 1e6:>16.2f} "
+              f"{lookups[int(len(lookups) * 0.99)] * 1e6:>16.2f} "
+              f"{statistics.median(logins) * 1e3:>15.3f}")
+    hashing.shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""Local rule-based ride request parser: hit rate, latency and agreement with the LLM.
+
+Runs every text in the corpus (ride_request_corpus.jsonl next to this
+script by default) through LocalRideParser and reports:
+
+- local hit rate: requests confident enough to skip the LLM
+- per-request parse latency in microseconds, over --rounds passes
+- agreement: of the local hits, how many name the same pickup and dropoff
+  as the reference answer
+
+The reference is the corpus labels, or with --llm the answers of the
+configured LLM client (needs OPENAI_API_KEY, or AI_LLM_CLIENT=stub).
+Places are compared case-insensitively, without a leading "the", and
+through the gazetteer, so "the mall" and "Shopping Mall" agree. The old
+"from X to Y" / "X to Y" split is scored the same way for comparison.
+
+    python benchmarks/bench_local_parser.py --rounds 50
+    AI_LLM_CLIENT=stub python benchmarks/bench_local_parser.py --llm
+"""
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import statistics
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ai_service_module = importlib.import_module("ai-service.service.ai_service")
+local_parser = importlib.import_module("ai-service.service.local_parser")
+llm_client = importlib.import_module("ai-service.service.llm_client")
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ride_request_corpus.jsonl")
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def same_place(gazetteer, a: str | None, b: str | None) -> bool:
+    if not a or not b:
+        return False
+
+    def key(place: str) -> str:
+        text = " ".join(place.lower().replace(".", "").split())
+        return gazetteer.lookup(text) or text.removeprefix("the ")
+
+    return key(a) == key(b)
+
+
+async def llm_references(texts: list[str]) -> list[dict | None]:
+    client = llm_client.create_llm_client()
+    if client is None:
+        sys.exit("--llm needs OPENAI_API_KEY or AI_LLM_CLIENT=stub")
+    service = ai_service_module.AIService(llm_client=client)
+
+    async def ask(text):
+        try:
+            return await service._parse_with_llm(text)
+        except Exception:
+            return None
+
+    return await asyncio.gather(*(ask(text) for text in texts))
+
+
+def agreement(gazetteer, answers: list[dict | None], references: list[dict | None]) -> tuple[int, int, int]:
+    """(answered, agreeing with the reference, answered where the reference found no ride)"""
+    answered = agreeing = spurious = 0
+    for answer, reference in zip(answers, references):
+        if answer is None:
+            continue
+        answered += 1
+        if reference is None:
+            spurious += 1
+        elif same_place(gazetteer, answer["pickup_location"], reference["pickup_location"]) and \
+                same_place(gazetteer, answer["dropoff_location"], reference["dropoff_location"]):
+            agreeing += 1
+    return answered, agreeing, spurious
+
+
+def simple_answer(service, text: str) -> dict | None:
+    try:
+        return service._parse_with_simple_logic(text)
+    except ValueError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rounds", type=int, default=20, help="Timed passes over the corpus")
+    parser.add_argument("--llm", action="store_true", help="Compare with the configured LLM instead of the labels")
+    args = parser.parse_args()
+
+    with open(args.corpus) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    texts = [row["text"] for row in rows]
+    if args.llm:
+        references = asyncio.run(llm_references(texts))
+        source = "LLM"
+    else:
+        references = [row if row["pickup_location"] and row["dropoff_location"] else None for row in rows]
+        source = "corpus labels"
+
+    parser_ = local_parser.LocalRideParser()
+    gazetteer = parser_.gazetteer
+    latencies = []
+    for _ in range(args.rounds):
+        for text in texts:
+            start = time.perf_counter_ns()
+            parser_.parse(text)
+            latencies.append((time.perf_counter_ns() - start) / 1000)
+
+    results = [parser_.parse(text) for text in texts]
+    hits = [result.details() if result and result.confidence >= parser_.min_confidence else None for result in results]
+    answered, agreeing, spurious = agreement(gazetteer, hits, references)
+    print(f"corpus: {len(texts)} requests, reference: {source}, min confidence {parser_.min_confidence}")
+    print(
+        f"local parser: hit rate {answered / len(texts):6.1%} ({answered}), "
+        f"agreement {agreeing / answered if answered else 0:6.1%} ({agreeing}/{answered}), "
+        f"hits where the reference found no ride {spurious}"
+    )
+    print(
+        f"latency per request: mean {statistics.fmean(latencies):6.1f} µs  p50 {statistics.median(latencies):6.1f} µs  "
+        f"p99 {percentile(latencies, 99):6.1f} µs  max {max(latencies):8.1f} µs"
+    )
+    rules = {}
+    for result, hit in zip(results, hits):
+        if hit is not None:
+            rules[result.rule] = rules.get(result.rule, 0) + 1
+    print(f"hits by rule: {dict(sorted(rules.items(), key=lambda item: -item[1]))}")
+
+    service = ai_service_module.AIService(llm_client=llm_client.StubLLMClient(), local_parser=parser_)
+    simple = [simple_answer(service, text) for text in texts]
+    answered, agreeing, spurious = agreement(gazetteer, simple, references)
+    print(
+        f"old simple split: answered {answered / len(texts):6.1%} ({answered}), "
+        f"agreement {agreeing / answered if answered else 0:6.1%} ({agreeing}/{answered}), "
+        f"answers where the reference found no ride {spurious}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""Cost of the shared metrics and tracing: per-request middleware overhead and the primitives behind it.
+
+Calls a small FastAPI app straight through its ASGI interface (no sockets,
+no HTTP client) with no middleware, with a middleware that only passes the
+call on, with MetricsMiddleware and with TracingMiddleware, and reports the
+time per request for each. The difference to the pass-through middleware
+is what the metrics or tracing themselves cost; the rest is Starlette's
+price for any middleware layer. Also times a histogram observation, a
+counter increment, an OutboundTimer block, a span inside a trace, and
+rendering /metrics with --routes routes' worth of series.
+
+    python benchmarks/bench_metrics_middleware.py --requests 20000 --routes 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+
+from common import metrics, tracing
+
+
+class PassThroughMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+
+
+def make_app(middleware=None, **options) -> FastAPI:
+    app = FastAPI()
+    if middleware is not None:
+        app.add_middleware(middleware, **options)
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        return {"item_id": item_id}
+
+    return app
+
+
+async def time_requests(app, requests: int) -> float:
+    """Mean microseconds per request."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def call(i):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": f"/items/{i}", "raw_path": f"/items/{i}".encode(), "root_path": "", "query_string": b"",
+            "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        }
+        await app(scope, receive, send)
+
+    for i in range(200):
+        await call(i)
+    start = time.perf_counter()
+    for i in range(requests):
+        await call(i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def time_ns(operation, repeat: int) -> float:
+    start = time.perf_counter_ns()
+    for _ in range(repeat):
+        operation()
+    return (time.perf_counter_ns() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=7, help="Alternating rounds per app; the median is reported")
+    parser.add_argument("--routes", type=int, default=50, help="Routes with series when rendering /metrics")
+    args = parser.parse_args()
+
+    apps = {
+        "no middleware": make_app(),
+        "pass-through": make_app(PassThroughMiddleware),
+        "MetricsMiddleware": make_app(metrics.MetricsMiddleware, enabled=True),
+        "TracingMiddleware": make_app(tracing.TracingMiddleware, buffer=tracing.TraceBuffer(), enabled=True),
+    }
+    samples = {name: [] for name in apps}
+    for _ in range(args.rounds):
+        for name, app in apps.items():
+            samples[name].append(asyncio.run(time_requests(app, args.requests)))
+    per_request = {name: statistics.median(values) for name, values in samples.items()}
+    for name, value in per_request.items():
+        print(f"request, {name + ':':<19}{value:7.2f} µs")
+    for name in ("MetricsMiddleware", "TracingMiddleware"):
+        cost = per_request[name] - per_request["pass-through"]
+        print(f"{name} cost per request: {cost:6.2f} µs ({cost / per_request['no middleware']:+.1%} of a bare request)")
+
+    histogram = metrics.Histogram("bench_seconds", "Benchmark histogram.", ("method", "route"))
+    counter = metrics.Counter("bench_total", "Benchmark counter.", ("method", "route", "status"))
+    print(f"Histogram.observe:          {time_ns(lambda: histogram.observe(0.003, 'GET', '/items/{item_id}'), 200000):7.0f} ns")
+    print(f"Counter.inc:                {time_ns(lambda: counter.inc('GET', '/items/{item_id}', '200'), 200000):7.0f} ns")
+
+    def timed_block():
+        with metrics.OutboundTimer("user-service", "/users/verify:batch"):
+            pass
+
+    print(f"OutboundTimer block:        {time_ns(timed_block, 200000):7.0f} ns")
+
+    def traced_span():
+        with tracing.span("ledger transfer"):
+            pass
+
+    trace = tracing.Trace("0" * 32, None)
+    token = tracing._current_trace.set(trace)
+    tracing.TRACE_MAX_SPANS = 0  # count the span, don't keep 200000 of them
+    print(f"span in a trace:            {time_ns(traced_span, 200000):7.0f} ns")
+    tracing._current_trace.reset(token)
+
+    registry = metrics.MetricsRegistry()
+    durations = registry.register(metrics.Histogram("http_request_duration_seconds", "Latency.", ("method", "route")))
+    requests = registry.register(metrics.Counter("http_requests_total", "Requests.", ("method", "route", "status")))
+    for route in range(args.routes):
+        for method in ("GET", "POST"):
+            durations.observe(0.01, method, f"/route/{route}")
+            for status in ("200", "404", "500"):
+                requests.inc(method, f"/route/{route}", status)
+    body = registry.render()
+    start = time.perf_counter()
+    for _ in range(100):
+        registry.render()
+    print(f"render /metrics:            {(time.perf_counter() - start) * 10:7.2f} ms for {body.count(chr(10))} lines")
+
+
+if __name__ == "__main__":
+    main()
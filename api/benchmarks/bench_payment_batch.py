@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Settlement throughput: POST /payments/process one by one vs. /payments/process:batch.
+
+Drives the payment service app in-process over ASGI, so the numbers include
+routing, request/response validation and serialization but no sockets. The
+user service is replaced by a stub that costs --verify-ms per round trip,
+standing in for the HTTP call to /users/verify:batch. Riders and drivers
+are drawn from a pool of --users ids, as in an end-of-shift settlement run,
+and every payment is checked to have completed.
+
+    python benchmarks/bench_payment_batch.py --payments 5000 --batch-sizes 100 500 1000
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import sys
+import tempfile
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+payment_main = importlib.import_module("payment-service.main")
+payment_controller = importlib.import_module("payment-service.controllers.payment_controller")
+payment_service_module = importlib.import_module("payment-service.service.payment_service")
+payment_repository = importlib.import_module("payment-service.repository.payment_repository")
+
+
+class LatencyUserClient:
+    """Stands in for the user service: one simulated round trip per call, every id is logged in."""
+
+    def __init__(self, latency_ms: float):
+        self.latency = latency_ms / 1000
+        self.round_trips = 0
+
+    async def verify_users(self, user_ids: list[str], tokens: list[str] = ()) -> dict[str, dict]:
+        self.round_trips += 1
+        await asyncio.sleep(self.latency)
+        return {
+            user_id: {"exists": True, "is_logged_in": True, "role": "driver" if user_id.startswith("driver") else "rider"}
+            for user_id in user_ids
+        }
+
+
+def make_bodies(count: int, users: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    return [
+        {"ride_id": f"ride-{i}", "rider_id": f"rider-{rng.randrange(users)}",
+         "driver_id": f"driver-{rng.randrange(users)}", "amount": rng.randrange(500, 5000) / 100}
+        for i in range(count)
+    ]
+
+
+def use_service(repository, latency_ms: float) -> LatencyUserClient:
+    user_client = LatencyUserClient(latency_ms)
+    payment_controller.payment_service = payment_service_module.PaymentService(user_client=user_client, repository=repository)
+    return user_client
+
+
+async def run_single(client: httpx.AsyncClient, bodies: list[dict], concurrency: int) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def post(body):
+        async with semaphore:
+            response = await client.post("/payments/process", json=body)
+            return response.status_code == 200
+
+    return sum(await asyncio.gather(*(post(body) for body in bodies)))
+
+
+async def run_batch(client: httpx.AsyncClient, bodies: list[dict], batch_size: int) -> int:
+    completed = 0
+    for start in range(0, len(bodies), batch_size):
+        response = await client.post("/payments/process:batch", json={"payments": bodies[start:start + batch_size]})
+        completed += response.json()["completed"]
+    return completed
+
+
+async def measure(name: str, backend: str, make_repository, latency_ms: float, bodies: list[dict], run, *args) -> float:
+    user_client = use_service(make_repository(), latency_ms)
+    transport = httpx.ASGITransport(app=payment_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://payment-service") as client:
+        start = time.perf_counter()
+        completed = await run(client, bodies, *args)
+        elapsed = time.perf_counter() - start
+    rate = len(bodies) / elapsed
+    print(
+        f"{backend:>6} {name:<22} {len(bodies):>6} payments in {elapsed:6.2f}s = {rate:>8,.0f} payments/s | "
+        f"verify round trips: {user_client.round_trips:>5} | completed: {completed}"
+    )
+    if completed != len(bodies):
+        raise SystemExit(f"{name}: only {completed} of {len(bodies)} payments completed")
+    return rate
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--users", type=int, default=200, help="Distinct riders and drivers")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[100, 500, 1000])
+    parser.add_argument("--concurrency", type=int, default=1,
+                        help="Single-item requests in flight at once (a settlement job sends them one by one)")
+    parser.add_argument("--verify-ms", type=float, default=1.0, help="Simulated user service round trip")
+    args = parser.parse_args()
+
+    bodies = make_bodies(args.payments, args.users, seed=1)
+    for backend, make_repository in (
+        ("memory", payment_repository.InMemoryPaymentRepository),
+        ("sqlite", lambda: payment_repository.SQLitePaymentRepository(os.path.join(tempfile.mkdtemp(), "payments.db"))),
+    ):
+        single = await measure(f"single x{args.concurrency}", backend, make_repository, args.verify_ms, bodies,
+                               run_single, args.concurrency)
+        for batch_size in args.batch_sizes:
+            rate = await measure(f"batch of {batch_size}", backend, make_repository, args.verify_ms, bodies,
+                                 run_batch, batch_size)
+            print(f"{'':>6} {'':<22} {rate / single:.1f}x the single-item path")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""Request latency of POST /payments/process, synchronous vs. queued, behind a slow processor.
+
+Drives the payment service app in-process over ASGI with the fake payment
+processor set to --latency-ms plus up to --jitter-ms per charge and a
+--failure-rate of transient errors. The synchronous mode charges inside the
+request; the queued mode (`Prefer: respond-async`) returns 202 and leaves
+the charge to the worker pool, and the script then long-polls every
+payment until it is finished. Reports request latency percentiles and, for
+the queued mode, how long it took until every payment had completed.
+
+    python benchmarks/bench_payment_queue.py --payments 2000 --concurrency 100 --latency-ms 200 --jitter-ms 800
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import random
+import statistics
+import sys
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+payment_main = importlib.import_module("payment-service.main")
+payment_controller = importlib.import_module("payment-service.controllers.payment_controller")
+payment_service_module = importlib.import_module("payment-service.service.payment_service")
+payment_processor = importlib.import_module("payment-service.service.payment_processor")
+
+
+class LocalUserClient:
+    """Stands in for the user service: every id is a logged-in user."""
+
+    async def verify_users(self, user_ids: list[str], tokens: list[str] = ()) -> dict[str, dict]:
+        return {
+            user_id: {"exists": True, "is_logged_in": True, "role": "driver" if user_id.startswith("driver") else "rider"}
+            for user_id in user_ids
+        }
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+async def run(mode: str, args) -> None:
+    processor = payment_processor.FakePaymentProcessor(args.latency_ms, args.jitter_ms, args.failure_rate, seed=1)
+    service = payment_service_module.PaymentService(user_client=LocalUserClient(), processor=processor)
+    service.queue.workers = args.workers
+    payment_controller.payment_service = service
+    workers = asyncio.create_task(service.queue.run())
+    rng = random.Random(2)
+    bodies = [
+        {"ride_id": f"ride-{i}", "rider_id": f"rider-{rng.randrange(100)}", "driver_id": f"driver-{rng.randrange(100)}",
+         "amount": rng.randrange(500, 5000) / 100}
+        for i in range(args.payments)
+    ]
+    headers = {"Prefer": "respond-async"} if mode == "queued" else {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+
+    async def post(body):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/payments/process", json=body, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            return response
+
+    async def follow(payment_id):
+        while True:
+            response = await client.get(f"/payments/{payment_id}", params={"wait": 30})
+            status = response.json()["payment"]["status"]
+            if status not in ("pending", "processing"):
+                return status
+
+    transport = httpx.ASGITransport(app=payment_main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://payment-service", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(post(body) for body in bodies))
+        accepted = time.perf_counter() - start
+        if mode == "queued":
+            statuses = await asyncio.gather(*(follow(response.json()["payment"]["id"]) for response in responses))
+        else:
+            statuses = [response.json()["payment"]["status"] if response.status_code == 200 else "failed" for response in responses]
+        finished = time.perf_counter() - start
+    workers.cancel()
+
+    counts = {status: statuses.count(status) for status in sorted(set(statuses))}
+    line = (
+        f"{mode:>7}: p50 {statistics.median(latencies):8.1f} ms  p95 {percentile(latencies, 95):8.1f} ms  "
+        f"p99 {percentile(latencies, 99):8.1f} ms | all requests answered in {accepted:6.2f}s"
+    )
+    if mode == "queued":
+        line += f", all payments finished in {finished:6.2f}s, retries {service.queue.retries}"
+    print(f"{line} | {counts}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=100, help="Client requests in flight at once")
+    parser.add_argument("--workers", type=int, default=200, help="Queue workers for the queued mode")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=800.0)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    args = parser.parse_args()
+    for mode in ("sync", "queued"):
+        await run(mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Cost of the sampling profiler: per sample, on a busy service, and per profiled request.
+
+Times one ThreadsProfile sample with --threads extra idle threads (each
+parked a few frames deep, like thread pool workers), then calls a small
+FastAPI app straight through its ASGI interface and reports the time per
+request with no profile running, with /debug/profile's sampler running at
+10 ms and at 1 ms, and through ProfilingMiddleware with and without the
+profiling header, which starts and stops a sampler thread per request.
+
+    python benchmarks/bench_profiler.py --requests 5000 --threads 8
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import threading
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+
+from common import profiling
+
+TOKEN = "bench-token"
+
+
+def make_app(middleware: bool) -> FastAPI:
+    app = FastAPI()
+    if middleware:
+        app.add_middleware(profiling.ProfilingMiddleware, token=TOKEN, buffer=profiling.RequestProfileBuffer())
+
+    @app.get("/items/{item_id}")
+    async def get_item(item_id: str):
+        # Some Python work for the sampler to interrupt
+        return {"item_id": item_id, "total": sum(i * i for i in range(200))}
+
+    return app
+
+
+async def time_requests(app, requests: int, headers: list) -> float:
+    """Mean microseconds per request."""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def call(i):
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+            "path": f"/items/{i}", "raw_path": f"/items/{i}".encode(), "root_path": "", "query_string": b"",
+            "headers": headers, "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80),
+        }
+        await app(scope, receive, send)
+
+    for i in range(100):
+        await call(i)
+    start = time.perf_counter()
+    for i in range(requests):
+        await call(i)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def park_threads(count: int) -> threading.Event:
+    release = threading.Event()
+
+    def nested(depth: int):
+        if depth:
+            nested(depth - 1)
+        else:
+            release.wait()
+
+    for _ in range(count):
+        threading.Thread(target=nested, args=(8,), daemon=True).start()
+    return release
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=5, help="Alternating rounds per setup; the median is reported")
+    parser.add_argument("--threads", type=int, default=8, help="Idle threads besides the main one")
+    args = parser.parse_args()
+
+    release = park_threads(args.threads)
+    profile = profiling.ThreadsProfile(10)
+    start = time.perf_counter()
+    for _ in range(2000):
+        profile.sample(sys._current_frames(), -1)
+    print(f"one sample of {threading.active_count()} threads: {(time.perf_counter() - start) / 2000 * 1e6:7.1f} µs")
+
+    plain, profiled = make_app(False), make_app(True)
+    header = [(profiling.PROFILING_TOKEN_HEADER, TOKEN.encode())]
+    setups = {
+        "no profile": (plain, [], None),
+        "sampler at 10 ms": (plain, [], 10),
+        "sampler at 1 ms": (plain, [], 1),
+        "middleware, no header": (profiled, [], None),
+        "middleware, profiled": (profiled, header, None),
+    }
+    samples = {name: [] for name in setups}
+    for _ in range(args.rounds):
+        for name, (app, headers, interval_ms) in setups.items():
+            sampler = None
+            if interval_ms is not None:
+                sampler = profiling.ThreadsProfile(interval_ms)
+                sampler.start()
+            samples[name].append(asyncio.run(time_requests(app, args.requests, headers)))
+            if sampler is not None:
+                sampler.stop()
+                sampler.join()
+    release.set()
+
+    baseline = statistics.median(samples["no profile"])
+    for name, values in samples.items():
+        value = statistics.median(values)
+        print(f"request, {name + ':':<23}{value:8.1f} µs ({value / baseline - 1:+.1%})")
+
+
+if __name__ == "__main__":
+    main()
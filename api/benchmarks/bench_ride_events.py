@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Fan-out cost of the ride service's event stream with many idle subscribers.
+
+Opens N subscriber streams on one RideEventBroker (each one an asyncio task
+blocked on its queue, like an idle SSE connection), then times publishing
+an event addressed to a single rider and one broadcast to every driver.
+The targeted publish should stay flat as N grows; the broadcast grows with
+the number of drivers only.
+
+    python benchmarks/bench_ride_events.py --subscribers 1000 10000 50000
+"""
+import argparse
+import asyncio
+import importlib
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+ride_events = importlib.import_module("ride-service.service.ride_events")
+
+
+async def drain(broker, subscription):
+    async for _ in broker.stream(subscription):
+        pass
+
+
+async def run(subscribers: int, driver_share: float, iterations: int):
+    broker = ride_events.RideEventBroker()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    drivers = int(subscribers * driver_share)
+    tasks = []
+    for i in range(subscribers):
+        role = "driver" if i < drivers else "rider"
+        subscription = broker.subscribe(f"{role}-{i}", role)
+        tasks.append(asyncio.create_task(drain(broker, subscription)))
+    await asyncio.sleep(0)
+    per_subscriber = (tracemalloc.get_traced_memory()[0] - before) / subscribers
+    tracemalloc.stop()
+
+    data = {"ride_request": {"id": "r-1", "pickup_location": "a", "dropoff_location": "b"}}
+    targeted, broadcast = [], []
+    for i in range(iterations):
+        start = time.perf_counter()
+        broker.publish("ride_request.accepted", data, user_ids=[f"rider-{subscribers - 1}"])
+        targeted.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        broker.publish("ride_request.created", data, roles=["driver"])
+        broadcast.append(time.perf_counter() - start)
+        # Let the streams drain so queues don't overflow
+        await asyncio.sleep(0)
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    print(
+        f"{subscribers:>8} subs {drivers:>7} drivers | "
+        f"~{per_subscriber / 1024:5.1f} KiB/sub | "
+        f"targeted p50 {statistics.median(targeted) * 1e6:8.1f} us | "
+        f"driver broadcast p50 {statistics.median(broadcast) * 1e3:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, nargs="+", default=[1000, 10000, 50000])
+    parser.add_argument("--driver-share", type=float, default=0.2, help="Fraction of subscribers that are drivers")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+    for subscribers in args.subscribers:
+        asyncio.run(run(subscribers, args.driver_share, args.iterations))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Compare the in-memory and SQLite storage backends on the service endpoints.
+
+Drives the user, ride and payment FastAPI apps in-process (TestClient) with
+each backend and reports requests/sec and p50 latency per endpoint. Session
+tokens are used so ride and payment calls never leave the process.
+
+    python benchmarks/bench_storage_backends.py --users 200
+"""
+import argparse
+import contextlib
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("USER_EVENT_SUBSCRIBERS", "")
+
+from fastapi.testclient import TestClient
+
+user_main = importlib.import_module("user-service.main")
+ride_main = importlib.import_module("ride-service.main")
+payment_main = importlib.import_module("payment-service.main")
+user_controller = importlib.import_module("user-service.controllers.user_controller")
+ride_controller = importlib.import_module("ride-service.controllers.ride_request_controller")
+payment_controller = importlib.import_module("payment-service.controllers.payment_controller")
+user_repository = importlib.import_module("user-service.repository.user_repository")
+ride_repository = importlib.import_module("ride-service.repository.ride_repository")
+payment_repository = importlib.import_module("payment-service.repository.payment_repository")
+hashing = importlib.import_module("user-service.security.hashing")
+
+
+def use_backend(backend: str, directory: str):
+    if backend == "sqlite":
+        user_controller.user_service.repository = user_repository.SQLiteUserRepository(os.path.join(directory, "users.db"))
+        ride_controller.rideService.repository = ride_repository.SQLiteRideRepository(os.path.join(directory, "rides.db"))
+        payment_controller.payment_service.repository = payment_repository.SQLitePaymentRepository(os.path.join(directory, "payments.db"))
+    else:
+        user_controller.user_service.repository = user_repository.InMemoryUserRepository()
+        ride_controller.rideService.repository = ride_repository.InMemoryRideRepository()
+        payment_controller.payment_service.repository = payment_repository.InMemoryPaymentRepository()
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+
+    def call(self, name: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        response = fn(*args, **kwargs)
+        self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        if response.status_code != 200 or "error" in response.json():
+            raise RuntimeError(f"{name} failed: {response.status_code} {response.text}")
+        return response.json()
+
+
+def run(backend: str, users: int) -> dict[str, list[float]]:
+    recorder = Recorder()
+    with tempfile.TemporaryDirectory() as directory:
+        use_backend(backend, directory)
+        user_client, ride_client, payment_client = TestClient(user_main.app), TestClient(ride_main.app), TestClient(payment_main.app)
+        accounts = []
+        for i in range(users):
+            role = "rider" if i % 2 == 0 else "driver"
+            body = {"username": f"user{i}", "email": f"user{i}@example.com", "password": "password", "role": role}
+            user_id = recorder.call("POST /users/register", user_client.post, "/users/register", json=body)["user_details"]["id"]
+            token = recorder.call("POST /users/login", user_client.post, "/users/login", json={"email": body["email"], "password": "password"})["access_token"]
+            recorder.call("GET /users/{id}", user_client.get, f"/users/{user_id}")
+            recorder.call("GET /users/verify/{id}", user_client.get, f"/users/verify/{user_id}")
+            accounts.append((user_id, {"Authorization": f"Bearer {token}"}))
+        for (rider_id, rider_auth), (driver_id, driver_auth) in zip(accounts[::2], accounts[1::2]):
+            body = {"user_id": rider_id, "pickup_location": "A", "dropoff_location": "B"}
+            request_id = recorder.call("POST /ride-requests/create", ride_client.post, "/ride-requests/create", json=body, headers=rider_auth)["ride_request_details"]["id"]
+            ride_id = recorder.call("POST /ride-requests/accept_ride", ride_client.post, f"/ride-requests/accept_ride/{request_id}", params={"driver_id": driver_id}, headers=driver_auth)["ride_details"]["id"]
+            body = {"ride_id": ride_id, "rider_id": rider_id, "driver_id": driver_id, "amount": 12.5}
+            headers = {**rider_auth, "X-Session-Tokens": driver_auth["Authorization"].split()[1]}
+            payment_id = recorder.call("POST /payments/process", payment_client.post, "/payments/process", json=body, headers=headers)["payment"]["id"]
+            recorder.call("GET /payments/{id}", payment_client.get, f"/payments/{payment_id}")
+            recorder.call("GET /payments/history/{id}", payment_client.get, f"/payments/history/{rider_id}")
+            recorder.call("GET /payments/driver/{id}/earnings", payment_client.get, f"/payments/driver/{driver_id}/earnings", headers=driver_auth)
+    return recorder.samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=200, help="users to register (half riders, half drivers)")
+    args = parser.parse_args()
+
+    # The ride service prints on every request; keep the report readable
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        results = {backend: run(backend, args.users) for backend in ("memory", "sqlite")}
+    hashing.shutdown_hash_pool()
+
+    print(f"{'endpoint':<36} {'memory rps':>11} {'sqlite rps':>11} {'memory p50 ms':>14} {'sqlite p50 ms':>14}")
+    for endpoint in results["memory"]:
+        memory, sqlite = results["memory"][endpoint], results["sqlite"][endpoint]
+        print(f"{endpoint:<36} {len(memory) / sum(memory):>11.0f} {len(sqlite) / sum(sqlite):>11.0f} "
+              f"{statistics.median(memory) * 1e3:>14.3f} {statistics.median(sqlite) * 1e3:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,522 @@
+#!/usr/bin/env python3
+"""End-to-end load test of the ride flow against real service processes, plus hot-path microbenchmarks.
+
+Boots the user, ride, payment and AI services with uvicorn on --base-port
+to --base-port + 3 (the AI service with the stub LLM client, so parsing
+costs --llm-latency-ms when the local parser can't answer), wired to each
+other the way start.sh wires them. Then runs --flows ride flows with
+--concurrency of them in flight. A flow is:
+
+    register + login  (a new rider, --new-rider-share of flows; the rest reuse a rider)
+    POST /ai/parse_ride_request                  a text from ride_request_corpus.jsonl
+    POST /ride-requests/create                   with the parsed places
+    POST /ride-requests/accept_ride/{id}         by a random driver from the pool
+    POST /payments/process
+    GET  /payments/history/{rider_id}
+
+The --drivers pool is registered and logged in first, and the first
+--warmup flows are not counted. Reports requests/sec and p50/p95/p99 per
+endpoint and for the whole flow.
+
+Then, in this process, times UserService.get_user_by_email with
+--micro-users users, PaymentService.get_payment_history over
+--micro-payments payments (first page and the page after it), and the
+hashing path: hash_password and verify_password at the services' bcrypt
+cost, and the same through the process pool at HASH_POOL_WORKERS in flight.
+
+Everything goes to a JSON file (--output, by default a timestamped file in
+benchmarks/results/) with the configuration and git commit. Pass an earlier
+file as --baseline to flag endpoints and microbenchmarks whose p95 or
+throughput got worse by more than --tolerance; the exit status is 1 when
+any did. Service variables set in the environment (PAYMENT_PROCESSOR_*,
+SQLITE_POOL_SIZE, ...) are passed on to the services.
+
+    python benchmarks/load_test.py --flows 500 --concurrency 32
+    python benchmarks/load_test.py --backend sqlite --baseline benchmarks/results/<earlier>.json
+    python benchmarks/load_test.py --no-boot --base-port 8000 --no-micro   # services from start.sh
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Add the api directory to the path
+sys.path.insert(0, API_DIR)
+
+import httpx
+
+BENCHMARKS_DIR = os.path.join(API_DIR, "benchmarks")
+DEFAULT_CORPUS = os.path.join(BENCHMARKS_DIR, "ride_request_corpus.jsonl")
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+# Offsets from --base-port, in start.sh's order
+SERVICES = ("user-service", "ride-service", "payment-service", "ai-service")
+READY_TIMEOUT_SECONDS = 30
+# Report order
+FLOW_ENDPOINTS = (
+    "POST /users/register", "POST /users/login", "POST /ai/parse_ride_request", "POST /ride-requests/create",
+    "POST /ride-requests/accept_ride/{id}", "POST /payments/process", "GET /payments/history/{id}",
+)
+
+
+class FlowError(Exception):
+    pass
+
+
+def percentile(samples: list[float], p: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def summarize(samples: list[float], errors: int = 0, elapsed: float | None = None) -> dict:
+    """Latency percentiles in ms, plus requests/sec over `elapsed` when given."""
+    if not samples:
+        return {"count": 0, "errors": errors}
+    summary = {
+        "count": len(samples),
+        "errors": errors,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+    }
+    if elapsed:
+        summary["rps"] = round(len(samples) / elapsed, 2)
+    return summary
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=API_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def service_env(args, ports: dict[str, int], data_dir: str) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "USER_SERVICE_URL": f"http://127.0.0.1:{ports['user-service']}",
+        "USER_EVENT_SUBSCRIBERS": f"http://127.0.0.1:{ports['ride-service']},http://127.0.0.1:{ports['payment-service']}",
+        "AI_LLM_CLIENT": "stub",
+        "AI_STUB_LATENCY_MS": str(args.llm_latency_ms),
+        "STORAGE_BACKEND": args.backend,
+        "SQLITE_DIR": data_dir,
+        "BCRYPT_ROUNDS": str(args.bcrypt_rounds),
+        "PYTHONUNBUFFERED": "1",
+    })
+    return env
+
+
+def boot_services(args, ports: dict[str, int], data_dir: str) -> list[subprocess.Popen]:
+    env = service_env(args, ports, data_dir)
+    processes = []
+    for name in SERVICES:
+        # The ride service prints on every request; keep only uvicorn's warnings
+        log = open(os.path.join(data_dir, f"{name}.log"), "w")
+        processes.append(subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", f"{name}.main:app", "--host", "127.0.0.1",
+             "--port", str(ports[name]), "--log-level", "warning"],
+            cwd=API_DIR, env=env, stdout=subprocess.DEVNULL, stderr=log,
+        ))
+    return processes
+
+
+def stop_services(processes: list[subprocess.Popen]):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+async def wait_until_ready(client: httpx.AsyncClient, ports: dict[str, int], processes: list[subprocess.Popen],
+                           data_dir: str | None):
+    deadline = time.monotonic() + READY_TIMEOUT_SECONDS
+    for index, name in enumerate(SERVICES):
+        while True:
+            if processes and processes[index].poll() is not None:
+                with open(os.path.join(data_dir, f"{name}.log")) as f:
+                    sys.exit(f"{name} exited during startup:\n{f.read()[-2000:]}")
+            try:
+                if (await client.get(f"http://127.0.0.1:{ports[name]}/")).status_code == 200:
+                    break
+            except httpx.TransportError:
+                pass
+            if time.monotonic() > deadline:
+                sys.exit(f"{name} did not answer on port {ports[name]} within {READY_TIMEOUT_SECONDS}s")
+            await asyncio.sleep(0.2)
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.error_examples: dict[str, str] = {}
+        self.enabled = True
+
+    async def call(self, name: str, request) -> dict:
+        start = time.perf_counter()
+        try:
+            response = await request
+            body = response.json()
+            failed = response.status_code != 200 or "error" in body
+        except (httpx.HTTPError, ValueError) as e:
+            response, body, failed = e, None, True
+        if self.enabled:
+            self.samples.setdefault(name, []).append(time.perf_counter() - start)
+        if failed:
+            if self.enabled:
+                self.errors[name] = self.errors.get(name, 0) + 1
+            self.error_examples.setdefault(name, repr(response) if isinstance(response, Exception)
+                                           else f"{response.status_code} {response.text[:200]}")
+            raise FlowError(name)
+        return body
+
+
+class RideFlow:
+    def __init__(self, client: httpx.AsyncClient, ports: dict[str, int], texts: list[dict], args):
+        self.client = client
+        self.urls = {name: f"http://127.0.0.1:{port}" for name, port in ports.items()}
+        self.texts = texts
+        self.args = args
+        self.recorder = Recorder()
+        self.rng = random.Random(args.seed)
+        self.riders: list[tuple[str, str]] = []
+        self.drivers: list[tuple[str, str]] = []
+
+    async def account(self, role: str) -> tuple[str, str]:
+        """Register and log in a new user; returns (user id, session token)."""
+        email = f"{role}-{uuid.uuid4().hex[:12]}@example.com"
+        body = {"username": email.split("@")[0], "email": email, "password": "password", "role": role}
+        user = await self.recorder.call("POST /users/register", self.client.post(
+            f"{self.urls['user-service']}/users/register", json=body))
+        login = await self.recorder.call("POST /users/login", self.client.post(
+            f"{self.urls['user-service']}/users/login", json={"email": email, "password": "password"}))
+        return user["user_details"]["id"], login["access_token"]
+
+    async def setup(self):
+        # One at a time, so the drivers don't fill the user service's hashing queue
+        self.recorder.enabled = False
+        for _ in range(self.args.drivers):
+            try:
+                self.drivers.append(await self.account("driver"))
+            except FlowError as e:
+                sys.exit(f"could not set up the drivers: {e}: {self.recorder.error_examples[str(e)]}")
+        self.recorder.enabled = True
+
+    async def run_once(self):
+        if not self.riders or self.rng.random() < self.args.new_rider_share:
+            rider = await self.account("rider")
+            self.riders.append(rider)
+        else:
+            rider = self.rng.choice(self.riders)
+        rider_id, rider_token = rider
+        driver_id, driver_token = self.rng.choice(self.drivers)
+        row = self.rng.choice(self.texts)
+
+        parsed = await self.recorder.call("POST /ai/parse_ride_request", self.client.post(
+            f"{self.urls['ai-service']}/ai/parse_ride_request", json={"request_text": row["text"]}))
+        details = parsed["parsed_details"]
+        body = {
+            "user_id": rider_id,
+            "pickup_location": details.get("pickup_location") or "Unknown",
+            "dropoff_location": details.get("dropoff_location") or "Unknown",
+        }
+        rider_auth = {"Authorization": f"Bearer {rider_token}"}
+        request = await self.recorder.call("POST /ride-requests/create", self.client.post(
+            f"{self.urls['ride-service']}/ride-requests/create", json=body, headers=rider_auth))
+        request_id = request["ride_request_details"]["id"]
+        ride = await self.recorder.call("POST /ride-requests/accept_ride/{id}", self.client.post(
+            f"{self.urls['ride-service']}/ride-requests/accept_ride/{request_id}", params={"driver_id": driver_id},
+            headers={"Authorization": f"Bearer {driver_token}"}))
+        body = {"ride_id": ride["ride_details"]["id"], "rider_id": rider_id, "driver_id": driver_id,
+                "amount": round(self.rng.uniform(8, 60), 2)}
+        await self.recorder.call("POST /payments/process", self.client.post(
+            f"{self.urls['payment-service']}/payments/process", json=body,
+            headers={**rider_auth, "X-Session-Tokens": driver_token}))
+        await self.recorder.call("GET /payments/history/{id}", self.client.get(
+            f"{self.urls['payment-service']}/payments/history/{rider_id}"))
+
+    async def run(self, flows: int, warmup: int) -> dict:
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        flow_samples = []
+        failed_flows = 0
+
+        async def one(record: bool):
+            nonlocal failed_flows
+            async with semaphore:
+                start = time.perf_counter()
+                try:
+                    await self.run_once()
+                except FlowError:
+                    failed_flows += record
+                    return
+                if record:
+                    flow_samples.append(time.perf_counter() - start)
+
+        self.recorder.enabled = False
+        await asyncio.gather(*(one(False) for _ in range(warmup)))
+        self.recorder.enabled = True
+        start = time.perf_counter()
+        await asyncio.gather(*(one(True) for _ in range(flows)))
+        elapsed = time.perf_counter() - start
+
+        endpoints = {
+            name: summarize(self.recorder.samples[name], self.recorder.errors.get(name, 0), elapsed)
+            for name in FLOW_ENDPOINTS if name in self.recorder.samples
+        }
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "flows": {**summarize(flow_samples, failed_flows, elapsed), "failed": failed_flows},
+            "endpoints": endpoints,
+            "error_examples": self.recorder.error_examples,
+        }
+
+
+async def run_load(args) -> dict:
+    ports = {name: args.base_port + offset for offset, name in enumerate(SERVICES)}
+    with open(args.corpus) as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    # Riders who asked for a ride; the corpus also holds texts that aren't requests
+    texts = [row for row in rows if row.get("pickup_location") and row.get("dropoff_location")]
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    with tempfile.TemporaryDirectory() as data_dir:
+        processes = [] if args.no_boot else boot_services(args, ports, data_dir)
+        try:
+            async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+                await wait_until_ready(client, ports, processes, data_dir)
+                flow = RideFlow(client, ports, texts, args)
+                await flow.setup()
+                return await flow.run(args.flows, args.warmup)
+        finally:
+            stop_services(processes)
+
+
+def time_calls(fn, arguments: list, repeat: int) -> list[float]:
+    samples = []
+    for i in range(repeat):
+        argument = arguments[i % len(arguments)]
+        start = time.perf_counter()
+        fn(*argument)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def time_pool(fn, arguments: list, repeat: int, concurrency: int) -> tuple[list[float], float]:
+    """Latency per call and calls/sec with `concurrency` calls in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    samples = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await fn(*arguments[i % len(arguments)])
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(repeat)))
+    return samples, repeat / (time.perf_counter() - start)
+
+
+def with_rate(summary: dict, samples: list[float]) -> dict:
+    return {**summary, "ops_per_s": round(len(samples) / sum(samples), 2)}
+
+
+def run_microbenchmarks(args) -> dict:
+    # Hash at the cost the booted services use
+    os.environ["BCRYPT_ROUNDS"] = str(args.bcrypt_rounds)
+    os.environ.setdefault("USER_EVENT_SUBSCRIBERS", "")
+    user_service_module = importlib.import_module("user-service.service.user_service")
+    user_model = importlib.import_module("user-service.models.user_model")
+    user_repository = importlib.import_module("user-service.repository.user_repository")
+    payment_service_module = importlib.import_module("payment-service.service.payment_service")
+    payment_model = importlib.import_module("payment-service.models.payment_model")
+    payment_repository = importlib.import_module("payment-service.repository.payment_repository")
+    hashing = importlib.import_module("user-service.security.hashing")
+    rng = random.Random(args.seed)
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.backend == "sqlite":
+            users = user_repository.SQLiteUserRepository(os.path.join(directory, "users.db"))
+            payments = payment_repository.SQLitePaymentRepository(os.path.join(directory, "payments.db"))
+        else:
+            users = user_repository.InMemoryUserRepository()
+            payments = payment_repository.InMemoryPaymentRepository()
+
+        # One shared hash keeps setup fast; lookups never check it
+        hashed_password = hashing.hash_password("password", 4)
+        now = datetime.now(timezone.utc)
+        for i in range(args.micro_users):
+            users.add(user_model.User.model_construct(
+                id=f"user-{i}", username=f"user{i}", email=f"user{i}@example.com", hashed_password=hashed_password,
+                created_at=now, updated_at=now, dob=None, role="rider", is_logged_in=False,
+            ))
+        user_service = user_service_module.UserService(repository=users)
+        emails = [(f"user{rng.randrange(args.micro_users)}@example.com",) for _ in range(1000)]
+        samples = time_calls(user_service.get_user_by_email, emails, args.micro_repeat)
+        results["UserService.get_user_by_email"] = with_rate(summarize(samples), samples)
+
+        riders = max(1, args.micro_payments // 100)
+        batch = []
+        for i in range(args.micro_payments):
+            created_at = now - timedelta(minutes=args.micro_payments - i)
+            batch.append(payment_model.Payment(
+                id=f"payment-{i}", ride_id=f"ride-{i}", rider_id=f"rider-{i % riders}", driver_id=f"driver-{i % 50}",
+                amount=20.0, payment_method=payment_model.PaymentMethod.CREDIT_CARD,
+                status=payment_model.PaymentStatus.COMPLETED, transaction_id=f"txn-{i}",
+                created_at=created_at, updated_at=created_at, completed_at=created_at,
+            ))
+            if len(batch) == 1000:
+                payments.add_payments(batch)
+                batch = []
+        if batch:
+            payments.add_payments(batch)
+        payment_service = payment_service_module.PaymentService(repository=payments)
+        rider_ids = [f"rider-{rng.randrange(riders)}" for _ in range(1000)]
+        samples = time_calls(payment_service.get_payment_history, [(rider,) for rider in rider_ids], args.micro_repeat)
+        results["PaymentService.get_payment_history"] = with_rate(summarize(samples), samples)
+        cursors = [(rider, 20, payment_service.get_payment_history(rider, 20).next_cursor) for rider in rider_ids[:100]]
+        samples = time_calls(payment_service.get_payment_history, cursors, args.micro_repeat)
+        results["PaymentService.get_payment_history (next page)"] = with_rate(summarize(samples), samples)
+
+    rounds = args.bcrypt_rounds
+    hashes = [(f"password{i}", hashing.hash_password(f"password{i}", rounds)) for i in range(4)]
+    samples = time_calls(hashing.hash_password, [(password, rounds) for password, _ in hashes], args.hash_repeat)
+    results[f"hash_password (cost {rounds})"] = with_rate(summarize(samples), samples)
+    samples = time_calls(hashing.verify_password, hashes, args.hash_repeat)
+    results[f"verify_password (cost {rounds})"] = with_rate(summarize(samples), samples)
+
+    async def pooled():
+        # Start the workers before timing
+        await hashing.verify_password_async(*hashes[0])
+        workers = hashing.HASH_POOL_WORKERS
+        repeat = max(args.hash_repeat, workers * 4)
+        for name, fn, arguments in (
+            ("hash_password_async", hashing.hash_password_async, [(password,) for password, _ in hashes]),
+            ("verify_password_async", hashing.verify_password_async, hashes),
+        ):
+            samples, rate = await time_pool(fn, arguments, repeat, workers)
+            results[f"{name} (cost {rounds}, {workers} in flight)"] = {**summarize(samples), "ops_per_s": round(rate, 2)}
+
+    asyncio.run(pooled())
+    hashing.shutdown_hash_pool()
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Lines describing every p95 or throughput regression beyond `tolerance`."""
+    regressions = []
+    def load_rows(run: dict) -> dict:
+        load = run.get("load", {})
+        return {**load.get("endpoints", {}), "whole flow": load.get("flows", {})}
+
+    sections = (
+        ("load", load_rows(results), load_rows(baseline), "rps"),
+        ("micro", results.get("microbenchmarks", {}), baseline.get("microbenchmarks", {}), "ops_per_s"),
+    )
+    for kind, current, previous, rate in sections:
+        for name, stats in current.items():
+            before = previous.get(name)
+            if not before or "p95_ms" not in stats or "p95_ms" not in before:
+                continue
+            if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+                regressions.append(f"{kind} {name}: p95 {before['p95_ms']:.3f} -> {stats['p95_ms']:.3f} ms "
+                                   f"({stats['p95_ms'] / before['p95_ms'] - 1:+.0%})")
+            if rate in stats and rate in before and stats[rate] < before[rate] * (1 - tolerance):
+                regressions.append(f"{kind} {name}: {rate} {before[rate]:.1f} -> {stats[rate]:.1f} "
+                                   f"({stats[rate] / before[rate] - 1:+.0%})")
+    return regressions
+
+
+def print_table(title: str, rows: dict, rate: str):
+    print(f"\n{title:<52} {'count':>7} {'errors':>6} {rate:>10} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in rows.items():
+        if not stats.get("count"):
+            print(f"{name:<52} {0:>7} {stats.get('errors', 0):>6}")
+            continue
+        print(f"{name:<52} {stats['count']:>7} {stats['errors']:>6} {stats.get(rate, 0):>10,.1f} "
+              f"{stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} {stats['p99_ms']:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", type=int, default=300, help="Measured ride flows")
+    parser.add_argument("--warmup", type=int, default=20, help="Flows run before measuring")
+    parser.add_argument("--concurrency", type=int, default=16, help="Flows in flight at once")
+    parser.add_argument("--drivers", type=int, default=20, help="Drivers registered before the flows start")
+    parser.add_argument("--new-rider-share", type=float, default=0.2, help="Share of flows that register a new rider")
+    parser.add_argument("--backend", choices=("memory", "sqlite"), default="memory")
+    parser.add_argument("--bcrypt-rounds", type=int, default=int(os.getenv("BCRYPT_ROUNDS", "12")),
+                        help="bcrypt cost for the services and the hashing microbenchmarks")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0, help="Stub LLM latency per call")
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS, help="Ride request texts to parse")
+    parser.add_argument("--base-port", type=int, default=18000, help="User service port; the others follow")
+    parser.add_argument("--no-boot", action="store_true", help="Use services already running on the ports")
+    parser.add_argument("--no-load", action="store_true", help="Only run the microbenchmarks")
+    parser.add_argument("--no-micro", action="store_true", help="Skip the microbenchmarks")
+    parser.add_argument("--micro-users", type=int, default=100000)
+    parser.add_argument("--micro-payments", type=int, default=50000)
+    parser.add_argument("--micro-repeat", type=int, default=20000, help="Calls per lookup microbenchmark")
+    parser.add_argument("--hash-repeat", type=int, default=20, help="Calls per hashing microbenchmark")
+    parser.add_argument("--seed", type=int, default=24)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/load_test-<time>.json)")
+    parser.add_argument("--baseline", help="Earlier results file to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 or throughput change vs. the baseline")
+    args = parser.parse_args()
+
+    started_at = datetime.now(timezone.utc)
+    results = {
+        "started_at": started_at.isoformat(),
+        "git_commit": git_commit(),
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+        "config": vars(args),
+    }
+    if not args.no_load:
+        results["load"] = asyncio.run(run_load(args))
+        load = results["load"]
+        print(f"{load['flows'].get('count', 0)} of {args.flows} flows completed in {load['elapsed_s']:.2f}s "
+              f"at concurrency {args.concurrency} "
+              f"({args.backend} backend, bcrypt cost {args.bcrypt_rounds}, stub LLM {args.llm_latency_ms:g} ms)")
+        print_table("endpoint", {**load["endpoints"], "whole flow": load["flows"]}, "rps")
+        for name, example in load["error_examples"].items():
+            print(f"first error from {name}: {example}")
+    if not args.no_micro:
+        # The ride and payment modules print on some paths; keep the report readable
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            results["microbenchmarks"] = run_microbenchmarks(args)
+        print_table("microbenchmark", results["microbenchmarks"], "ops_per_s")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load_test-{started_at:%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nresults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        print(f"compared with {args.baseline} (commit {baseline.get('git_commit')}), tolerance {args.tolerance:.0%}:")
+        for line in regressions or ["no regressions"]:
+            print(f"  {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Concurrent accepts of the same ride requests must produce exactly one winner.
+
+Creates R open ride requests and has D drivers try to accept every one of
+them at once, from several threads, each running many accepts concurrently
+on its own event loop. Driver verification yields to the loop like the
+real HTTP/token check would, so every attempt passes validation before
+any of them changes state. Checks that each request ends up with exactly
+one successful accept and one ride, and that every loser was turned away
+with a 400 or 409.
+Runs against both storage backends and exits non-zero on any violation.
+
+    python benchmarks/stress_accept_race.py --requests 500 --drivers 20 --threads 8
+"""
+import argparse
+import asyncio
+import contextlib
+import importlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import HTTPException
+
+ride_service_module = importlib.import_module("ride-service.service.ride_service")
+ride_model = importlib.import_module("ride-service.models.ride_model")
+ride_repository = importlib.import_module("ride-service.repository.ride_repository")
+
+
+class LocalUserClient:
+    """Stands in for the user service: every id is a logged-in user."""
+
+    async def verify_user(self, user_id: str, token: str | None = None) -> dict:
+        await asyncio.sleep(0)
+        return {"exists": True, "is_logged_in": True, "role": "driver" if user_id.startswith("driver") else "rider"}
+
+
+async def attempt_all(service, attempts):
+    async def attempt(ride_request_id, driver_id):
+        try:
+            await service.accept_ride_request(ride_request_id, driver_id)
+            return ride_request_id, "won"
+        except HTTPException as e:
+            return ride_request_id, e.status_code
+
+    return await asyncio.gather(*(attempt(ride_request_id, driver_id) for ride_request_id, driver_id in attempts))
+
+
+def count_rides(repository, ride_request_ids) -> dict[str, int]:
+    counts = dict.fromkeys(ride_request_ids, 0)
+    if isinstance(repository, ride_repository.InMemoryRideRepository):
+        rides = list(repository.rides.values())
+        for ride in rides:
+            counts[ride.ride_request_id] += 1
+    else:
+        with repository.pool.connection() as conn:
+            for row in conn.execute("SELECT ride_request_id, COUNT(*) FROM rides GROUP BY ride_request_id"):
+                counts[row[0]] = row[1]
+    return counts
+
+
+def run(name, repository, requests: int, drivers: int, threads: int) -> bool:
+    service = ride_service_module.RideService(user_client=LocalUserClient(), repository=repository)
+
+    async def create():
+        return [
+            (await service.create_ride_request(ride_model.RideRequestCreate(
+                user_id=f"rider-{i}", pickup_location="A", dropoff_location="B"
+            ))).id
+            for i in range(requests)
+        ]
+
+    # The service logs every request it creates; keep the output to the summary
+    with contextlib.redirect_stdout(io.StringIO()):
+        ride_request_ids = asyncio.run(create())
+        attempts = [(ride_request_id, f"driver-{d}") for ride_request_id in ride_request_ids for d in range(drivers)]
+        random.Random(1).shuffle(attempts)
+        chunks = [attempts[i::threads] for i in range(threads)]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            results = [result for chunk in pool.map(lambda chunk: asyncio.run(attempt_all(service, chunk)), chunks) for result in chunk]
+        elapsed = time.perf_counter() - start
+
+    wins = dict.fromkeys(ride_request_ids, 0)
+    unexpected = []
+    for ride_request_id, outcome in results:
+        if outcome == "won":
+            wins[ride_request_id] += 1
+        elif outcome not in (400, 409):
+            unexpected.append(outcome)
+    rides = count_rides(repository, ride_request_ids)
+    bad_wins = sum(1 for count in wins.values() if count != 1)
+    bad_rides = sum(1 for count in rides.values() if count != 1)
+    ok = not bad_wins and not bad_rides and not unexpected
+    print(
+        f"{name:>6}: {len(attempts):>6} accepts in {elapsed:6.2f}s = {len(attempts) / elapsed:>8,.0f} accepts/s | "
+        f"requests with != 1 winner: {bad_wins} | with != 1 ride: {bad_rides} | "
+        f"unexpected errors: {len(unexpected)} | {'OK' if ok else 'FAILED'}"
+    )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--drivers", type=int, default=20, help="Concurrent accepts per request")
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    backends = [
+        ("memory", ride_repository.InMemoryRideRepository()),
+        ("sqlite", ride_repository.SQLiteRideRepository(os.path.join(tempfile.mkdtemp(), "rides.db"))),
+    ]
+    ok = True
+    for name, repository in backends:
+        ok = run(name, repository, args.requests, args.drivers, args.threads) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Concurrent payments must not lose balance updates or double-charge retries.
+
+Ledger: P payments between a handful of riders and drivers, so every
+account is contended, processed from several threads, each running many
+payments concurrently on its own event loop. Checks that every balance
+equals the sum of the amounts charged or paid to it, that the ledger holds
+exactly two entries per payment, and that replaying it reproduces the
+stored balances.
+
+Retries: K payments, each sent R times at once with the same
+Idempotency-Key, as a client retrying after timeouts would. Checks that
+each key produced exactly one payment and one debit.
+
+Runs against both storage backends and exits non-zero on any violation.
+
+    python benchmarks/stress_payment_ledger.py --payments 20000 --threads 8 --keys 2000 --retries 5
+"""
+import argparse
+import asyncio
+import importlib
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+payment_service_module = importlib.import_module("payment-service.service.payment_service")
+payment_model = importlib.import_module("payment-service.models.payment_model")
+payment_repository = importlib.import_module("payment-service.repository.payment_repository")
+
+RIDERS = 4
+DRIVERS = 4
+
+
+class LocalUserClient:
+    """Stands in for the user service: every id is a logged-in user."""
+
+    async def verify_users(self, user_ids: list[str], tokens: list[str] = ()) -> dict[str, dict]:
+        await asyncio.sleep(0)
+        return {
+            user_id: {"exists": True, "is_logged_in": True, "role": "driver" if user_id.startswith("driver") else "rider"}
+            for user_id in user_ids
+        }
+
+
+def make_payments(count: int, seed: int) -> list:
+    rng = random.Random(seed)
+    return [
+        payment_model.PaymentCreate(
+            ride_id=f"ride-{i}", rider_id=f"rider-{rng.randrange(RIDERS)}",
+            driver_id=f"driver-{rng.randrange(DRIVERS)}", amount=rng.randrange(100, 5000) / 100,
+        )
+        for i in range(count)
+    ]
+
+
+def expected_balances(payments) -> dict[tuple[str, str], float]:
+    balances = {}
+    for payment in payments:
+        balances[("rider", payment.rider_id)] = balances.get(("rider", payment.rider_id), 0.0) - payment.amount
+        balances[("driver", payment.driver_id)] = balances.get(("driver", payment.driver_id), 0.0) + payment.amount
+    return balances
+
+
+def count_mismatches(expected: dict, actual: dict) -> int:
+    return sum(
+        1 for key in expected.keys() | actual.keys()
+        if not math.isclose(expected.get(key, 0.0), actual.get(key, 0.0), abs_tol=1e-6)
+    )
+
+
+def run_ledger(name, repository, payments: int, threads: int) -> bool:
+    service = payment_service_module.PaymentService(user_client=LocalUserClient(), repository=repository)
+    creates = make_payments(payments, seed=1)
+    chunks = [creates[i::threads] for i in range(threads)]
+
+    async def process_all(chunk):
+        await asyncio.gather(*(service.process_payment(payment_create) for payment_create in chunk))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda chunk: asyncio.run(process_all(chunk)), chunks))
+    elapsed = time.perf_counter() - start
+
+    lost = count_mismatches(expected_balances(creates), repository.list_balances())
+    entries = sum(1 for _ in repository.ledger_entries())
+    check = service.check_ledger()
+    ok = not lost and entries == 2 * payments and check["consistent"]
+    print(
+        f"{name:>6} ledger : {payments:>6} payments in {elapsed:6.2f}s = {payments / elapsed:>8,.0f} payments/s | "
+        f"balances off: {lost} | ledger entries: {entries} (want {2 * payments}) | "
+        f"replay mismatches: {len(check['mismatches'])} | {'OK' if ok else 'FAILED'}"
+    )
+    return ok
+
+
+def run_retries(name, repository, keys: int, retries: int) -> bool:
+    service = payment_service_module.PaymentService(user_client=LocalUserClient(), repository=repository)
+    creates = make_payments(keys, seed=2)
+    attempts = [(f"key-{i}", payment_create) for i, payment_create in enumerate(creates) for _ in range(retries)]
+    random.Random(3).shuffle(attempts)
+
+    async def attempt_all():
+        return await asyncio.gather(*(
+            service.process_payment_once(payment_create, key) for key, payment_create in attempts
+        ))
+
+    start = time.perf_counter()
+    results = asyncio.run(attempt_all())
+    elapsed = time.perf_counter() - start
+
+    payment_ids: dict[str, set[str]] = {}
+    for (key, _), (payment, _) in zip(attempts, results):
+        payment_ids.setdefault(key, set()).add(payment.id)
+    bad_keys = sum(1 for ids in payment_ids.values() if len(ids) != 1)
+    overcharged = count_mismatches(expected_balances(creates), repository.list_balances())
+    replays = sum(1 for _, replayed in results if replayed)
+    ok = not bad_keys and not overcharged and replays == keys * (retries - 1)
+    print(
+        f"{name:>6} retries: {len(attempts):>6} requests in {elapsed:6.2f}s = {len(attempts) / elapsed:>8,.0f} requests/s | "
+        f"keys with != 1 payment: {bad_keys} | balances off: {overcharged} | "
+        f"replayed: {replays} (want {keys * (retries - 1)}) | {'OK' if ok else 'FAILED'}"
+    )
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=20000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--keys", type=int, default=2000)
+    parser.add_argument("--retries", type=int, default=5, help="Concurrent sends of each idempotent request")
+    args = parser.parse_args()
+
+    ok = True
+    for name, make_repository in (
+        ("memory", payment_repository.InMemoryPaymentRepository),
+        ("sqlite", lambda: payment_repository.SQLitePaymentRepository(os.path.join(tempfile.mkdtemp(), "payments.db"))),
+    ):
+        ok = run_ledger(name, make_repository(), args.payments, args.threads) and ok
+        ok = run_retries(name, make_repository(), args.keys, args.retries) and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
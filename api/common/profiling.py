@@ -0,0 +1,281 @@
+import asyncio
+import hmac
+import os
+import secrets
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from functools import lru_cache
+
+from fastapi import APIRouter, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+
+# Shared secret for /debug/profile and per-request profiling; both are off while it is empty
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+# Milliseconds between stack samples for /debug/profile
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+# Milliseconds between stack samples of a single profiled request
+PROFILE_REQUEST_INTERVAL_MS = float(os.getenv("PROFILE_REQUEST_INTERVAL_MS", "1"))
+# Longest profile /debug/profile will take
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+# Finished request profiles kept for /debug/profile/requests
+PROFILE_REQUEST_BUFFER_SIZE = int(os.getenv("PROFILE_REQUEST_BUFFER_SIZE", "50"))
+
+PROFILING_TOKEN_HEADER = b"x-profiling-token"
+PROFILE_ID_HEADER = b"x-profile-id"
+# Samples taken while a profiled request's task was not the one running
+AWAITING = "(awaiting)"
+
+
+@lru_cache(maxsize=8192)
+def _frame_name(code) -> str:
+    # The function's first line rather than the current one, so samples
+    # anywhere in a function add up to one frame
+    path = code.co_filename.replace("\\", "/").split("/")
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({'/'.join(path[-2:])}:{code.co_firstlineno})"
+
+
+def collapse(frame, root: str | None = None) -> str:
+    """A stack as `root;outermost;...;innermost`, the collapsed format flame graph tools read."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    if root is not None:
+        names.append(root)
+    return ";".join(reversed(names))
+
+
+class StackProfile(ABC):
+    """Counts of collapsed stacks, sampled by a background thread every `interval_ms`.
+
+    Pure Python: the thread reads every thread's current frame with
+    sys._current_frames() and walks it, so the sampled threads only pay for
+    the GIL hand-offs. Samples land at most once per interpreter switch
+    interval (5 ms by default) while another thread runs Python code.
+    """
+
+    def __init__(self, interval_ms: float):
+        self.id = secrets.token_hex(8)
+        self.name = "profile"
+        self.interval_ms = interval_ms
+        self.stacks: dict[str, int] = {}
+        self.samples = 0
+        self.started_at = time.time()
+        self.duration_s = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Tell the sampler thread to finish; `join` waits until it has."""
+        self._stop.set()
+
+    def join(self):
+        self._thread.join()
+
+    async def finish(self):
+        """Stop sampling and wait for the thread without blocking the event loop."""
+        self.stop()
+        await asyncio.to_thread(self.join)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        start = time.perf_counter()
+        interval = self.interval_ms / 1000
+        while not self._stop.wait(interval):
+            self.sample(sys._current_frames(), own_id)
+            self.samples += 1
+        self.duration_s = time.perf_counter() - start
+
+    @abstractmethod
+    def sample(self, frames: dict, own_id: int):
+        """Record one sample from every thread's current frame, skipping the sampler's own."""
+
+    def add(self, stack: str):
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def collapsed(self) -> str:
+        lines = [f"{stack} {count}" for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])]
+        return "\n".join(lines) + "\n"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "name": self.name,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_s * 1000, 3),
+            "interval_ms": self.interval_ms,
+            "samples": self.samples,
+            "stacks": [{"stack": stack, "count": count}
+                       for stack, count in sorted(self.stacks.items(), key=lambda item: -item[1])],
+        }
+
+
+class ThreadsProfile(StackProfile):
+    """Every thread's stack on each sample, under the thread's name."""
+
+    def sample(self, frames: dict, own_id: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in frames.items():
+            if thread_id != own_id:
+                self.add(collapse(frame, names.get(thread_id, f"thread-{thread_id}")))
+
+
+class RequestProfile(StackProfile):
+    """The event loop thread's stack whenever one request's task is the one running.
+
+    Other samples count as "(awaiting)": the request was waiting on I/O,
+    another request, or work handed to a thread or process pool.
+    """
+
+    def __init__(self, interval_ms: float, loop: asyncio.AbstractEventLoop, task: asyncio.Task):
+        super().__init__(interval_ms)
+        self.loop = loop
+        self.task = task
+        self.thread_id = threading.get_ident()
+        self.status = None
+
+    def sample(self, frames: dict, own_id: int):
+        frame = frames.get(self.thread_id)
+        if frame is not None and asyncio.current_task(self.loop) is self.task:
+            self.add(collapse(frame))
+        else:
+            self.add(AWAITING)
+
+    def to_dict(self) -> dict:
+        return {**super().to_dict(), "status": self.status}
+
+
+class RequestProfileBuffer:
+    """The most recent finished request profiles."""
+
+    def __init__(self, size: int = PROFILE_REQUEST_BUFFER_SIZE):
+        self.profiles: deque[RequestProfile] = deque(maxlen=size)
+
+    def record(self, profile: RequestProfile):
+        self.profiles.append(profile)
+
+    def find(self, profile_id: str) -> RequestProfile | None:
+        return next((profile for profile in self.profiles if profile.id == profile_id), None)
+
+
+REQUEST_PROFILES = RequestProfileBuffer()
+
+
+def _token_matches(supplied: str | None, token: str) -> bool:
+    return bool(token) and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+
+class ProfilingMiddleware:
+    """ASGI middleware that profiles a request sent with the right `X-Profiling-Token`.
+
+    The response carries `X-Profile-Id`; the profile is then served at
+    `/debug/profile/requests/{id}`. Requests without the header, or with a
+    wrong token, pass straight through.
+    """
+
+    def __init__(self, app, token: str = PROFILING_TOKEN, buffer: RequestProfileBuffer = REQUEST_PROFILES,
+                 interval_ms: float = PROFILE_REQUEST_INTERVAL_MS):
+        self.app = app
+        self.token = token
+        self.buffer = buffer
+        self.interval_ms = interval_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.token or scope["path"].startswith("/debug/profile"):
+            await self.app(scope, receive, send)
+            return
+        supplied = None
+        for name, value in scope["headers"]:
+            if name == PROFILING_TOKEN_HEADER:
+                supplied = value.decode("latin-1")
+                break
+        if not _token_matches(supplied, self.token):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(self.interval_ms, asyncio.get_running_loop(), asyncio.current_task())
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = [*message.get("headers", []), (PROFILE_ID_HEADER, profile.id.encode())]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            await profile.finish()
+            route = scope.get("route")
+            profile.name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+            profile.status = profile.status or 500
+            self.buffer.record(profile)
+
+
+def _profile_response(profile: StackProfile, format: str):
+    if format == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return profile.to_dict()
+
+
+def create_debug_profile_router(token: str = PROFILING_TOKEN, buffer: RequestProfileBuffer = REQUEST_PROFILES) -> APIRouter:
+    router = APIRouter(prefix="/debug/profile", tags=["debug"])
+    running = False
+
+    def check_token(supplied: str | None):
+        if not token:
+            raise HTTPException(status_code=404, detail="Profiling is disabled; set PROFILING_TOKEN to enable it")
+        if not _token_matches(supplied, token):
+            raise HTTPException(status_code=403, detail="Invalid profiling token")
+
+    @router.get("")
+    async def profile_threads(
+        seconds: float = Query(default=10, gt=0, le=PROFILE_MAX_SECONDS),
+        interval_ms: float = Query(default=PROFILE_INTERVAL_MS, ge=1, le=1000),
+        format: str = Query(default="collapsed", pattern="^(collapsed|json)$"),
+        x_profiling_token: str | None = Header(default=None),
+    ):
+        # Samples every thread for `seconds` while the service keeps serving.
+        # The collapsed output feeds flamegraph.pl, speedscope or inferno as is.
+        nonlocal running
+        check_token(x_profiling_token)
+        if running:
+            raise HTTPException(status_code=409, detail="A profile is already running")
+        running = True
+        profile = ThreadsProfile(interval_ms)
+        profile.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            running = False
+            await profile.finish()
+        return _profile_response(profile, format)
+
+    @router.get("/requests")
+    async def list_request_profiles(x_profiling_token: str | None = Header(default=None)):
+        check_token(x_profiling_token)
+        return {"profiles": [
+            {key: value for key, value in profile.to_dict().items() if key != "stacks"}
+            for profile in reversed(buffer.profiles)
+        ]}
+
+    @router.get("/requests/{profile_id}")
+    async def get_request_profile(
+        profile_id: str,
+        format: str = Query(default="collapsed", pattern="^(collapsed|json)$"),
+        x_profiling_token: str | None = Header(default=None),
+    ):
+        check_token(x_profiling_token)
+        profile = buffer.find(profile_id)
+        if profile is None:
+            raise HTTPException(status_code=404, detail="Profile not found")
+        return _profile_response(profile, format)
+
+    return router
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import time
+
+SESSION_TOKEN_SECRET = os.getenv("SESSION_TOKEN_SECRET", "dev-session-secret-change-me")
+SESSION_TOKEN_TTL_SECONDS = int(os.getenv("SESSION_TOKEN_TTL_SECONDS", "900"))
+# Lifetime of a stream ticket; it only has to last until the stream connects
+STREAM_TICKET_TTL_SECONDS = int(os.getenv("STREAM_TICKET_TTL_SECONDS", "30"))
+
+_HEADER = base64.urlsafe_b64encode(b'{"alg":"HS256","typ":"JWT"}').rstrip(b"=")
+
+
+class InvalidSessionToken(Exception):
+    pass
+
+
+class ExpiredSessionToken(InvalidSessionToken):
+    pass
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+def _sign(signing_input: bytes, secret: str) -> bytes:
+    return _b64encode(hmac.new(secret.encode("utf-8"), signing_input, hashlib.sha256).digest())
+
+
+def issue_token(user_id: str, role: str, secret: str = SESSION_TOKEN_SECRET, ttl_seconds: int = SESSION_TOKEN_TTL_SECONDS,
+                scope: str | None = None) -> str:
+    """Return an HS256 JWT carrying the user id and role.
+
+    A token with a `scope` is a ticket for that one endpoint and is not
+    accepted as a session token, nor a session token in its place.
+    """
+    now = time.time()
+    claims = {"sub": user_id, "role": role, "iat": now, "exp": now + ttl_seconds}
+    if scope is not None:
+        claims["scope"] = scope
+    signing_input = _HEADER + b"." + _b64encode(json.dumps(claims, separators=(",", ":")).encode("utf-8"))
+    return (signing_input + b"." + _sign(signing_input, secret)).decode("ascii")
+
+
+def decode_token(token: str, secret: str = SESSION_TOKEN_SECRET, scope: str | None = None) -> dict:
+    """Check the signature, expiry and scope of a token and return its claims."""
+    try:
+        signing_input, signature = token.encode("ascii").rsplit(b".", 1)
+        header, payload = signing_input.split(b".")
+    except (UnicodeEncodeError, ValueError):
+        raise InvalidSessionToken("Malformed session token")
+    if header != _HEADER or not hmac.compare_digest(signature, _sign(signing_input, secret)):
+        raise InvalidSessionToken("Invalid session token signature")
+    try:
+        claims = json.loads(_b64decode(payload))
+    except ValueError:
+        raise InvalidSessionToken("Malformed session token")
+    if claims.get("scope") != scope:
+        raise InvalidSessionToken("Token is not valid for this endpoint")
+    if claims.get("exp", 0) <= time.time():
+        raise ExpiredSessionToken("Session token has expired")
+    return claims
+
+
+def bearer_token(authorization: str | None) -> str | None:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+class RevocationList:
+    """Users whose tokens issued at or before a point in time are revoked.
+
+    Only one timestamp is kept per user and entries are dropped once every
+    token they could apply to has expired, so the list stays small enough
+    to ship between services in full.
+    """
+
+    def __init__(self, ttl_seconds: int = SESSION_TOKEN_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._revoked_at: dict[str, float] = {}
+
+    def revoke(self, user_id: str, revoked_at: float | None = None):
+        revoked_at = revoked_at if revoked_at is not None else time.time()
+        if revoked_at > self._revoked_at.get(user_id, 0.0):
+            self._revoked_at[user_id] = revoked_at
+
+    def merge(self, revocations: dict[str, float]):
+        for user_id, revoked_at in revocations.items():
+            self.revoke(user_id, revoked_at)
+
+    def is_revoked(self, claims: dict) -> bool:
+        return claims.get("iat", 0.0) <= self._revoked_at.get(claims.get("sub"), -1.0)
+
+    def prune(self):
+        cutoff = time.time() - self.ttl_seconds
+        for user_id in [user_id for user_id, at in self._revoked_at.items() if at < cutoff]:
+            del self._revoked_at[user_id]
+
+    def snapshot(self, since: float = 0.0) -> dict[str, float]:
+        self.prune()
+        return {user_id: at for user_id, at in self._revoked_at.items() if at > since}
+
+    def __len__(self):
+        return len(self._revoked_at)
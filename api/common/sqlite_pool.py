@@ -0,0 +1,110 @@
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+# "memory" keeps state in process dicts; "sqlite" persists it and can be shared by several workers
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "memory")
+SQLITE_DIR = os.getenv("SQLITE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data"))
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+
+async def run_blocking(repository, fn, *args, **kwargs):
+    """Call `fn` from async code without stalling the event loop on storage.
+
+    `fn` is a repository method, or service code that only touches the
+    repository. With a blocking repository (SQLite, which can wait for a
+    pooled connection or up to busy_timeout for the write lock) it runs on
+    a worker thread; in-memory repositories are called inline.
+    """
+    if repository.blocking:
+        return await run_in_threadpool(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+def sqlite_path(filename: str) -> str:
+    os.makedirs(SQLITE_DIR, exist_ok=True)
+    return os.path.join(SQLITE_DIR, filename)
+
+
+class SQLitePool:
+    """Small per-process pool of SQLite connections in WAL mode.
+
+    WAL lets readers in every worker proceed while one writer commits, so
+    several uvicorn workers can share the same database file. Connections
+    are created lazily and re-created after a fork. Each connection keeps
+    its own compiled-statement cache, so the repositories use fixed SQL
+    strings with `?` parameters and every query is prepared only once.
+    """
+
+    def __init__(self, path: str, schema: str, size: int = SQLITE_POOL_SIZE):
+        self.path = path
+        self.schema = schema
+        self.size = size
+        self._pid = None
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        with self.connection() as conn:
+            conn.executescript(schema)
+
+    def ensure_columns(self, table: str, columns: dict[str, str]):
+        """Add columns introduced after a database file was first created."""
+        with self.connection() as conn:
+            existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+            for name, definition in columns.items():
+                if name not in existing:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=SQLITE_BUSY_TIMEOUT_MS / 1000,
+            isolation_level=None,  # transactions are opened explicitly
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._pid != os.getpid():
+                # Connections must not cross a fork; start a fresh pool in this worker
+                self._pid = os.getpid()
+                self._idle = queue.LifoQueue()
+                self._created = 0
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                if self._created < self.size:
+                    self._created += 1
+                    return self._connect()
+        return self._idle.get()
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Run a write transaction; BEGIN IMMEDIATE takes the write lock up front."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
@@ -0,0 +1,251 @@
+import os
+import random
+import re
+import time
+from collections import deque
+from contextvars import ContextVar
+
+from fastapi import APIRouter, Query
+from fastapi.responses import PlainTextResponse
+
+# Set to "false" to stop tracing requests and passing the trace header on
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() != "false"
+# Finished traces kept, most recent first
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "500"))
+# Traces at least this slow are also kept in a separate buffer, so fast
+# traffic can't push them out before anyone looks
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "100"))
+TRACE_MAX_SPANS = 200
+
+TRACE_HEADER = "traceparent"
+TRACE_ID_HEADER = b"x-trace-id"
+# W3C trace context: version-trace id-parent span id-flags
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+_WATERFALL_WIDTH = 40
+
+
+def _new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "end")
+
+    def __init__(self, name: str, parent_id: str | None):
+        self.name = name
+        self.span_id = _new_id(64)
+        self.parent_id = parent_id
+        self.start = time.perf_counter()
+        self.end = None
+
+
+class Trace:
+    """One request's spans in this service. The root span covers the whole request."""
+
+    def __init__(self, trace_id: str, remote_parent_id: str | None):
+        self.trace_id = trace_id
+        self.remote_parent_id = remote_parent_id
+        self.started_at = time.time()
+        self.root = Span("request", remote_parent_id)
+        self.spans: list[Span] = []
+        self.dropped_spans = 0
+        self.status = None
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.root.end or time.perf_counter()) - self.root.start) * 1000
+
+    def add(self, span: Span):
+        if len(self.spans) < TRACE_MAX_SPANS:
+            self.spans.append(span)
+        else:
+            self.dropped_spans += 1
+
+    def waterfall(self) -> list[dict]:
+        """Spans in start order with their depth, offset from the request start and self time."""
+        spans = [self.root, *sorted(self.spans, key=lambda span: span.start)]
+        depth = {self.root.span_id: 0}
+        child_ms = {}
+        for span in spans[1:]:
+            depth[span.span_id] = depth.get(span.parent_id, 0) + 1
+            child_ms[span.parent_id] = child_ms.get(span.parent_id, 0.0) + (span.end - span.start) * 1000
+        rows = []
+        for span in spans:
+            duration_ms = ((span.end or time.perf_counter()) - span.start) * 1000
+            rows.append({
+                "name": span.name,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "depth": depth[span.span_id],
+                "offset_ms": round((span.start - self.root.start) * 1000, 3),
+                "duration_ms": round(duration_ms, 3),
+                # Time not covered by child spans: framework work, validation, serialization
+                "self_ms": round(duration_ms - child_ms.get(span.span_id, 0.0), 3),
+            })
+        return rows
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration_ms, 3),
+            "dropped_spans": self.dropped_spans,
+            "spans": self.waterfall(),
+        }
+
+    def to_text(self) -> str:
+        total = max(self.duration_ms, 1e-6)
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started_at))
+        lines = [f"{self.trace_id}  {self.root.name}  {self.status}  {self.duration_ms:.2f} ms  {started_at}Z"]
+        lines.append(f"  |{'waterfall':^{_WATERFALL_WIDTH}}| {'start ms':>9} {'total ms':>9} {'self ms':>9}  span")
+        for row in self.waterfall():
+            start = int(row["offset_ms"] / total * _WATERFALL_WIDTH)
+            width = max(1, round(row["duration_ms"] / total * _WATERFALL_WIDTH))
+            bar = (" " * start + "#" * width).ljust(_WATERFALL_WIDTH)[:_WATERFALL_WIDTH]
+            lines.append(
+                f"  |{bar}| {row['offset_ms']:9.2f} {row['duration_ms']:9.2f} {row['self_ms']:9.2f}  "
+                f"{'  ' * row['depth']}{row['name']}"
+            )
+        return "\n".join(lines)
+
+
+class TraceBuffer:
+    """Ring buffers of recently finished traces: all of them, and the slow ones."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, slow_ms: float = TRACE_SLOW_MS):
+        self.slow_ms = slow_ms
+        self.recent: deque[Trace] = deque(maxlen=size)
+        self.slow: deque[Trace] = deque(maxlen=size)
+        self.recorded = 0
+
+    def record(self, trace: Trace):
+        self.recorded += 1
+        self.recent.append(trace)
+        if trace.duration_ms >= self.slow_ms:
+            self.slow.append(trace)
+
+    def find(self, trace_id: str) -> list[Trace]:
+        traces = [trace for trace in self.recent if trace.trace_id == trace_id]
+        return traces + [trace for trace in self.slow if trace.trace_id == trace_id and trace not in traces]
+
+    def slowest(self, min_duration_ms: float, limit: int) -> list[Trace]:
+        source = self.slow if min_duration_ms >= self.slow_ms else self.recent
+        traces = [trace for trace in source if trace.duration_ms >= min_duration_ms]
+        return sorted(traces, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+
+TRACES = TraceBuffer()
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+class span:
+    """Time a block as a child of the current span: `with span("ledger transfer"): ...`
+
+    A no-op outside a traced request. A class rather than a generator-based
+    context manager, since it wraps hot paths.
+    """
+
+    __slots__ = ("name", "_trace", "_span", "_token")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        if self._trace is not None:
+            parent = _current_span.get() or self._trace.root
+            self._span = Span(self.name, parent.span_id)
+            self._token = _current_span.set(self._span)
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if self._trace is not None:
+            self._span.end = time.perf_counter()
+            _current_span.reset(self._token)
+            self._trace.add(self._span)
+        return False
+
+
+def trace_headers() -> dict[str, str]:
+    """Headers that carry the current trace to another service; empty outside a traced request."""
+    trace = _current_trace.get()
+    if trace is None:
+        return {}
+    parent = _current_span.get() or trace.root
+    return {TRACE_HEADER: f"00-{trace.trace_id}-{parent.span_id}-01"}
+
+
+class TracingMiddleware:
+    """ASGI middleware that starts or continues a trace for every request.
+
+    A `traceparent` header from the caller is continued, so the spans a
+    request causes in other services share its trace id; without one a new
+    trace starts here. The trace id is returned in `X-Trace-Id`, and the
+    finished trace goes into `buffer` for `/debug/traces`.
+    """
+
+    def __init__(self, app, buffer: TraceBuffer = TRACES, enabled: bool = TRACING_ENABLED):
+        self.app = app
+        self.buffer = buffer
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = remote_parent_id = None
+        for name, value in scope["headers"]:
+            if name == b"traceparent":
+                match = _TRACEPARENT.match(value.decode("latin-1"))
+                if match:
+                    trace_id, remote_parent_id = match.groups()
+                break
+        trace = Trace(trace_id or _new_id(128), remote_parent_id)
+        trace_token = _current_trace.set(trace)
+        span_token = _current_span.set(trace.root)
+
+        async def send_with_trace_id(message):
+            if message["type"] == "http.response.start":
+                trace.status = message["status"]
+                message["headers"] = [*message.get("headers", []), (TRACE_ID_HEADER, trace.trace_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            trace.root.end = time.perf_counter()
+            route = scope.get("route")
+            trace.root.name = f"{scope['method']} {route.path if route is not None else scope['path']}"
+            trace.status = trace.status or 500
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            self.buffer.record(trace)
+
+
+def create_debug_traces_router(buffer: TraceBuffer = TRACES) -> APIRouter:
+    router = APIRouter(prefix="/debug", tags=["debug"])
+
+    @router.get("/traces")
+    async def get_traces(
+        min_duration_ms: float = Query(default=TRACE_SLOW_MS, ge=0),
+        limit: int = Query(default=20, ge=1, le=TRACE_BUFFER_SIZE),
+        trace_id: str | None = None,
+        format: str = Query(default="json", pattern="^(json|text)$"),
+    ):
+        # The slowest recent requests as span waterfalls, or every part of one
+        # trace this service saw. `format=text` draws the waterfall as bars.
+        traces = buffer.find(trace_id) if trace_id else buffer.slowest(min_duration_ms, limit)
+        if format == "text":
+            return PlainTextResponse("\n\n".join(trace.to_text() for trace in traces) + "\n")
+        return {
+            "recorded": buffer.recorded,
+            "slow_ms": buffer.slow_ms,
+            "traces": [trace.to_dict() for trace in traces],
+        }
+
+    return router
@@ -0,0 +1,182 @@
+import asyncio
+import os
+
+import httpx
+from fastapi import HTTPException
+
+from .metrics import OutboundTimer
+from .tracing import span, trace_headers
+from .session_tokens import SESSION_TOKEN_SECRET, ExpiredSessionToken, InvalidSessionToken, RevocationList, decode_token
+from .verification_cache import VerificationCache
+
+USER_SERVICE_URL = os.getenv("USER_SERVICE_URL", "http://localhost:8000")
+USER_CLIENT_TIMEOUT = float(os.getenv("USER_CLIENT_TIMEOUT", "2.0"))
+USER_CLIENT_CONNECT_TIMEOUT = float(os.getenv("USER_CLIENT_CONNECT_TIMEOUT", "1.0"))
+USER_CLIENT_MAX_CONNECTIONS = int(os.getenv("USER_CLIENT_MAX_CONNECTIONS", "100"))
+USER_CLIENT_MAX_KEEPALIVE = int(os.getenv("USER_CLIENT_MAX_KEEPALIVE", "20"))
+USER_CLIENT_KEEPALIVE_EXPIRY = float(os.getenv("USER_CLIENT_KEEPALIVE_EXPIRY", "30.0"))
+USER_CLIENT_MAX_IN_FLIGHT = int(os.getenv("USER_CLIENT_MAX_IN_FLIGHT", "500"))
+USER_CLIENT_BATCH_SIZE = int(os.getenv("USER_CLIENT_BATCH_SIZE", "1000"))
+SESSION_REVOCATION_SYNC_SECONDS = float(os.getenv("SESSION_REVOCATION_SYNC_SECONDS", "5.0"))
+
+
+class UserServiceClient:
+    """Async client used by the other services to talk to the user service.
+
+    A single pooled keep-alive connection set is shared by every call, and
+    the number of requests in flight at once is capped by a semaphore so a
+    burst of traffic queues here instead of exhausting sockets. Verification
+    results are served from `cache` while they are fresh, and users that
+    present a valid session token are verified locally without a request.
+    """
+
+    def __init__(
+        self,
+        base_url: str = USER_SERVICE_URL,
+        timeout: float = USER_CLIENT_TIMEOUT,
+        connect_timeout: float = USER_CLIENT_CONNECT_TIMEOUT,
+        max_connections: int = USER_CLIENT_MAX_CONNECTIONS,
+        max_keepalive: int = USER_CLIENT_MAX_KEEPALIVE,
+        max_in_flight: int = USER_CLIENT_MAX_IN_FLIGHT,
+        cache: VerificationCache | None = None,
+        revocations: RevocationList | None = None,
+        token_secret: str = SESSION_TOKEN_SECRET,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self._timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self._limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=USER_CLIENT_KEEPALIVE_EXPIRY,
+        )
+        self._max_in_flight = max_in_flight
+        self.cache = cache or VerificationCache()
+        self.revocations = revocations or RevocationList()
+        self.token_secret = token_secret
+        self._revocations_synced_at = 0.0
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self._timeout,
+                limits=self._limits,
+            )
+        return self._client
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._max_in_flight)
+        return self._semaphore
+
+    async def _request(self, method: str, path: str, operation: str | None = None, **kwargs) -> httpx.Response:
+        # `operation` names the call in the metrics and traces when the path holds an id
+        with span(f"user-service {operation or path}"):
+            async with self._get_semaphore():
+                with OutboundTimer("user-service", operation or path) as timer:
+                    try:
+                        response = await self._get_client().request(method, path, headers=trace_headers(), **kwargs)
+                    except httpx.HTTPError:
+                        raise HTTPException(status_code=500, detail="Unable to connect to user service")
+                    if response.status_code >= 400:
+                        timer.outcome = str(response.status_code)
+                    return response
+
+    def _verify_token(self, token: str) -> dict | None:
+        # An expired token just means the caller is verified the slow way
+        try:
+            claims = decode_token(token, self.token_secret)
+        except ExpiredSessionToken:
+            return None
+        except InvalidSessionToken as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        if self.revocations.is_revoked(claims):
+            raise HTTPException(status_code=401, detail="Session has been revoked")
+        return {"exists": True, "is_logged_in": True, "role": claims["role"], "user_id": claims["sub"]}
+
+    def verify_ticket(self, user_id: str, ticket: str, scope: str) -> dict:
+        """Verify a short-lived ticket issued for one endpoint.
+
+        Unlike verify_user there is no fallback to the user service: a
+        missing, expired or foreign ticket is rejected.
+        """
+        try:
+            claims = decode_token(ticket, self.token_secret, scope)
+        except InvalidSessionToken as e:
+            raise HTTPException(status_code=401, detail=str(e))
+        if claims["sub"] != user_id:
+            raise HTTPException(status_code=401, detail="Ticket was issued to another user")
+        if self.revocations.is_revoked(claims):
+            raise HTTPException(status_code=401, detail="Session has been revoked")
+        return {"exists": True, "is_logged_in": True, "role": claims["role"], "user_id": claims["sub"]}
+
+    async def verify_user(self, user_id: str, token: str | None = None) -> dict:
+        if token:
+            verified = self._verify_token(token)
+            if verified and verified["user_id"] == user_id:
+                return verified
+        cached = self.cache.get(user_id)
+        if cached is not None:
+            return cached
+        epoch = self.cache.begin()
+        response = await self._request("GET", f"/users/verify/{user_id}", "/users/verify/{user_id}")
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="User service is unavailable")
+        data = response.json()
+        self.cache.put(user_id, data, epoch)
+        return data
+
+    async def verify_users(self, user_ids: list[str], tokens: list[str] = ()) -> dict[str, dict]:
+        """Verify several users with at most one round trip per batch of misses."""
+        results = {}
+        for token in tokens:
+            verified = self._verify_token(token)
+            if verified:
+                results[verified["user_id"]] = verified
+        missing = []
+        for user_id in dict.fromkeys(user_ids):
+            if user_id in results:
+                continue
+            cached = self.cache.get(user_id)
+            if cached is not None:
+                results[user_id] = cached
+            else:
+                missing.append(user_id)
+        for start in range(0, len(missing), USER_CLIENT_BATCH_SIZE):
+            chunk = missing[start:start + USER_CLIENT_BATCH_SIZE]
+            epoch = self.cache.begin()
+            response = await self._request("POST", "/users/verify:batch", json={"user_ids": chunk})
+            if response.status_code != 200:
+                raise HTTPException(status_code=500, detail="User service is unavailable")
+            fetched = response.json()["results"]
+            for user_id in chunk:
+                data = fetched.get(user_id, {"exists": False})
+                self.cache.put(user_id, data, epoch)
+                results[user_id] = data
+        return results
+
+    async def sync_revocations(self):
+        response = await self._request("GET", "/users/sessions/revocations", params={"since": self._revocations_synced_at})
+        if response.status_code != 200:
+            raise HTTPException(status_code=500, detail="User service is unavailable")
+        data = response.json()
+        self.revocations.merge(data["revocations"])
+        self.revocations.prune()
+        # Overlap the next window slightly so revocations racing this pull aren't missed
+        self._revocations_synced_at = data["now"] - 1.0
+
+    async def run_revocation_sync(self, interval: float = SESSION_REVOCATION_SYNC_SECONDS):
+        """Pull the revocation list forever; bounds how long a logout can go unseen."""
+        while True:
+            try:
+                await self.sync_revocations()
+            except HTTPException:
+                pass
+            await asyncio.sleep(interval)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
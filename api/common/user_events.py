@@ -0,0 +1,94 @@
+import os
+import queue
+import threading
+import time
+
+import requests
+from fastapi import APIRouter
+from pydantic import BaseModel, Field
+
+from .session_tokens import RevocationList
+from .verification_cache import VerificationCache
+
+USER_EVENT_SUBSCRIBERS = os.getenv("USER_EVENT_SUBSCRIBERS", "http://localhost:8001,http://localhost:8003")
+USER_EVENT_TIMEOUT = float(os.getenv("USER_EVENT_TIMEOUT", "1.0"))
+USER_EVENT_MAX_BATCH = int(os.getenv("USER_EVENT_MAX_BATCH", "500"))
+
+
+class UserEvent(BaseModel):
+    type: str  # "login", "logout", "update" or "delete"
+    user_id: str
+    occurred_at: float = Field(default_factory=time.time)
+
+
+class UserEventBatch(BaseModel):
+    events: list[UserEvent]
+
+
+class UserEventPublisher:
+    """Fans user lifecycle events out to the services that cache verifications.
+
+    Publishing never blocks the caller: events are queued and a daemon thread
+    posts them in batches over a keep-alive session. Delivery is best effort;
+    a subscriber that misses an event still drops the entry when its TTL ends.
+    """
+
+    def __init__(self, subscribers: list[str] | None = None, timeout: float = USER_EVENT_TIMEOUT):
+        if subscribers is None:
+            subscribers = [url for url in USER_EVENT_SUBSCRIBERS.split(",") if url.strip()]
+        self.subscribers = [url.strip().rstrip("/") for url in subscribers]
+        self.timeout = timeout
+        self.published = 0
+        self.delivery_failures = 0
+        self._queue: queue.Queue[UserEvent] = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def publish(self, event_type: str, user_id: str):
+        if not self.subscribers:
+            return
+        self._queue.put(UserEvent(type=event_type, user_id=user_id))
+        self.published += 1
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._run, name="user-event-publisher", daemon=True)
+                    self._worker.start()
+
+    def _run(self):
+        session = requests.Session()
+        while True:
+            events = [self._queue.get()]
+            while len(events) < USER_EVENT_MAX_BATCH:
+                try:
+                    events.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            payload = UserEventBatch(events=events).model_dump()
+            for url in self.subscribers:
+                try:
+                    session.post(f"{url}/internal/user-events", json=payload, timeout=self.timeout)
+                except requests.exceptions.RequestException:
+                    self.delivery_failures += 1
+
+
+# Events after which previously issued session tokens must stop working
+SESSION_REVOKING_EVENTS = {"logout", "update", "delete"}
+
+
+def create_user_events_router(cache: VerificationCache, revocations: RevocationList | None = None) -> APIRouter:
+    router = APIRouter(prefix="/internal", tags=["internal"])
+
+    @router.post("/user-events")
+    async def receive_user_events(batch: UserEventBatch):
+        for event in batch.events:
+            cache.invalidate(event.user_id)
+            if revocations is not None and event.type in SESSION_REVOKING_EVENTS:
+                revocations.revoke(event.user_id, event.occurred_at)
+        return {"invalidated": len(batch.events)}
+
+    @router.get("/verification-cache")
+    async def verification_cache_stats():
+        return cache.stats()
+
+    return router
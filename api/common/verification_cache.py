@@ -0,0 +1,88 @@
+import os
+import time
+from collections import OrderedDict
+
+VERIFY_CACHE_MAX_ENTRIES = int(os.getenv("VERIFY_CACHE_MAX_ENTRIES", "10000"))
+VERIFY_CACHE_TTL_SECONDS = float(os.getenv("VERIFY_CACHE_TTL_SECONDS", "30.0"))
+
+
+class VerificationCache:
+    """Bounded LRU cache of `/users/verify` results with a freshness window.
+
+    Entries are dropped when they are older than `ttl_seconds`, when the
+    cache grows past `max_entries`, or when the user service publishes an
+    event for that user. A lookup that was already in flight when an
+    invalidation arrived is not stored, so a logout can never be papered
+    over by a response fetched just before it.
+    """
+
+    def __init__(self, max_entries: int = VERIFY_CACHE_MAX_ENTRIES, ttl_seconds: float = VERIFY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._invalidated: OrderedDict[str, int] = OrderedDict()
+        self._invalidated_floor = 0
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.stale_drops = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def begin(self) -> int:
+        """Return the epoch to pass to `put` once the upstream lookup finishes."""
+        return self._epoch
+
+    def get(self, user_id: str) -> dict | None:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, data = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return data
+
+    def put(self, user_id: str, data: dict, epoch: int):
+        if not self.enabled:
+            return
+        if self._invalidated.get(user_id, self._invalidated_floor) > epoch:
+            self.stale_drops += 1
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl_seconds, data)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str):
+        self._epoch += 1
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+        self._invalidated[user_id] = self._epoch
+        self._invalidated.move_to_end(user_id)
+        while len(self._invalidated) > max(self.max_entries, 1):
+            _, epoch = self._invalidated.popitem(last=False)
+            self._invalidated_floor = epoch
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "stale_drops": self.stale_drops,
+        }
@@ -1,65 +1,198 @@
-from fastapi import APIRouter
-from ..models.payment_model import PaymentCreate, PaymentResponse
-from ..service.payment_service import PaymentService
+from fastapi import APIRouter, Header, Query, Response
+from common.session_tokens import bearer_token
+from common.sqlite_pool import run_blocking
+from ..models.payment_model import PaymentBatchRequest, PaymentBatchResponse, PaymentCreate, PaymentResponse, PaymentStatus
+from ..service.payment_service import (
+    DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, MAX_PAYMENT_WAIT_SECONDS, PAYMENT_PROCESSING_MODE, PaymentService,
+)
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 payment_service = PaymentService()
 
+def _session_tokens(authorization: str | None, extra_tokens: str | None) -> list[str]:
+    # The caller's own token plus any tokens it holds for the other parties
+    tokens = [bearer_token(authorization)]
+    if extra_tokens:
+        tokens.extend(token.strip() for token in extra_tokens.split(","))
+    return [token for token in tokens if token]
+
 @router.post("/process", response_model=PaymentResponse)
-def process_payment(payment_create: PaymentCreate):
+async def process_payment(
+    payment_create: PaymentCreate,
+    response: Response,
+    authorization: str | None = Header(default=None),
+    x_session_tokens: str | None = Header(default=None),
+    idempotency_key: str | None = Header(default=None),
+    prefer: str | None = Header(default=None),
+):
     """
     Process a payment for a ride.
     Deducts amount from rider and credits it to the driver.
+    Rider and driver session tokens (Authorization / X-Session-Tokens)
+    are verified locally instead of calling the user service.
+    Send an Idempotency-Key to make retries safe: a repeat of the same
+    request returns the original payment with `Idempotent-Replayed: true`.
+    With `Prefer: respond-async` (or PAYMENT_PROCESSING_MODE=async) the
+    payment is queued and returned as pending with 202; follow it with
+    GET /payments/{payment_id}?wait=<seconds>.
     """
-    payment = payment_service.process_payment(payment_create)
+    tokens = _session_tokens(authorization, x_session_tokens)
+    respond_async = PAYMENT_PROCESSING_MODE == "async" or "respond-async" in (prefer or "").lower()
+    if idempotency_key is not None:
+        payment, replayed = await payment_service.process_payment_once(payment_create, idempotency_key, tokens, respond_async)
+        response.headers["Idempotent-Replayed"] = "true" if replayed else "false"
+    elif respond_async:
+        payment = await payment_service.submit_payment(payment_create, tokens)
+    else:
+        payment = await payment_service.process_payment(payment_create, tokens)
+    if payment.status == PaymentStatus.PENDING:
+        response.status_code = 202
+        response.headers["Location"] = f"/payments/{payment.id}"
+        return PaymentResponse(
+            message="Payment accepted for processing",
+            payment=payment
+        )
     return PaymentResponse(
         message="Payment processed successfully",
         payment=payment
     )
 
+@router.post("/process:batch", response_model=PaymentBatchResponse)
+async def process_payment_batch(
+    batch: PaymentBatchRequest,
+    authorization: str | None = Header(default=None),
+    x_session_tokens: str | None = Header(default=None),
+):
+    """
+    Process up to 1000 payments in one request, e.g. for end-of-shift settlement.
+    Every distinct rider and driver is verified once and all ledger updates
+    are applied together. Each result carries its own status code, so some
+    items can fail while the rest are processed.
+    """
+    results = await payment_service.process_payment_batch(batch.payments, _session_tokens(authorization, x_session_tokens))
+    completed = sum(1 for result in results if result.payment is not None)
+    return PaymentBatchResponse(
+        message="Payment batch processed",
+        completed=completed,
+        failed=len(results) - completed,
+        results=results
+    )
+
+@router.post("/{payment_id}/refund", response_model=PaymentResponse)
+async def refund_payment(payment_id: str, authorization: str | None = Header(default=None)):
+    """
+    Refund a completed payment back to the rider.
+    The amount is taken back out of the driver's earnings.
+    """
+    payment = await payment_service.refund_payment(payment_id, bearer_token(authorization))
+    return PaymentResponse(
+        message="Payment refunded successfully",
+        payment=payment
+    )
+
+@router.get("/earnings/consistency")
+async def check_driver_earnings():
+    """
+    Rebuild driver earnings from the payment log and report any driver whose
+    running aggregates disagree with it.
+    """
+    return {
+        "message": "Driver earnings consistency check completed",
+        **await run_blocking(payment_service.repository, payment_service.check_driver_earnings)
+    }
+
+@router.get("/ledger/consistency")
+async def check_ledger():
+    """
+    Replay the balance ledger from the first entry and report any account
+    whose stored balance disagrees with it.
+    """
+    return {
+        "message": "Ledger consistency check completed",
+        **await run_blocking(payment_service.repository, payment_service.check_ledger)
+    }
+
+@router.get("/queue/stats")
+async def get_payment_queue_stats():
+    """
+    Depth of the async payment queue and what its workers have done so far.
+    """
+    return payment_service.queue.stats()
+
 @router.get("/{payment_id}")
-def get_payment(payment_id: str):
+async def get_payment(payment_id: str, wait: float = Query(default=0.0, ge=0.0, le=MAX_PAYMENT_WAIT_SECONDS)):
     """
     Get details of a specific payment by payment ID.
+    With `wait`, a pending or processing payment is held for up to that many
+    seconds until it completes or fails.
     """
-    payment = payment_service.get_payment(payment_id)
+    if wait:
+        payment = await payment_service.wait_for_payment(payment_id, wait)
+    else:
+        payment = await run_blocking(payment_service.repository, payment_service.get_payment, payment_id)
     return {
         "message": "Payment details retrieved successfully",
         "payment": payment
     }
 
 @router.get("/history/{user_id}")
-def get_payment_history(user_id: str):
+async def get_payment_history(
+    user_id: str,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+):
     """
-    Get payment history for a user (rider or driver).
+    Get payment history for a user (rider or driver), newest first.
+    Pass `next_cursor` from the response as `cursor` to get the next page.
     """
-    payments = payment_service.get_payment_history(user_id)
+    page = await run_blocking(payment_service.repository, payment_service.get_payment_history, user_id, limit, cursor)
     return {
         "message": "Payment history retrieved successfully",
         "user_id": user_id,
-        "payment_count": len(payments),
-        "payments": payments
+        "payment_count": len(page.payments),
+        "payments": page.payments,
+        "next_cursor": page.next_cursor
     }
 
 @router.get("/rider/{rider_id}/payments")
-def get_rider_payments(rider_id: str):
+async def get_rider_payments(
+    rider_id: str,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    authorization: str | None = Header(default=None),
+):
     """
-    Get all payments made by a specific rider.
+    Get payments made by a specific rider, newest first, one page at a time.
     """
-    payments = payment_service.get_rider_payments(rider_id)
+    page = await payment_service.get_rider_payments(rider_id, bearer_token(authorization), limit, cursor)
     return {
         "message": "Rider payments retrieved successfully",
         "rider_id": rider_id,
-        "payment_count": len(payments),
-        "payments": payments
+        "payment_count": len(page.payments),
+        "payments": page.payments,
+        "next_cursor": page.next_cursor
     }
 
 @router.get("/driver/{driver_id}/earnings")
-def get_driver_earnings(driver_id: str):
+async def get_driver_earnings(
+    driver_id: str,
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
+    summary: bool = False,
+    authorization: str | None = Header(default=None),
+):
     """
-    Get total earnings and payment details for a specific driver.
+    Get total earnings and one page of completed payments for a specific driver.
+    With `summary=true` only the running aggregates are returned: totals plus
+    daily and weekly buckets, without reading any payments.
     """
-    earnings = payment_service.get_driver_earnings(driver_id)
+    if summary:
+        earnings_summary = await payment_service.get_driver_earnings_summary(driver_id, bearer_token(authorization))
+        return {
+            "message": "Driver earnings summary retrieved successfully",
+            **earnings_summary.model_dump()
+        }
+    earnings = await payment_service.get_driver_earnings(driver_id, bearer_token(authorization), limit, cursor)
     return {
         "message": "Driver earnings retrieved successfully",
         **earnings
@@ -1,8 +1,39 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from common.user_events import create_user_events_router
+from common.metrics import MetricsMiddleware, create_metrics_router
+from common.tracing import TracingMiddleware, create_debug_traces_router
+from common.profiling import ProfilingMiddleware, create_debug_profile_router
 from .controllers import payment_controller
 
-app = FastAPI(title="Payment Service API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    user_client = payment_controller.payment_service.user_client
+    revocation_sync = asyncio.create_task(user_client.run_revocation_sync())
+    payment_workers = asyncio.create_task(payment_controller.payment_service.queue.run())
+    yield
+    payment_workers.cancel()
+    revocation_sync.cancel()
+    await user_client.aclose()
+
+app = FastAPI(title="Payment Service API", version="1.0.0", lifespan=lifespan)
+
+# Per-route latency, status and in-flight metrics, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Span waterfalls of recent slow requests, served at /debug/traces
+app.add_middleware(TracingMiddleware)
+# Outermost, so a profiled request includes the other middleware; needs PROFILING_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(payment_controller.router)
+app.include_router(create_metrics_router())
+app.include_router(create_debug_traces_router())
+app.include_router(create_debug_profile_router())
+app.include_router(create_user_events_router(
+    payment_controller.payment_service.user_client.cache,
+    payment_controller.payment_service.user_client.revocations,
+))
 
 @app.get("/")
 def root():
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from pydantic import BaseModel
 from enum import Enum
 
@@ -31,7 +31,47 @@ class Payment(BaseModel):
     created_at: datetime
     updated_at: datetime | None = None
     completed_at: datetime | None = None
+    failure_reason: str | None = None
 
 class PaymentResponse(BaseModel):
     message: str
     payment: Payment
+
+class PaymentBatchRequest(BaseModel):
+    payments: list[PaymentCreate]
+
+class PaymentBatchItem(BaseModel):
+    index: int
+    status_code: int
+    payment: Payment | None = None
+    detail: str | None = None
+
+class PaymentBatchResponse(BaseModel):
+    message: str
+    completed: int
+    failed: int
+    results: list[PaymentBatchItem]
+
+class PaymentPage(BaseModel):
+    payments: list[Payment]
+    next_cursor: str | None = None
+
+class LedgerEntry(BaseModel):
+    seq: int
+    payment_id: str
+    account: str
+    user_id: str
+    amount: float
+    created_at: datetime
+
+class EarningsBucket(BaseModel):
+    start: date
+    total: float
+    count: int
+
+class DriverEarningsSummary(BaseModel):
+    driver_id: str
+    total_earnings: float = 0.0
+    payment_count: int = 0
+    daily: list[EarningsBucket] = []
+    weekly: list[EarningsBucket] = []
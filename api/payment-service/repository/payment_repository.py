@@ -0,0 +1,662 @@
+import base64
+import os
+import threading
+from abc import ABC, abstractmethod
+from bisect import bisect_left, insort
+from collections.abc import Iterable, Iterator
+from datetime import date, datetime, timedelta, timezone
+from common.sqlite_pool import STORAGE_BACKEND, SQLitePool, sqlite_path
+from ..models.payment_model import DriverEarningsSummary, EarningsBucket, LedgerEntry, Payment, PaymentStatus
+
+# How many daily and weekly earnings buckets each driver keeps
+EARNINGS_DAILY_BUCKETS = int(os.getenv("EARNINGS_DAILY_BUCKETS", "30"))
+EARNINGS_WEEKLY_BUCKETS = int(os.getenv("EARNINGS_WEEKLY_BUCKETS", "12"))
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(payment: Payment) -> str:
+    return base64.urlsafe_b64encode(f"{payment.created_at.isoformat()}|{payment.id}".encode("utf-8")).decode("ascii")
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        created_at, payment_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), payment_id
+    except ValueError:
+        raise InvalidCursorError(cursor)
+
+def _page(payments: list[Payment], limit: int) -> tuple[list[Payment], str | None]:
+    # Callers fetch limit + 1 rows so we know whether another page exists
+    if len(payments) > limit:
+        payments = payments[:limit]
+        return payments, encode_cursor(payments[-1])
+    return payments, None
+
+def earnings_buckets(at: datetime) -> tuple[date, date]:
+    """The (day, ISO week starting Monday) buckets a UTC timestamp falls in."""
+    day = (at.astimezone(timezone.utc) if at.tzinfo else at).date()
+    return day, day - timedelta(days=day.weekday())
+
+def earnings_window(now: datetime | None = None) -> tuple[date, date]:
+    """Oldest daily and weekly bucket still inside the rolling window."""
+    day, week = earnings_buckets(now or datetime.now(timezone.utc))
+    return day - timedelta(days=EARNINGS_DAILY_BUCKETS - 1), week - timedelta(weeks=EARNINGS_WEEKLY_BUCKETS - 1)
+
+def _earnings_changes(previous: Payment | None, payment: Payment) -> list[tuple[Payment, int]]:
+    # Earnings follow the completed status: leaving it takes the payment out
+    # of the aggregates, entering it puts the payment in
+    changes = []
+    if previous is not None and previous.status == PaymentStatus.COMPLETED:
+        changes.append((previous, -1))
+    if payment.status == PaymentStatus.COMPLETED:
+        changes.append((payment, 1))
+    return changes
+
+def _earned_at(payment: Payment) -> datetime:
+    return payment.completed_at or payment.created_at
+
+
+class DriverEarnings:
+    """Running total, count and per-day/per-week buckets for one driver."""
+
+    def __init__(self):
+        self.total = 0.0
+        self.count = 0
+        # bucket start -> [total, count]
+        self.daily: dict[date, list] = {}
+        self.weekly: dict[date, list] = {}
+
+    def apply(self, amount: float, count: int, at: datetime):
+        self.total += amount
+        self.count += count
+        if self.count == 0:
+            self.total = 0.0
+        day, week = earnings_buckets(at)
+        for buckets, start in ((self.daily, day), (self.weekly, week)):
+            bucket = buckets.setdefault(start, [0.0, 0])
+            bucket[0] += amount
+            bucket[1] += count
+            if bucket[1] == 0:
+                del buckets[start]
+
+    def prune(self, day_cutoff: date, week_cutoff: date):
+        for buckets, cutoff in ((self.daily, day_cutoff), (self.weekly, week_cutoff)):
+            for start in [start for start in buckets if start < cutoff]:
+                del buckets[start]
+
+    def summary(self, driver_id: str, window: tuple[date, date]) -> DriverEarningsSummary:
+        day_cutoff, week_cutoff = window
+        return DriverEarningsSummary(
+            driver_id=driver_id,
+            total_earnings=self.total,
+            payment_count=self.count,
+            daily=[EarningsBucket(start=start, total=total, count=count)
+                   for start, (total, count) in sorted(self.daily.items(), reverse=True) if start >= day_cutoff],
+            weekly=[EarningsBucket(start=start, total=total, count=count)
+                    for start, (total, count) in sorted(self.weekly.items(), reverse=True) if start >= week_cutoff],
+        )
+
+def transfer_entries(rider_id: str, driver_id: str, amount: float) -> list[tuple[str, str, float]]:
+    """The two ledger rows of a transfer as (account, user id, amount)."""
+    return [("rider", rider_id, -amount), ("driver", driver_id, amount)]
+
+def replay_ledger(entries: Iterable[LedgerEntry]) -> dict[tuple[str, str], float]:
+    """Recompute every (account, user id) balance from the ledger, in seq order."""
+    balances: dict[tuple[str, str], float] = {}
+    for entry in entries:
+        key = (entry.account, entry.user_id)
+        balances[key] = balances.get(key, 0.0) + entry.amount
+    return balances
+
+def build_driver_earnings(payments: Iterable[Payment]) -> dict[str, DriverEarningsSummary]:
+    """Recompute every driver's earnings summary from the payment log."""
+    earnings: dict[str, DriverEarnings] = {}
+    for payment in payments:
+        if payment.status == PaymentStatus.COMPLETED:
+            earnings.setdefault(payment.driver_id, DriverEarnings()).apply(payment.amount, 1, _earned_at(payment))
+    window = earnings_window()
+    return {driver_id: totals.summary(driver_id, window) for driver_id, totals in earnings.items()}
+
+
+class PaymentRepository(ABC):
+    """Payment storage. The list methods return newest-first pages.
+
+    A page is (payments, next_cursor); pass next_cursor back to get the
+    following page and stop when it is None.
+    """
+
+    # Backends whose calls can wait on disk or locks set this; see run_blocking
+    blocking = False
+
+    @abstractmethod
+    def get_payment(self, payment_id: str) -> Payment | None: ...
+
+    def add_payment(self, payment: Payment):
+        self.add_payments([payment])
+
+    @abstractmethod
+    def add_payments(self, payments: list[Payment]):
+        """Insert or replace several payments in one write."""
+
+    def apply_transfer(self, payment_id: str, rider_id: str, driver_id: str, amount: float):
+        self.apply_transfers([(payment_id, rider_id, driver_id, amount)])
+
+    @abstractmethod
+    def apply_transfers(self, transfers: list[tuple[str, str, str, float]]):
+        """
+        Append the rider debit and driver credit of every (payment id, rider id,
+        driver id, amount) to the ledger and update the balances, all in one
+        critical section.
+        """
+
+    @abstractmethod
+    def refund_payment(self, payment_id: str, refunded_at: datetime) -> Payment | None:
+        """Compare-and-set a completed payment to refunded and reverse its transfer.
+
+        The status change, the reversing ledger rows and the earnings update
+        happen together. Returns the refunded payment, or None when it is
+        missing or no longer completed, e.g. because a concurrent refund won.
+        """
+
+    @abstractmethod
+    def get_balance(self, account: str, user_id: str) -> float:
+        """Current balance of a "rider" or "driver" account."""
+
+    @abstractmethod
+    def list_balances(self) -> dict[tuple[str, str], float]:
+        """Every balance, keyed by (account, user id)."""
+
+    @abstractmethod
+    def ledger_entries(self) -> Iterator[LedgerEntry]:
+        """The whole ledger in seq order, used to replay the balances."""
+
+    @abstractmethod
+    def list_user_payments(self, user_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        """Payments where the user is rider or driver."""
+
+    @abstractmethod
+    def list_rider_payments(self, rider_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]: ...
+
+    @abstractmethod
+    def list_driver_payments(self, driver_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        """Completed payments earned by the driver."""
+
+    @abstractmethod
+    def get_driver_earnings(self, driver_id: str) -> DriverEarningsSummary:
+        """The driver's running earnings aggregates, kept up to date by add_payment."""
+
+    @abstractmethod
+    def list_driver_earnings(self) -> list[DriverEarningsSummary]:
+        """Running earnings aggregates for every driver."""
+
+    @abstractmethod
+    def completed_payments(self) -> Iterator[Payment]:
+        """Every completed payment in the log, used to rebuild the aggregates."""
+
+    @abstractmethod
+    def transition_payment(self, payment: Payment, status: PaymentStatus, updated_at: datetime,
+                           failure_reason: str | None = None) -> Payment | None:
+        """Compare-and-set the payment's status.
+
+        Succeeds only while the stored payment still has the status and
+        updated_at of `payment`, and returns the updated payment, or None
+        when another worker changed it first. A worker's claim on a
+        PROCESSING payment is its updated_at, so once the claim is renewed
+        by its owner or taken back by reclaim_payments, older copies can no
+        longer change the payment.
+        """
+
+    @abstractmethod
+    def complete_payment(self, payment: Payment, transaction_id: str, completed_at: datetime) -> Payment | None:
+        """transition_payment to COMPLETED, with the ledger transfer and earnings update in the same write."""
+
+    @abstractmethod
+    def reclaim_payments(self, stale_before: datetime, updated_at: datetime) -> list[Payment]:
+        """
+        Move PROCESSING payments last touched before stale_before back to
+        PENDING, then return every PENDING payment, oldest first, for the
+        queue to pick up again.
+        """
+
+
+class InMemoryPaymentRepository(PaymentRepository):
+    def __init__(self):
+        self.payments = {}
+        # Append-only; balances are the running sum of the ledger per (account, user id)
+        self.ledger: list[LedgerEntry] = []
+        self.balances: dict[tuple[str, str], float] = {}
+        # (kind, user id) -> [(created_at, payment id), ...] kept in ascending order
+        self._indexes: dict[tuple[str, str], list[tuple[datetime, str]]] = {}
+        self._earnings: dict[str, DriverEarnings] = {}
+        self._lock = threading.Lock()
+        self._ledger_lock = threading.Lock()
+
+    def _index_keys(self, payment: Payment) -> list[tuple[str, str]]:
+        keys = [("rider", payment.rider_id), ("driver", payment.driver_id), ("user", payment.rider_id)]
+        if payment.driver_id != payment.rider_id:
+            keys.append(("user", payment.driver_id))
+        if payment.status == PaymentStatus.COMPLETED:
+            keys.append(("driver_completed", payment.driver_id))
+        return keys
+
+    def get_payment(self, payment_id: str) -> Payment | None:
+        return self.payments.get(payment_id)
+
+    def add_payments(self, payments: list[Payment]):
+        with self._lock:
+            for payment in payments:
+                self._add_payment(payment)
+
+    def _add_payment(self, payment: Payment):
+        entry = (payment.created_at, payment.id)
+        previous = self.payments.get(payment.id)
+        if previous is not None:
+            previous_entry = (previous.created_at, previous.id)
+            for key in self._index_keys(previous):
+                entries = self._indexes[key]
+                del entries[bisect_left(entries, previous_entry)]
+        self.payments[payment.id] = payment
+        for key in self._index_keys(payment):
+            entries = self._indexes.setdefault(key, [])
+            # Payments almost always arrive in created_at order, so this is an append
+            if not entries or entries[-1] < entry:
+                entries.append(entry)
+            else:
+                insort(entries, entry)
+        for changed, sign in _earnings_changes(previous, payment):
+            self._apply_earnings(changed, sign)
+
+    def _apply_earnings(self, payment: Payment, sign: int):
+        earnings = self._earnings.setdefault(payment.driver_id, DriverEarnings())
+        buckets = len(earnings.daily) + len(earnings.weekly)
+        earnings.apply(sign * payment.amount, sign, _earned_at(payment))
+        if len(earnings.daily) + len(earnings.weekly) > buckets:
+            earnings.prune(*earnings_window())
+
+    def apply_transfers(self, transfers: list[tuple[str, str, str, float]]):
+        # Note: In a production system, implement balance checks and wallet management
+        # to prevent negative balances. Currently using simplified transaction tracking.
+        created_at = datetime.now(timezone.utc)
+        with self._ledger_lock:
+            for payment_id, rider_id, driver_id, amount in transfers:
+                for account, user_id, delta in transfer_entries(rider_id, driver_id, amount):
+                    self.ledger.append(LedgerEntry(
+                        seq=len(self.ledger) + 1, payment_id=payment_id, account=account,
+                        user_id=user_id, amount=delta, created_at=created_at
+                    ))
+                    self.balances[(account, user_id)] = self.balances.get((account, user_id), 0.0) + delta
+
+    def refund_payment(self, payment_id: str, refunded_at: datetime) -> Payment | None:
+        with self._lock:
+            current = self.payments.get(payment_id)
+            if current is None or current.status != PaymentStatus.COMPLETED:
+                return None
+            refunded = current.model_copy(update={"status": PaymentStatus.REFUNDED, "updated_at": refunded_at})
+            self._add_payment(refunded)
+            self.apply_transfer(payment_id, current.rider_id, current.driver_id, -current.amount)
+            return refunded
+
+    def get_balance(self, account: str, user_id: str) -> float:
+        return self.balances.get((account, user_id), 0.0)
+
+    def list_balances(self) -> dict[tuple[str, str], float]:
+        with self._ledger_lock:
+            return dict(self.balances)
+
+    def ledger_entries(self) -> Iterator[LedgerEntry]:
+        with self._ledger_lock:
+            entries = list(self.ledger)
+        return iter(entries)
+
+    def _list(self, key: tuple[str, str], limit: int, cursor: str | None) -> tuple[list[Payment], str | None]:
+        entries = self._indexes.get(key, [])
+        end = bisect_left(entries, decode_cursor(cursor)) if cursor else len(entries)
+        start = max(end - limit - 1, 0)
+        return _page([self.payments[payment_id] for _, payment_id in reversed(entries[start:end])], limit)
+
+    def list_user_payments(self, user_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        return self._list(("user", user_id), limit, cursor)
+
+    def list_rider_payments(self, rider_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        return self._list(("rider", rider_id), limit, cursor)
+
+    def list_driver_payments(self, driver_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        return self._list(("driver_completed", driver_id), limit, cursor)
+
+    def get_driver_earnings(self, driver_id: str) -> DriverEarningsSummary:
+        with self._lock:
+            earnings = self._earnings.get(driver_id)
+            if earnings is None:
+                return DriverEarningsSummary(driver_id=driver_id)
+            return earnings.summary(driver_id, earnings_window())
+
+    def list_driver_earnings(self) -> list[DriverEarningsSummary]:
+        window = earnings_window()
+        with self._lock:
+            return [earnings.summary(driver_id, window) for driver_id, earnings in self._earnings.items()]
+
+    def completed_payments(self) -> Iterator[Payment]:
+        with self._lock:
+            payments = list(self.payments.values())
+        return (payment for payment in payments if payment.status == PaymentStatus.COMPLETED)
+
+    def _compare_and_set(self, payment: Payment, changes: dict) -> Payment | None:
+        # Callers hold self._lock
+        current = self.payments.get(payment.id)
+        if current is None or current.status != payment.status or current.updated_at != payment.updated_at:
+            return None
+        updated = current.model_copy(update=changes)
+        self._add_payment(updated)
+        return updated
+
+    def transition_payment(self, payment: Payment, status: PaymentStatus, updated_at: datetime,
+                           failure_reason: str | None = None) -> Payment | None:
+        with self._lock:
+            return self._compare_and_set(payment, {"status": status, "updated_at": updated_at, "failure_reason": failure_reason})
+
+    def complete_payment(self, payment: Payment, transaction_id: str, completed_at: datetime) -> Payment | None:
+        with self._lock:
+            completed = self._compare_and_set(payment, {
+                "status": PaymentStatus.COMPLETED, "transaction_id": transaction_id,
+                "completed_at": completed_at, "updated_at": completed_at,
+            })
+            if completed is not None:
+                self.apply_transfer(payment.id, payment.rider_id, payment.driver_id, payment.amount)
+            return completed
+
+    def reclaim_payments(self, stale_before: datetime, updated_at: datetime) -> list[Payment]:
+        with self._lock:
+            for payment in list(self.payments.values()):
+                if payment.status == PaymentStatus.PROCESSING and (payment.updated_at or payment.created_at) < stale_before:
+                    self._add_payment(payment.model_copy(update={"status": PaymentStatus.PENDING, "updated_at": updated_at}))
+            pending = [payment for payment in self.payments.values() if payment.status == PaymentStatus.PENDING]
+        return sorted(pending, key=lambda payment: (payment.created_at, payment.id))
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS payments (
+    id TEXT PRIMARY KEY,
+    ride_id TEXT NOT NULL,
+    rider_id TEXT NOT NULL,
+    driver_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    payment_method TEXT NOT NULL,
+    status TEXT NOT NULL,
+    transaction_id TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT,
+    completed_at TEXT,
+    failure_reason TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_payments_rider_id ON payments (rider_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_payments_driver_id ON payments (driver_id, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_payments_driver_status ON payments (driver_id, status, created_at, id);
+CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status);
+CREATE INDEX IF NOT EXISTS idx_payments_created_at ON payments (created_at);
+CREATE TABLE IF NOT EXISTS balances (
+    account TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    balance REAL NOT NULL,
+    PRIMARY KEY (account, user_id)
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    payment_id TEXT NOT NULL,
+    account TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    amount REAL NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS driver_earnings (
+    driver_id TEXT PRIMARY KEY,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS driver_earnings_buckets (
+    driver_id TEXT NOT NULL,
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    total REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (driver_id, period, start)
+);
+"""
+
+_PAYMENT_COLUMNS = (
+    "id, ride_id, rider_id, driver_id, amount, payment_method, status, transaction_id, created_at, updated_at, completed_at,"
+    " failure_reason"
+)
+# Keyset pagination: rows strictly older than the cursor, newest first
+_BEFORE_CURSOR = "(created_at, id) < (?, ?)"
+_NEWEST_FIRST = "ORDER BY created_at DESC, id DESC LIMIT ?"
+# Sorts after every stored row, so "no cursor" uses the same statement as "cursor"
+_END_KEY = ("9999", "")
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+class SQLitePaymentRepository(PaymentRepository):
+    blocking = True
+
+    def __init__(self, path: str | None = None):
+        self.pool = SQLitePool(path or sqlite_path("payments.db"), SCHEMA)
+        self.pool.ensure_columns("payments", {"failure_reason": "TEXT"})
+
+    @staticmethod
+    def _to_row(payment: Payment) -> tuple:
+        return (
+            payment.id, payment.ride_id, payment.rider_id, payment.driver_id, payment.amount,
+            payment.payment_method.value, payment.status.value, payment.transaction_id,
+            payment.created_at.isoformat(), _isoformat(payment.updated_at), _isoformat(payment.completed_at),
+            payment.failure_reason,
+        )
+
+    @staticmethod
+    def _cursor_key(cursor: str | None) -> tuple[str, str]:
+        if not cursor:
+            return _END_KEY
+        created_at, payment_id = decode_cursor(cursor)
+        return created_at.isoformat(), payment_id
+
+    def _query(self, sql: str, params: tuple) -> list[Payment]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        return [Payment(**dict(row)) for row in rows]
+
+    def get_payment(self, payment_id: str) -> Payment | None:
+        payments = self._query(f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE id = ?", (payment_id,))
+        return payments[0] if payments else None
+
+    def add_payments(self, payments: list[Payment]):
+        with self.pool.transaction() as conn:
+            for payment in payments:
+                row = conn.execute(f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE id = ?", (payment.id,)).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO payments ({_PAYMENT_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._to_row(payment),
+                )
+                # Aggregates change in the same transaction as the payment itself
+                for changed, sign in _earnings_changes(Payment(**dict(row)) if row else None, payment):
+                    self._apply_earnings(conn, changed, sign)
+
+    @staticmethod
+    def _apply_earnings(conn, payment: Payment, sign: int):
+        amount = sign * payment.amount
+        conn.execute(
+            "INSERT INTO driver_earnings (driver_id, total, count) VALUES (?, ?, ?)"
+            " ON CONFLICT (driver_id) DO UPDATE SET total = CASE WHEN count + excluded.count = 0 THEN 0"
+            " ELSE total + excluded.total END, count = count + excluded.count",
+            (payment.driver_id, amount, sign),
+        )
+        day, week = earnings_buckets(_earned_at(payment))
+        for period, start, cutoff in zip(("day", "week"), (day, week), earnings_window()):
+            conn.execute(
+                "INSERT INTO driver_earnings_buckets (driver_id, period, start, total, count) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT (driver_id, period, start) DO UPDATE SET"
+                " total = total + excluded.total, count = count + excluded.count",
+                (payment.driver_id, period, start.isoformat(), amount, sign),
+            )
+            conn.execute(
+                "DELETE FROM driver_earnings_buckets WHERE driver_id = ? AND period = ? AND (start < ? OR count = 0)",
+                (payment.driver_id, period, cutoff.isoformat()),
+            )
+
+    def apply_transfers(self, transfers: list[tuple[str, str, str, float]]):
+        created_at = datetime.now(timezone.utc).isoformat()
+        # The ledger rows and the balances they move commit together
+        with self.pool.transaction() as conn:
+            self._insert_transfers(conn, transfers, created_at)
+
+    @staticmethod
+    def _insert_transfers(conn, transfers: list[tuple[str, str, str, float]], created_at: str):
+        for payment_id, rider_id, driver_id, amount in transfers:
+            for account, user_id, delta in transfer_entries(rider_id, driver_id, amount):
+                conn.execute(
+                    "INSERT INTO ledger (payment_id, account, user_id, amount, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (payment_id, account, user_id, delta, created_at),
+                )
+                conn.execute(
+                    "INSERT INTO balances (account, user_id, balance) VALUES (?, ?, ?)"
+                    " ON CONFLICT (account, user_id) DO UPDATE SET balance = balance + excluded.balance",
+                    (account, user_id, delta),
+                )
+
+    def refund_payment(self, payment_id: str, refunded_at: datetime) -> Payment | None:
+        with self.pool.transaction() as conn:
+            # The status in the WHERE clause makes this the compare-and-set;
+            # the write lock taken by BEGIN IMMEDIATE orders competing refunds
+            row = conn.execute(f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE id = ?", (payment_id,)).fetchone()
+            updated = conn.execute(
+                "UPDATE payments SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (PaymentStatus.REFUNDED.value, refunded_at.isoformat(), payment_id, PaymentStatus.COMPLETED.value),
+            ).rowcount
+            if not updated:
+                return None
+            current = Payment(**dict(row))
+            refunded = current.model_copy(update={"status": PaymentStatus.REFUNDED, "updated_at": refunded_at})
+            for changed, sign in _earnings_changes(current, refunded):
+                self._apply_earnings(conn, changed, sign)
+            self._insert_transfers(conn, [(payment_id, current.rider_id, current.driver_id, -current.amount)],
+                                   refunded_at.isoformat())
+        return refunded
+
+    def get_balance(self, account: str, user_id: str) -> float:
+        with self.pool.connection() as conn:
+            row = conn.execute("SELECT balance FROM balances WHERE account = ? AND user_id = ?", (account, user_id)).fetchone()
+        return row["balance"] if row else 0.0
+
+    def list_balances(self) -> dict[tuple[str, str], float]:
+        with self.pool.connection() as conn:
+            return {(row["account"], row["user_id"]): row["balance"] for row in conn.execute("SELECT account, user_id, balance FROM balances")}
+
+    def ledger_entries(self) -> Iterator[LedgerEntry]:
+        with self.pool.connection() as conn:
+            for row in conn.execute("SELECT seq, payment_id, account, user_id, amount, created_at FROM ledger ORDER BY seq"):
+                yield LedgerEntry(**dict(row))
+
+    def list_user_payments(self, user_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        # Each side walks its own index and stops after one page; the union is then trimmed
+        key = self._cursor_key(cursor)
+        return _page(self._query(
+            f"SELECT * FROM (SELECT {_PAYMENT_COLUMNS} FROM payments WHERE rider_id = ? AND {_BEFORE_CURSOR} {_NEWEST_FIRST})"
+            f" UNION SELECT * FROM (SELECT {_PAYMENT_COLUMNS} FROM payments WHERE driver_id = ? AND {_BEFORE_CURSOR} {_NEWEST_FIRST})"
+            f" {_NEWEST_FIRST}",
+            (user_id, *key, limit + 1, user_id, *key, limit + 1, limit + 1),
+        ), limit)
+
+    def list_rider_payments(self, rider_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        return _page(self._query(
+            f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE rider_id = ? AND {_BEFORE_CURSOR} {_NEWEST_FIRST}",
+            (rider_id, *self._cursor_key(cursor), limit + 1),
+        ), limit)
+
+    def list_driver_payments(self, driver_id: str, limit: int, cursor: str | None = None) -> tuple[list[Payment], str | None]:
+        return _page(self._query(
+            f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE driver_id = ? AND status = ? AND {_BEFORE_CURSOR} {_NEWEST_FIRST}",
+            (driver_id, PaymentStatus.COMPLETED.value, *self._cursor_key(cursor), limit + 1),
+        ), limit)
+
+    @staticmethod
+    def _summaries(totals: list, buckets: list) -> list[DriverEarningsSummary]:
+        summaries = {
+            row["driver_id"]: DriverEarningsSummary(driver_id=row["driver_id"], total_earnings=row["total"], payment_count=row["count"])
+            for row in totals
+        }
+        for row in buckets:
+            summary = summaries.get(row["driver_id"])
+            if summary is not None:
+                periods = summary.daily if row["period"] == "day" else summary.weekly
+                periods.append(EarningsBucket(start=row["start"], total=row["total"], count=row["count"]))
+        return list(summaries.values())
+
+    def _earnings(self, where: str, params: tuple) -> list[DriverEarningsSummary]:
+        day_cutoff, week_cutoff = earnings_window()
+        with self.pool.connection() as conn:
+            totals = conn.execute(f"SELECT driver_id, total, count FROM driver_earnings {where}", params).fetchall()
+            buckets = conn.execute(
+                f"SELECT driver_id, period, start, total, count FROM driver_earnings_buckets {where}"
+                f" {'AND' if where else 'WHERE'} ((period = 'day' AND start >= ?) OR (period = 'week' AND start >= ?))"
+                " ORDER BY driver_id, period, start DESC",
+                (*params, day_cutoff.isoformat(), week_cutoff.isoformat()),
+            ).fetchall()
+        return self._summaries(totals, buckets)
+
+    def get_driver_earnings(self, driver_id: str) -> DriverEarningsSummary:
+        summaries = self._earnings("WHERE driver_id = ?", (driver_id,))
+        return summaries[0] if summaries else DriverEarningsSummary(driver_id=driver_id)
+
+    def list_driver_earnings(self) -> list[DriverEarningsSummary]:
+        return self._earnings("", ())
+
+    def completed_payments(self) -> Iterator[Payment]:
+        with self.pool.connection() as conn:
+            for row in conn.execute(f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE status = ?", (PaymentStatus.COMPLETED.value,)):
+                yield Payment(**dict(row))
+
+    def _compare_and_set(self, conn, payment: Payment, changes: dict) -> Payment | None:
+        # The expected status and updated_at in the WHERE clause make this the
+        # compare-and-set; the write lock taken by BEGIN IMMEDIATE orders competing workers
+        updated = payment.model_copy(update=changes)
+        row = self._to_row(updated)
+        if not conn.execute(
+            "UPDATE payments SET status = ?, transaction_id = ?, updated_at = ?, completed_at = ?, failure_reason = ?"
+            " WHERE id = ? AND status = ? AND updated_at IS ?",
+            (*row[6:8], *row[9:12], payment.id, payment.status.value, _isoformat(payment.updated_at)),
+        ).rowcount:
+            return None
+        for changed, sign in _earnings_changes(payment, updated):
+            self._apply_earnings(conn, changed, sign)
+        return updated
+
+    def transition_payment(self, payment: Payment, status: PaymentStatus, updated_at: datetime,
+                           failure_reason: str | None = None) -> Payment | None:
+        with self.pool.transaction() as conn:
+            return self._compare_and_set(conn, payment, {"status": status, "updated_at": updated_at, "failure_reason": failure_reason})
+
+    def complete_payment(self, payment: Payment, transaction_id: str, completed_at: datetime) -> Payment | None:
+        with self.pool.transaction() as conn:
+            completed = self._compare_and_set(conn, payment, {
+                "status": PaymentStatus.COMPLETED, "transaction_id": transaction_id,
+                "completed_at": completed_at, "updated_at": completed_at,
+            })
+            if completed is not None:
+                self._insert_transfers(conn, [(payment.id, payment.rider_id, payment.driver_id, payment.amount)],
+                                       completed_at.isoformat())
+        return completed
+
+    def reclaim_payments(self, stale_before: datetime, updated_at: datetime) -> list[Payment]:
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "UPDATE payments SET status = ?, updated_at = ? WHERE status = ? AND COALESCE(updated_at, created_at) < ?",
+                (PaymentStatus.PENDING.value, updated_at.isoformat(), PaymentStatus.PROCESSING.value, stale_before.isoformat()),
+            )
+        return self._query(
+            f"SELECT {_PAYMENT_COLUMNS} FROM payments WHERE status = ? ORDER BY created_at, id",
+            (PaymentStatus.PENDING.value,),
+        )
+
+
+def create_payment_repository() -> PaymentRepository:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLitePaymentRepository()
+    return InMemoryPaymentRepository()
@@ -0,0 +1,93 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+# How long a key is remembered after the request that first used it
+IDEMPOTENCY_KEY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_KEY_TTL_SECONDS", "86400"))
+# Oldest keys are forgotten first once the store holds this many
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "100000"))
+
+
+class IdempotencyKeyReusedError(ValueError):
+    """The key was already used for a request with a different body."""
+
+
+class IdempotencyStore:
+    """Bounded TTL map from `Idempotency-Key` to the result of the first request.
+
+    The first request with a key runs the operation; a retry with the same
+    key and body gets that request's result back without running it again,
+    and a retry that arrives while the first is still running waits for it.
+    Only successful results are remembered: when the operation raises, the
+    key is released so the client can try again.
+    """
+
+    def __init__(self, ttl_seconds: float = IDEMPOTENCY_KEY_TTL_SECONDS, max_keys: int = IDEMPOTENCY_MAX_KEYS):
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        # key -> (expires at, request fingerprint, future holding the result), oldest first
+        self._entries: OrderedDict[str, tuple[float, str, asyncio.Future]] = OrderedDict()
+        self.executions = 0
+        self.replays = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    def _expire(self, now: float):
+        while self._entries:
+            expires_at = next(iter(self._entries.values()))[0]
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def run(self, key: str, fingerprint: str, operation: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Return (result, replayed), running the operation only for a new key."""
+        now = time.monotonic()
+        self._expire(now)
+        entry = self._entries.get(key)
+        if entry is not None:
+            _, stored_fingerprint, result = entry
+            if stored_fingerprint != fingerprint:
+                self.conflicts += 1
+                raise IdempotencyKeyReusedError(key)
+            self.replays += 1
+            if result.done():
+                return result.result(), True
+            # Shielded so a retry that gives up does not cancel the original
+            return await asyncio.shield(result), True
+
+        result = asyncio.get_running_loop().create_future()
+        entry = (now + self.ttl_seconds, fingerprint, result)
+        self._entries[key] = entry
+        self._expire(now)
+        self.executions += 1
+        try:
+            value = await operation()
+        except BaseException as e:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+            if isinstance(e, asyncio.CancelledError):
+                result.cancel()
+            else:
+                result.set_exception(e)
+                # Retries waiting on the result re-raise it; nobody else has to
+                result.exception()
+            raise
+        result.set_result(value)
+        return value, False
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_keys": self.max_keys,
+            "ttl_seconds": self.ttl_seconds,
+            "executions": self.executions,
+            "replays": self.replays,
+            "conflicts": self.conflicts,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import random
+import uuid
+from abc import ABC, abstractmethod
+from ..models.payment_model import Payment
+
+# Simulated card processor: latency of every charge, random extra latency on top, and share of charges that fail
+PAYMENT_PROCESSOR_LATENCY_MS = float(os.getenv("PAYMENT_PROCESSOR_LATENCY_MS", "0"))
+PAYMENT_PROCESSOR_JITTER_MS = float(os.getenv("PAYMENT_PROCESSOR_JITTER_MS", "0"))
+PAYMENT_PROCESSOR_FAILURE_RATE = float(os.getenv("PAYMENT_PROCESSOR_FAILURE_RATE", "0"))
+
+
+class PaymentProcessorError(Exception):
+    """The processor could not complete the charge; trying again may succeed."""
+
+
+class PaymentProcessor(ABC):
+    """The downstream system that actually moves the rider's money."""
+
+    @abstractmethod
+    async def charge(self, payment: Payment) -> str:
+        """Charge the payment and return the processor's transaction id."""
+
+
+class FakePaymentProcessor(PaymentProcessor):
+    """Local stand-in for a card processor with injectable latency and failures."""
+
+    def __init__(self, latency_ms: float = PAYMENT_PROCESSOR_LATENCY_MS, jitter_ms: float = PAYMENT_PROCESSOR_JITTER_MS,
+                 failure_rate: float = PAYMENT_PROCESSOR_FAILURE_RATE, seed: int | None = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.charges = 0
+        self.failures = 0
+
+    async def charge(self, payment: Payment) -> str:
+        self.charges += 1
+        delay = self.latency_ms + self._random.random() * self.jitter_ms
+        if delay > 0:
+            await asyncio.sleep(delay / 1000)
+        if self._random.random() < self.failure_rate:
+            self.failures += 1
+            raise PaymentProcessorError("Payment processor is unavailable")
+        return f"TXN-{uuid.uuid4()}"
+
+
+def create_payment_processor() -> PaymentProcessor:
+    return FakePaymentProcessor()
@@ -0,0 +1,179 @@
+import asyncio
+import logging
+import os
+import random
+
+from common.sqlite_pool import run_blocking
+
+# Payments accepted with `Prefer: respond-async` wait here for a worker
+PAYMENT_QUEUE_SIZE = int(os.getenv("PAYMENT_QUEUE_SIZE", "10000"))
+PAYMENT_WORKERS = int(os.getenv("PAYMENT_WORKERS", "8"))
+# Charges are tried this many times before the payment is marked failed
+PAYMENT_MAX_ATTEMPTS = int(os.getenv("PAYMENT_MAX_ATTEMPTS", "5"))
+# Exponential backoff between attempts: base * 2^(attempt - 1), capped, with jitter
+PAYMENT_RETRY_BASE_SECONDS = float(os.getenv("PAYMENT_RETRY_BASE_SECONDS", "0.2"))
+PAYMENT_RETRY_MAX_SECONDS = float(os.getenv("PAYMENT_RETRY_MAX_SECONDS", "5"))
+# A worker renews its claim on a payment before every charge attempt; a
+# PROCESSING payment not renewed for this long is taken back at startup.
+# Keep it well above one charge plus PAYMENT_RETRY_MAX_SECONDS.
+PAYMENT_PROCESSING_LEASE_SECONDS = float(os.getenv("PAYMENT_PROCESSING_LEASE_SECONDS", "60"))
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentQueueFullError(Exception):
+    pass
+
+
+class PaymentQueue:
+    """In-process queue of pending payments and the async workers that complete them.
+
+    A worker moves a payment from PENDING to PROCESSING, charges it through
+    the payment processor and, once the charge succeeds, applies the ledger
+    transfer and marks it COMPLETED. Failed charges are retried with
+    exponential backoff; a payment still failing after the last attempt is
+    marked FAILED. Long-polling clients are woken when a payment they wait
+    on is finished. Every status change is a compare-and-set on the
+    payment's status and claim, so workers in several processes sharing a
+    database never charge or complete the same payment twice. Pending
+    payments, and processing ones whose claim has gone stale, are queued
+    again before the workers start.
+    """
+
+    def __init__(self, payment_service, workers: int = PAYMENT_WORKERS, max_size: int = PAYMENT_QUEUE_SIZE,
+                 max_attempts: int = PAYMENT_MAX_ATTEMPTS, retry_base_seconds: float = PAYMENT_RETRY_BASE_SECONDS,
+                 retry_max_seconds: float = PAYMENT_RETRY_MAX_SECONDS,
+                 lease_seconds: float = PAYMENT_PROCESSING_LEASE_SECONDS):
+        self.payment_service = payment_service
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.retry_max_seconds = retry_max_seconds
+        self.lease_seconds = lease_seconds
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_size)
+        self._waiters: dict[str, set[asyncio.Future]] = {}
+        self.busy = 0
+        self.enqueued = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.recovered = 0
+        self.lost_claims = 0
+        self.errors = 0
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def enqueue(self, payment_id: str):
+        try:
+            self._queue.put_nowait(payment_id)
+        except asyncio.QueueFull:
+            raise PaymentQueueFullError(payment_id)
+        self.enqueued += 1
+
+    def backoff(self, attempt: int) -> float:
+        delay = min(self.retry_base_seconds * 2 ** (attempt - 1), self.retry_max_seconds)
+        # Jitter keeps payments that failed together from retrying together
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run(self):
+        await self.recover()
+        await asyncio.gather(*(self._work() for _ in range(self.workers)))
+
+    async def recover(self):
+        """Queue the pending payments and those whose processing claim went stale."""
+        service = self.payment_service
+        payment_ids = await run_blocking(service.repository, service.reclaim_payments, self.lease_seconds)
+        for payment_id in payment_ids:
+            try:
+                self.enqueue(payment_id)
+            except PaymentQueueFullError:
+                # The rest stay PENDING until the next start
+                logger.warning("Payment queue is full; %d unfinished payments were not queued",
+                               len(payment_ids) - self.recovered)
+                break
+            self.recovered += 1
+
+    async def _work(self):
+        while True:
+            payment_id = await self._queue.get()
+            self.busy += 1
+            try:
+                await self._process(payment_id)
+            except Exception:
+                # Keep the worker alive; the payment stays visible in its last state
+                self.errors += 1
+                logger.exception("Payment %s could not be processed", payment_id)
+            finally:
+                self.busy -= 1
+                self._queue.task_done()
+
+    async def _process(self, payment_id: str):
+        service = self.payment_service
+        payment = await run_blocking(service.repository, service.start_processing, payment_id)
+        if payment is None:
+            return
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                payment = await run_blocking(service.repository, service.renew_processing, payment)
+                if payment is None:
+                    self._lose_claim(payment_id)
+                    break
+            try:
+                transaction_id = await service.processor.charge(payment)
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    if await run_blocking(service.repository, service.fail_payment, payment, f"{str(e)} (after {attempt} attempts)") is None:
+                        self._lose_claim(payment_id)
+                    else:
+                        self.failed += 1
+                    break
+                self.retries += 1
+                await asyncio.sleep(self.backoff(attempt))
+            else:
+                if await run_blocking(service.repository, service.complete_payment, payment, transaction_id) is None:
+                    self._lose_claim(payment_id)
+                else:
+                    self.completed += 1
+                break
+        self._notify(payment_id)
+
+    def _lose_claim(self, payment_id: str):
+        # Taken back by another process after the lease ran out; that process
+        # owns the outcome now and the ledger is left alone
+        self.lost_claims += 1
+        logger.warning("Lost the processing claim on payment %s", payment_id)
+
+    def _notify(self, payment_id: str):
+        for waiter in self._waiters.pop(payment_id, ()):
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def wait(self, payment_id: str, timeout: float):
+        """Return when a worker finishes the payment or after `timeout` seconds."""
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(payment_id, set()).add(waiter)
+        try:
+            await asyncio.wait((waiter,), timeout=timeout)
+        finally:
+            waiters = self._waiters.get(payment_id)
+            if waiters is not None:
+                waiters.discard(waiter)
+                if not waiters:
+                    del self._waiters[payment_id]
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "busy": self.busy,
+            "queued": self._queue.qsize(),
+            "max_size": self._queue.maxsize,
+            "enqueued": self.enqueued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "recovered": self.recovered,
+            "lost_claims": self.lost_claims,
+            "errors": self.errors,
+            "waiting_clients": sum(len(waiters) for waiters in self._waiters.values()),
+        }
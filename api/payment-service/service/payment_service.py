@@ -1,56 +1,73 @@
 from fastapi import HTTPException
-import requests
+import asyncio
+import hashlib
+import math
+import os
+import time
 import uuid
-from datetime import datetime, timezone
-from ..models.payment_model import Payment, PaymentCreate, PaymentStatus, PaymentMethod
+from datetime import datetime, timedelta, timezone
+from common.sqlite_pool import run_blocking
+from common.tracing import span
+from common.user_client import UserServiceClient
+from ..models.payment_model import (
+    DriverEarningsSummary, Payment, PaymentBatchItem, PaymentCreate, PaymentPage, PaymentStatus, PaymentMethod,
+)
+from ..repository.payment_repository import (
+    InvalidCursorError, PaymentRepository, build_driver_earnings, create_payment_repository, replay_ledger,
+)
+from .idempotency import IdempotencyKeyReusedError, IdempotencyStore
+from .payment_processor import PaymentProcessor, create_payment_processor
+from .payment_queue import PaymentQueue, PaymentQueueFullError
 
-USER_SERVICE_URL = "http://localhost:8000"
 RIDE_SERVICE_URL = "http://localhost:8001"
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+MAX_BATCH_SIZE = 1000
+# "sync" charges the payment inside the request; "async" queues it unless the client asks otherwise
+PAYMENT_PROCESSING_MODE = os.getenv("PAYMENT_PROCESSING_MODE", "sync")
+MAX_PAYMENT_WAIT_SECONDS = 30.0
+# A long poll re-reads the payment at least this often, so it also sees
+# payments finished by another service process
+PAYMENT_WAIT_POLL_SECONDS = 1.0
 
 class PaymentService:
-    def __init__(self):
-        self.payments = {}
-        self.rider_balances = {}
-        self.driver_balances = {}
+    def __init__(self, user_client: UserServiceClient | None = None, repository: PaymentRepository | None = None,
+                 idempotency: IdempotencyStore | None = None, processor: PaymentProcessor | None = None):
+        self.repository = repository or create_payment_repository()
+        self.user_client = user_client or UserServiceClient()
+        self.idempotency = idempotency or IdempotencyStore()
+        self.processor = processor or create_payment_processor()
+        self.queue = PaymentQueue(self)
     
-    def _validate_user(self, user_id: str, expected_role: str):
-        try:
-            response = requests.get(f"{USER_SERVICE_URL}/users/verify/{user_id}")
-            if response.status_code != 200:
-                raise HTTPException(status_code=500, detail="User service is unavailable")
-            data = response.json()
-            if not data.get("exists"):
-                raise HTTPException(status_code=404, detail=f"{expected_role.capitalize()} not found")
-            elif not data.get("is_logged_in"):
-                raise HTTPException(status_code=401, detail=f"{expected_role.capitalize()} is not logged in")
-            elif data.get("role") != expected_role:
-                raise HTTPException(status_code=403, detail=f"User is not a {expected_role}")
-        except requests.exceptions.RequestException:
-            raise HTTPException(status_code=500, detail="Unable to connect to user service")
-    
-    def process_payment(self, payment_create: PaymentCreate) -> Payment:
-        self._validate_user(payment_create.rider_id, "rider")
-        self._validate_user(payment_create.driver_id, "driver")
+    async def _validate_user(self, user_id: str, expected_role: str, token: str | None = None):
+        data = await self.user_client.verify_user(user_id, token)
+        self._check_verification(data, expected_role)
+
+    async def _validate_rider_and_driver(self, rider_id: str, driver_id: str, tokens: list[str] = ()):
+        # Session tokens are checked locally; anyone left over costs one batched round trip
+        with span("verify rider and driver"):
+            results = await self.user_client.verify_users([rider_id, driver_id], tokens)
+        self._check_verification(results[rider_id], "rider")
+        self._check_verification(results[driver_id], "driver")
+
+    def _check_verification(self, data: dict, expected_role: str):
+        if not data.get("exists"):
+            raise HTTPException(status_code=404, detail=f"{expected_role.capitalize()} not found")
+        elif not data.get("is_logged_in"):
+            raise HTTPException(status_code=401, detail=f"{expected_role.capitalize()} is not logged in")
+        elif data.get("role") != expected_role:
+            raise HTTPException(status_code=403, detail=f"User is not a {expected_role}")
+    
+    async def process_payment(self, payment_create: PaymentCreate, tokens: list[str] = ()) -> Payment:
+        await self._validate_rider_and_driver(payment_create.rider_id, payment_create.driver_id, tokens)
         
-        if payment_create.amount <= 0:
-            raise HTTPException(status_code=400, detail="Payment amount must be greater than 0")
-        
-        transaction_id = f"TXN-{uuid.uuid4()}"
-        payment = Payment(
-            id=str(uuid.uuid4()),
-            ride_id=payment_create.ride_id,
-            rider_id=payment_create.rider_id,
-            driver_id=payment_create.driver_id,
-            amount=payment_create.amount,
-            payment_method=payment_create.payment_method,
-            status=PaymentStatus.PROCESSING,
-            transaction_id=transaction_id,
-            created_at=datetime.now(timezone.utc),
-            updated_at=datetime.now(timezone.utc)
-        )
+        self._check_amount(payment_create)
+        with span("build payment"):
+            payment = self._new_payment(payment_create)
         
         try:
-            self._process_transaction(payment)
+            await self._process_transaction(payment)
             payment.status = PaymentStatus.COMPLETED
             payment.completed_at = datetime.now(timezone.utc)
             payment.updated_at = datetime.now(timezone.utc)
@@ -59,53 +76,283 @@ class PaymentService:
             payment.updated_at = datetime.now(timezone.utc)
             raise HTTPException(status_code=500, detail=f"Payment processing failed: {str(e)}")
         
-        self.payments[payment.id] = payment
+        with span("store payment"):
+            await run_blocking(self.repository, self.repository.add_payment, payment)
         return payment
     
-    def _process_transaction(self, payment: Payment):
-        # Note: In a production system, implement balance checks and wallet management
-        # to prevent negative balances. Currently using simplified transaction tracking.
-        if payment.rider_id not in self.rider_balances:
-            self.rider_balances[payment.rider_id] = 0
+    async def submit_payment(self, payment_create: PaymentCreate, tokens: list[str] = ()) -> Payment:
+        """
+        Validate the payment and store it as PENDING; a queue worker charges
+        it later. Poll get_payment or wait_for_payment for the outcome.
+        """
+        await self._validate_rider_and_driver(payment_create.rider_id, payment_create.driver_id, tokens)
+        
+        self._check_amount(payment_create)
+        if self.queue.full():
+            raise HTTPException(status_code=503, detail="Payment queue is full, try again later", headers={"Retry-After": "1"})
+        payment = self._new_payment(payment_create, PaymentStatus.PENDING)
+        # Stored before it is queued, so a worker always finds it
+        await run_blocking(self.repository, self.repository.add_payment, payment)
+        try:
+            self.queue.enqueue(payment.id)
+        except PaymentQueueFullError:
+            # Filled up while the payment was being stored
+            await run_blocking(self.repository, self.fail_payment, payment, "Payment queue is full")
+            raise HTTPException(status_code=503, detail="Payment queue is full, try again later", headers={"Retry-After": "1"})
+        return payment
+    
+    def start_processing(self, payment_id: str) -> Payment | None:
+        """Claim a pending payment by moving it to PROCESSING, or return None if it is no longer pending."""
+        payment = self.repository.get_payment(payment_id)
+        if payment is None or payment.status != PaymentStatus.PENDING:
+            return None
+        # Another process may be claiming it too; the compare-and-set picks one
+        return self.repository.transition_payment(payment, PaymentStatus.PROCESSING, datetime.now(timezone.utc))
+    
+    def renew_processing(self, payment: Payment) -> Payment | None:
+        """Refresh the claim on a PROCESSING payment, or return None if it was taken back."""
+        return self.repository.transition_payment(payment, PaymentStatus.PROCESSING, datetime.now(timezone.utc))
+    
+    def reclaim_payments(self, lease_seconds: float) -> list[str]:
+        """
+        Take back PROCESSING payments whose claim is older than lease_seconds
+        and return the ids of every PENDING payment, oldest first.
+        """
+        now = datetime.now(timezone.utc)
+        # The charge may or may not have gone through; the processor sees the
+        # same payment id again when it is retried
+        return [payment.id for payment in self.repository.reclaim_payments(now - timedelta(seconds=lease_seconds), now)]
+    
+    def complete_payment(self, payment: Payment, transaction_id: str) -> Payment | None:
+        """Mark a claimed payment COMPLETED and apply its transfer, or return None if the claim was lost."""
+        return self.repository.complete_payment(payment, transaction_id, datetime.now(timezone.utc))
+    
+    def fail_payment(self, payment: Payment, reason: str) -> Payment | None:
+        return self.repository.transition_payment(payment, PaymentStatus.FAILED, datetime.now(timezone.utc), reason)
+    
+    def _check_amount(self, payment_create: PaymentCreate):
+        if payment_create.amount <= 0:
+            raise HTTPException(status_code=400, detail="Payment amount must be greater than 0")
+    
+    def _new_payment(self, payment_create: PaymentCreate, status: PaymentStatus = PaymentStatus.PROCESSING) -> Payment:
+        now = datetime.now(timezone.utc)
+        # Every field comes from an already validated PaymentCreate
+        return Payment.model_construct(
+            id=str(uuid.uuid4()),
+            ride_id=payment_create.ride_id,
+            rider_id=payment_create.rider_id,
+            driver_id=payment_create.driver_id,
+            amount=payment_create.amount,
+            payment_method=payment_create.payment_method,
+            status=status,
+            transaction_id=None,
+            created_at=now,
+            updated_at=now,
+            completed_at=None,
+            failure_reason=None
+        )
+    
+    async def process_payment_batch(self, payment_creates: list[PaymentCreate], tokens: list[str] = ()) -> list[PaymentBatchItem]:
+        """
+        Process many payments with one verification of every distinct rider
+        and driver and one ledger write. Each item succeeds or fails on its
+        own; the results are in the same order as the input.
+        """
+        if len(payment_creates) > MAX_BATCH_SIZE:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} payments can be processed per request")
+        user_ids = [user_id for payment_create in payment_creates for user_id in (payment_create.rider_id, payment_create.driver_id)]
+        verified = await self.user_client.verify_users(user_ids, tokens)
         
-        self.rider_balances[payment.rider_id] -= payment.amount
+        results: list[PaymentBatchItem | None] = [None] * len(payment_creates)
+        accepted: list[tuple[int, Payment]] = []
+        ride_ids = set()
+        for index, payment_create in enumerate(payment_creates):
+            try:
+                self._check_verification(verified[payment_create.rider_id], "rider")
+                self._check_verification(verified[payment_create.driver_id], "driver")
+                self._check_amount(payment_create)
+                # A settlement job re-sending a ride must not charge it twice
+                if payment_create.ride_id in ride_ids:
+                    raise HTTPException(status_code=409, detail="Ride is already paid earlier in this batch")
+            except HTTPException as e:
+                results[index] = PaymentBatchItem(index=index, status_code=e.status_code, detail=e.detail)
+                continue
+            ride_ids.add(payment_create.ride_id)
+            accepted.append((index, self._new_payment(payment_create)))
         
-        if payment.driver_id not in self.driver_balances:
-            self.driver_balances[payment.driver_id] = 0
+        charges = await asyncio.gather(*(self.processor.charge(payment) for _, payment in accepted), return_exceptions=True)
+        charged = []
+        for (index, payment), charge in zip(accepted, charges):
+            if isinstance(charge, Exception):
+                results[index] = PaymentBatchItem(index=index, status_code=500, detail=f"Payment processing failed: {str(charge)}")
+            else:
+                payment.transaction_id = charge
+                charged.append((index, payment))
+        accepted = charged
         
-        self.driver_balances[payment.driver_id] += payment.amount
+        payments = [payment for _, payment in accepted]
+        try:
+            await run_blocking(self.repository, self.repository.apply_transfers, [
+                (payment.id, payment.rider_id, payment.driver_id, payment.amount) for payment in payments
+            ])
+        except Exception as e:
+            for index, _ in accepted:
+                results[index] = PaymentBatchItem(index=index, status_code=500, detail=f"Payment processing failed: {str(e)}")
+            return results
+        completed_at = datetime.now(timezone.utc)
+        for payment in payments:
+            payment.status = PaymentStatus.COMPLETED
+            payment.completed_at = completed_at
+            payment.updated_at = completed_at
+        await run_blocking(self.repository, self.repository.add_payments, payments)
+        for index, payment in accepted:
+            results[index] = PaymentBatchItem(index=index, status_code=200, payment=payment)
+        return results
+    
+    async def process_payment_once(self, payment_create: PaymentCreate, idempotency_key: str,
+                                   tokens: list[str] = (), respond_async: bool = False) -> tuple[Payment, bool]:
+        """
+        Process the payment unless this key already did; returns (payment, replayed).
+        A retry gets the original payment back without verifying anyone or
+        touching the ledger again.
+        """
+        if not idempotency_key or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1 to {MAX_IDEMPOTENCY_KEY_LENGTH} characters")
+        fingerprint = hashlib.sha256(payment_create.model_dump_json().encode("utf-8")).hexdigest()
+        process = self.submit_payment if respond_async else self.process_payment
+        try:
+            return await self.idempotency.run(idempotency_key, fingerprint, lambda: process(payment_create, tokens))
+        except IdempotencyKeyReusedError:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request body")
+    
+    async def _process_transaction(self, payment: Payment):
+        with span("processor charge"):
+            payment.transaction_id = await self.processor.charge(payment)
+        with span("ledger transfer"):
+            await run_blocking(self.repository, self.repository.apply_transfer,
+                               payment.id, payment.rider_id, payment.driver_id, payment.amount)
     
     def get_payment(self, payment_id: str) -> Payment:
-        payment = self.payments.get(payment_id)
+        payment = self.repository.get_payment(payment_id)
         if not payment:
             raise HTTPException(status_code=404, detail="Payment not found")
         return payment
     
-    def get_payment_history(self, user_id: str) -> list[Payment]:
-        user_payments = [
-            payment for payment in self.payments.values()
-            if payment.rider_id == user_id or payment.driver_id == user_id
-        ]
-        return sorted(user_payments, key=lambda x: x.created_at, reverse=True)
+    async def wait_for_payment(self, payment_id: str, wait: float) -> Payment:
+        """Return the payment once it is no longer pending or processing, or after `wait` seconds."""
+        payment = await run_blocking(self.repository, self.get_payment, payment_id)
+        deadline = time.monotonic() + min(wait, MAX_PAYMENT_WAIT_SECONDS)
+        while payment.status in (PaymentStatus.PENDING, PaymentStatus.PROCESSING):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self.queue.wait(payment_id, min(remaining, PAYMENT_WAIT_POLL_SECONDS))
+            payment = await run_blocking(self.repository, self.get_payment, payment_id)
+        return payment
     
-    def get_rider_payments(self, rider_id: str) -> list[Payment]:
-        self._validate_user(rider_id, "rider")
-        rider_payments = [
-            payment for payment in self.payments.values()
-            if payment.rider_id == rider_id
-        ]
-        return sorted(rider_payments, key=lambda x: x.created_at, reverse=True)
+    async def refund_payment(self, payment_id: str, token: str | None = None) -> Payment:
+        payment = await run_blocking(self.repository, self.get_payment, payment_id)
+        await self._validate_user(payment.driver_id, "driver", token)
+        if payment.status != PaymentStatus.COMPLETED:
+            raise HTTPException(status_code=400, detail="Only completed payments can be refunded")
+        
+        # The check above only gives the common case a clear error; the
+        # repository's compare-and-set decides between concurrent refunds
+        refunded = await run_blocking(self.repository, self.repository.refund_payment,
+                                      payment.id, datetime.now(timezone.utc))
+        if refunded is None:
+            raise HTTPException(status_code=409, detail="Payment was already refunded")
+        return refunded
     
-    def get_driver_earnings(self, driver_id: str) -> dict:
-        self._validate_user(driver_id, "driver")
-        driver_payments = [
-            payment for payment in self.payments.values()
-            if payment.driver_id == driver_id and payment.status == PaymentStatus.COMPLETED
-        ]
-        total_earnings = sum(payment.amount for payment in driver_payments)
+    def _page(self, list_payments, owner_id: str, limit: int, cursor: str | None) -> PaymentPage:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        try:
+            payments, next_cursor = list_payments(owner_id, limit, cursor)
+        except InvalidCursorError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return PaymentPage(payments=payments, next_cursor=next_cursor)
+    
+    def get_payment_history(self, user_id: str, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> PaymentPage:
+        return self._page(self.repository.list_user_payments, user_id, limit, cursor)
+    
+    async def get_rider_payments(self, rider_id: str, token: str | None = None, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> PaymentPage:
+        await self._validate_user(rider_id, "rider", token)
+        return await run_blocking(self.repository, self._page, self.repository.list_rider_payments, rider_id, limit, cursor)
+    
+    async def get_driver_earnings(self, driver_id: str, token: str | None = None, limit: int = DEFAULT_PAGE_SIZE, cursor: str | None = None) -> dict:
+        await self._validate_user(driver_id, "driver", token)
+        page = await run_blocking(self.repository, self._page, self.repository.list_driver_payments, driver_id, limit, cursor)
+        earnings = await run_blocking(self.repository, self.repository.get_driver_earnings, driver_id)
         return {
             "driver_id": driver_id,
-            "total_earnings": total_earnings,
-            "payment_count": len(driver_payments),
-            "payments": sorted(driver_payments, key=lambda x: x.created_at, reverse=True)
+            "total_earnings": earnings.total_earnings,
+            "payment_count": earnings.payment_count,
+            "payments": page.payments,
+            "next_cursor": page.next_cursor
+        }
+    
+    async def get_driver_earnings_summary(self, driver_id: str, token: str | None = None) -> DriverEarningsSummary:
+        await self._validate_user(driver_id, "driver", token)
+        return await run_blocking(self.repository, self.repository.get_driver_earnings, driver_id)
+    
+    def check_driver_earnings(self) -> dict:
+        """
+        Rebuild every driver's aggregates from the payment log and diff them
+        against the running ones. Payments written while the check runs can
+        show up as transient mismatches.
+        """
+        expected = build_driver_earnings(self.repository.completed_payments())
+        actual = {summary.driver_id: summary for summary in self.repository.list_driver_earnings()}
+        mismatches = []
+        for driver_id in sorted(expected.keys() | actual.keys()):
+            differences = _diff_earnings(
+                expected.get(driver_id) or DriverEarningsSummary(driver_id=driver_id),
+                actual.get(driver_id) or DriverEarningsSummary(driver_id=driver_id),
+            )
+            if differences:
+                mismatches.append({"driver_id": driver_id, "differences": differences})
+        return {
+            "drivers_checked": len(expected.keys() | actual.keys()),
+            "consistent": not mismatches,
+            "mismatches": mismatches
         }
+
+    def check_ledger(self) -> dict:
+        """
+        Replay the ledger from the first entry and diff the result against the
+        stored balances. Transfers committed while the check runs can show up
+        as transient mismatches.
+        """
+        expected = replay_ledger(self.repository.ledger_entries())
+        actual = self.repository.list_balances()
+        mismatches = [
+            {"account": account, "user_id": user_id, "expected": expected.get((account, user_id), 0.0), "actual": actual.get((account, user_id), 0.0)}
+            for account, user_id in sorted(expected.keys() | actual.keys())
+            if not math.isclose(expected.get((account, user_id), 0.0), actual.get((account, user_id), 0.0), abs_tol=1e-6)
+        ]
+        return {
+            "accounts_checked": len(expected.keys() | actual.keys()),
+            "consistent": not mismatches,
+            "mismatches": mismatches
+        }
+
+def _diff_earnings(expected: DriverEarningsSummary, actual: DriverEarningsSummary) -> list[dict]:
+    differences = []
+    if not math.isclose(expected.total_earnings, actual.total_earnings, abs_tol=1e-6):
+        differences.append({"field": "total_earnings", "expected": expected.total_earnings, "actual": actual.total_earnings})
+    if expected.payment_count != actual.payment_count:
+        differences.append({"field": "payment_count", "expected": expected.payment_count, "actual": actual.payment_count})
+    for field in ("daily", "weekly"):
+        expected_buckets = {bucket.start: bucket for bucket in getattr(expected, field)}
+        actual_buckets = {bucket.start: bucket for bucket in getattr(actual, field)}
+        for start in sorted(expected_buckets.keys() | actual_buckets.keys()):
+            want, have = expected_buckets.get(start), actual_buckets.get(start)
+            if (want is None or have is None or want.count != have.count
+                    or not math.isclose(want.total, have.total, abs_tol=1e-6)):
+                differences.append({
+                    "field": field,
+                    "start": start,
+                    "expected": want.model_dump(exclude={"start"}) if want else None,
+                    "actual": have.model_dump(exclude={"start"}) if have else None
+                })
+    return differences
@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+from .ride_request_controller import rideService
+
+router = APIRouter(prefix="/dispatch", tags=["dispatch"])
+
+@router.post("/tick")
+async def run_dispatch_tick():
+    # Run one batch dispatch now, independent of DISPATCH_TICK_SECONDS
+    stats = await rideService.dispatcher.tick()
+    return {
+        "message": "Dispatch tick completed",
+        "tick": stats
+    }
+
+@router.get("/stats")
+async def dispatch_stats():
+    return rideService.dispatcher.summary()
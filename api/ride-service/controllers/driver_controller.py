@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Header, Query
+from common.session_tokens import bearer_token
+from ..models.ride_model import DriverLocationUpdate
+from ..service.ride_service import RIDE_OFFER_DRIVERS, RIDE_OFFER_RADIUS_KM
+from .ride_request_controller import rideService
+
+router = APIRouter(prefix="/drivers", tags=["drivers"])
+
+@router.post("/{driver_id}/location")
+async def update_driver_location(driver_id: str, update: DriverLocationUpdate, authorization: str | None = Header(default=None)):
+    # Heartbeat: drivers send their position every few seconds while online
+    driver_status = await rideService.update_driver_location(driver_id, update, bearer_token(authorization))
+    return {
+        "message": "Driver location updated successfully",
+        "driver_status": driver_status
+    }
+
+@router.get("/nearby")
+async def find_nearby_drivers(
+    latitude: float = Query(ge=-90, le=90),
+    longitude: float = Query(ge=-180, le=180),
+    k: int = Query(default=RIDE_OFFER_DRIVERS, ge=1, le=100),
+    radius_km: float = Query(default=RIDE_OFFER_RADIUS_KM, gt=0, le=100),
+):
+    drivers = rideService.find_nearby_drivers(latitude, longitude, k, radius_km)
+    return {
+        "message": "Nearby drivers retrieved successfully",
+        "drivers": drivers
+    }
@@ -1,42 +1,94 @@
-from fastapi import APIRouter
+import logging
+from fastapi import APIRouter, Header, Query
+from fastapi.responses import StreamingResponse
+from common.session_tokens import bearer_token
+from common.sqlite_pool import run_blocking
 from ..models.ride_model import RideRequestCreate
-from ..service.ride_service import RideService
+from ..service.ride_service import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, RideService
 
 router = APIRouter(prefix="/ride-requests", tags=["ride-requests"])
 rideService = RideService()  # Placeholder for ride service instance
+logger = logging.getLogger(__name__)
 
 @router.post("/create")
-def create_ride_request(ride_request: RideRequestCreate):
+async def create_ride_request(ride_request: RideRequestCreate, authorization: str | None = Header(default=None)):
     # Placeholder logic for creating a ride request
-    print("Creating ride request...", ride_request)
-    ride_request = rideService.create_ride_request(ride_request)
+    ride_request = await rideService.create_ride_request(ride_request, bearer_token(authorization))
+    logger.debug("Created ride request %s for rider %s", ride_request.id, ride_request.user_id)
+    offers = rideService.offer_ride_request(ride_request)
     return {
         "message": "Ride request created successfully",
-        "ride_request_details": ride_request
+        "ride_request_details": ride_request,
+        "offered_to": offers
+    }
+
+@router.get("/open")
+async def get_open_ride_requests(
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: int | None = None,
+    since: int | None = None,
+):
+    # Drivers list the open requests page by page, then poll with `since`
+    # set to the returned `seq` to get only the requests opened or removed after it
+    open_ride_requests = await run_blocking(rideService.repository, rideService.get_open_ride_requests, limit, cursor, since)
+    return {
+        "message": "Open ride requests retrieved successfully",
+        **open_ride_requests.model_dump()
     }
 
+@router.post("/events/ticket")
+async def issue_ride_events_ticket(user_id: str, authorization: str | None = Header(default=None)):
+    return await rideService.issue_events_ticket(user_id, bearer_token(authorization))
+
+@router.get("/events")
+async def stream_ride_events(
+    user_id: str,
+    ticket: str | None = None,
+    types: str | None = None,
+    authorization: str | None = Header(default=None),
+):
+    # Server-Sent Events. Browsers' EventSource can't set headers, so they
+    # pass a short-lived `ticket` from POST /events/ticket instead of the
+    # session token. Riders get events about their own requests, drivers
+    # also get every request opening or closing.
+    subscription = await rideService.subscribe_events(
+        user_id,
+        bearer_token(authorization),
+        [event_type.strip() for event_type in types.split(",")] if types else None,
+        ticket,
+    )
+    return StreamingResponse(
+        rideService.events.stream(subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/events/stats")
+async def ride_event_stats():
+    return rideService.events.stats()
+
 @router.post("/cancel_request/{ride_request_id}")
-def cancel_ride_request(ride_request_id: str, user_id: str):
+async def cancel_ride_request(ride_request_id: str, user_id: str):
     # Placeholder logic for cancelling a ride request
-    ride_request = rideService.cancel_ride_request(ride_request_id, user_id)
+    ride_request = await rideService.cancel_ride_request(ride_request_id, user_id)
     return {
         "message": "Ride request cancelled successfully",
         "ride_request_details": ride_request
     }
 
 @router.post("/accept_ride/{ride_request_id}")
-def accept_ride_request(ride_request_id: str, driver_id: str):
+async def accept_ride_request(ride_request_id: str, driver_id: str, authorization: str | None = Header(default=None)):
     # Placeholder logic for accepting a ride request
-    ride_request = rideService.accept_ride_request(ride_request_id, driver_id)
+    ride_request = await rideService.accept_ride_request(ride_request_id, driver_id, bearer_token(authorization))
     return {
         "message": "Ride request accepted successfully",
         "ride_details": ride_request
     }
 
 @router.post("/cancel_ride/{ride_request_id}")
-def cancel_ride_request_by_driver(ride_request_id: str, driver_id: str, ride_id: str):
+async def cancel_ride_request_by_driver(ride_request_id: str, driver_id: str, ride_id: str, authorization: str | None = Header(default=None)):
     # Placeholder logic for cancelling a ride
-    ride = rideService.cancel_ride_request_by_driver(ride_request_id, driver_id, ride_id)
+    ride = await rideService.cancel_ride_request_by_driver(ride_request_id, driver_id, ride_id, bearer_token(authorization))
     return {
         "message": "Ride Request cancelled successfully",
         "ride_details": ride
@@ -1,8 +1,30 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from .controllers import ride_request_controller
+from common.user_events import create_user_events_router
+from common.metrics import MetricsMiddleware, create_metrics_router
+from common.tracing import TracingMiddleware, create_debug_traces_router
+from common.profiling import ProfilingMiddleware, create_debug_profile_router
+from .controllers import dispatch_controller, driver_controller, ride_request_controller
+from .service.dispatcher import DISPATCH_TICK_SECONDS
 
-app = FastAPI(title="Ride Service API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    user_client = ride_request_controller.rideService.user_client
+    revocation_sync = asyncio.create_task(user_client.run_revocation_sync())
+    event_heartbeat = asyncio.create_task(ride_request_controller.rideService.events.run_heartbeat())
+    dispatch = None
+    if DISPATCH_TICK_SECONDS > 0:
+        dispatch = asyncio.create_task(ride_request_controller.rideService.dispatcher.run())
+    yield
+    revocation_sync.cancel()
+    event_heartbeat.cancel()
+    if dispatch:
+        dispatch.cancel()
+    await user_client.aclose()
+
+app = FastAPI(title="Ride Service API", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -13,7 +35,23 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, status and in-flight metrics, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Span waterfalls of recent slow requests, served at /debug/traces
+app.add_middleware(TracingMiddleware)
+# Outermost, so a profiled request includes the other middleware; needs PROFILING_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(ride_request_controller.router)
+app.include_router(driver_controller.router)
+app.include_router(dispatch_controller.router)
+app.include_router(create_metrics_router())
+app.include_router(create_debug_traces_router())
+app.include_router(create_debug_profile_router())
+app.include_router(create_user_events_router(
+    ride_request_controller.rideService.user_client.cache,
+    ride_request_controller.rideService.user_client.revocations,
+))
 
 @app.get("/")
 def root():
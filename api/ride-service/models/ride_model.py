@@ -1,5 +1,5 @@
 from datetime import datetime
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 
 class RideRequestStatus(str, Enum):
@@ -18,6 +18,9 @@ class RideRequestCreate(BaseModel):
     user_id: str
     pickup_location: str
     dropoff_location: str
+    # Optional pickup coordinates; when given, nearby drivers are offered the ride
+    pickup_latitude: float | None = Field(default=None, ge=-90, le=90)
+    pickup_longitude: float | None = Field(default=None, ge=-180, le=180)
 
 class RideRequest(BaseModel):
     id: str
@@ -27,6 +30,15 @@ class RideRequest(BaseModel):
     requested_at: datetime
     updated_at: datetime | None = None
     status: RideRequestStatus = RideRequestStatus.REQUESTED
+    pickup_latitude: float | None = None
+    pickup_longitude: float | None = None
+
+class OpenRideRequests(BaseModel):
+    ride_requests: list[RideRequest]
+    removed: list[str] = []  # ids that are no longer open, only set when polling with `since`
+    seq: int  # pass back as `since` to get only what changed after this response
+    next_cursor: int | None = None
+    has_more: bool = False
 
 class DriverStatus(BaseModel):
     driver_id: str
@@ -34,11 +46,37 @@ class DriverStatus(BaseModel):
     current_location: str
     updated_at: datetime
 
+class DriverLocationUpdate(BaseModel):
+    latitude: float = Field(ge=-90, le=90)
+    longitude: float = Field(ge=-180, le=180)
+    is_available: bool = True
+
+class NearbyDriver(BaseModel):
+    driver_id: str
+    distance_km: float
+
 class Ride(BaseModel):
     id: str
     ride_request_id: str
-    driver_id: str
+    driver_id: str | None = None  # cleared when the driver cancels
     start_time: datetime | None = None
     end_time: datetime | None = None
     fare: float | None = None
     status: str  # e.g., "in_progress", "completed", "canceled"
+
+class DispatchTickStats(BaseModel):
+    started_at: datetime
+    pending_requests: int
+    available_drivers: int
+    # Drivers that are among some request's closest, i.e. the cost matrix columns
+    candidate_drivers: int = 0
+    assigned: int = 0
+    solver: str | None = None
+    matrix_ms: float = 0.0
+    solve_ms: float = 0.0
+    total_ms: float = 0.0
+    total_pickup_km: float = 0.0
+    mean_pickup_km: float | None = None
+    # First-come style baseline on the same snapshot; the solver may match more pairs than it
+    greedy_assigned: int | None = None
+    greedy_total_pickup_km: float | None = None
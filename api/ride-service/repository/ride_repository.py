@@ -0,0 +1,382 @@
+import os
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from datetime import datetime
+from common.sqlite_pool import STORAGE_BACKEND, SQLitePool, sqlite_path
+from ..models.ride_model import Ride, RideRequest, RideRequestStatus, RideStatus
+
+# Open/close changes kept for incremental polling of open ride requests
+RIDE_REQUEST_CHANGELOG_SIZE = int(os.getenv("RIDE_REQUEST_CHANGELOG_SIZE", "10000"))
+# Locks guarding ride request state transitions in the in-memory backend
+RIDE_REQUEST_LOCK_STRIPES = int(os.getenv("RIDE_REQUEST_LOCK_STRIPES", "64"))
+
+class ChangelogExpiredError(ValueError):
+    """The requested sequence number is older than the retained changelog."""
+
+def _is_open(ride_request: RideRequest) -> bool:
+    return ride_request.status == RideRequestStatus.REQUESTED
+
+class RideRepository(ABC):
+    """Ride storage.
+
+    Ride requests in the REQUESTED state are also kept in an open index.
+    Every time a request enters or leaves it the repository assigns the
+    next sequence number, so pollers can list the open requests once and
+    then ask only for what changed since the sequence number they saw.
+    """
+
+    # Whether calls can block on I/O or locks; async code then makes them through run_blocking
+    blocking = False
+
+    @abstractmethod
+    def get_ride_request(self, ride_request_id: str) -> RideRequest | None: ...
+
+    @abstractmethod
+    def add_ride_request(self, ride_request: RideRequest): ...
+
+    @abstractmethod
+    def save_ride_request(self, ride_request: RideRequest): ...
+
+    @abstractmethod
+    def transition_ride_request(self, ride_request_id: str, expected: RideRequestStatus, status: RideRequestStatus,
+                                updated_at: datetime) -> RideRequest | None:
+        """Compare-and-set the request's status.
+
+        Moves the request to `status` only if it is currently in `expected`
+        and returns the updated request, or None when it is missing or
+        another caller changed it first. Of any number of concurrent
+        callers making the same transition, exactly one wins.
+        """
+
+    @abstractmethod
+    def get_ride(self, ride_id: str) -> Ride | None: ...
+
+    @abstractmethod
+    def add_ride(self, ride: Ride): ...
+
+    @abstractmethod
+    def save_ride(self, ride: Ride): ...
+
+    @abstractmethod
+    def cancel_ride(self, ride_id: str, driver_id: str) -> Ride | None:
+        """Compare-and-set the driver's assigned ride to canceled, clearing its driver.
+
+        Returns the canceled ride, or None when it is missing, no longer
+        DRIVER_ASSIGNED, or assigned to another driver.
+        """
+
+    @abstractmethod
+    def list_open_ride_requests(self, limit: int, after_seq: int = 0) -> list[tuple[int, RideRequest]]:
+        """Open requests with an open sequence number above after_seq, oldest first."""
+
+    @abstractmethod
+    def ride_request_changes(self, since: int, limit: int) -> list[tuple[int, str, bool]]:
+        """(seq, ride request id, opened) changes after since, oldest first.
+
+        Raises ChangelogExpiredError when changes after since were already
+        dropped from the changelog.
+        """
+
+    @abstractmethod
+    def get_open_ride_requests(self, ride_request_ids: list[str]) -> list[RideRequest]:
+        """The subset of the given requests that is currently open."""
+
+    @abstractmethod
+    def ride_request_seq(self) -> int:
+        """Sequence number of the latest change."""
+
+
+class InMemoryRideRepository(RideRepository):
+    def __init__(self):
+        self.ride_requests = {}
+        self.rides = {}
+        # ride request id -> open seq, plus [(open seq, id), ...] in ascending order
+        self._open: dict[str, int] = {}
+        self._open_entries: list[tuple[int, str]] = []
+        # Every seq gets exactly one change, so change `seq` sits at
+        # index seq - self._changes[0][0]
+        self._changes: list[tuple[int, str, bool]] = []
+        self._seq = 0
+        self._lock = threading.Lock()
+        # Transitions on different requests rarely share a stripe, so they
+        # don't wait on each other; _lock only covers the index bookkeeping
+        self._stripes = [threading.Lock() for _ in range(RIDE_REQUEST_LOCK_STRIPES)]
+
+    def get_ride_request(self, ride_request_id: str) -> RideRequest | None:
+        return self.ride_requests.get(ride_request_id)
+
+    def transition_ride_request(self, ride_request_id: str, expected: RideRequestStatus, status: RideRequestStatus,
+                                updated_at: datetime) -> RideRequest | None:
+        with self._stripes[zlib.crc32(ride_request_id.encode()) % len(self._stripes)]:
+            current = self.ride_requests.get(ride_request_id)
+            if current is None or current.status != expected:
+                return None
+            # A copy, so readers holding the old object never see a half-made change
+            updated = current.model_copy(update={"status": status, "updated_at": updated_at})
+            self.save_ride_request(updated)
+            return updated
+
+    def add_ride_request(self, ride_request: RideRequest):
+        self.save_ride_request(ride_request)
+
+    def save_ride_request(self, ride_request: RideRequest):
+        with self._lock:
+            self.ride_requests[ride_request.id] = ride_request
+            # The open index is what the changelog has recorded so far, so
+            # it decides whether this save opens or closes the request
+            was_open = ride_request.id in self._open
+            if was_open == _is_open(ride_request):
+                return
+            self._seq += 1
+            if was_open:
+                open_seq = self._open.pop(ride_request.id)
+                del self._open_entries[bisect_right(self._open_entries, (open_seq, ride_request.id)) - 1]
+            else:
+                self._open[ride_request.id] = self._seq
+                self._open_entries.append((self._seq, ride_request.id))
+            self._changes.append((self._seq, ride_request.id, not was_open))
+            if len(self._changes) > 2 * RIDE_REQUEST_CHANGELOG_SIZE:
+                del self._changes[:-RIDE_REQUEST_CHANGELOG_SIZE]
+
+    def get_ride(self, ride_id: str) -> Ride | None:
+        return self.rides.get(ride_id)
+
+    def add_ride(self, ride: Ride):
+        self.rides[ride.id] = ride
+
+    def save_ride(self, ride: Ride):
+        self.rides[ride.id] = ride
+
+    def cancel_ride(self, ride_id: str, driver_id: str) -> Ride | None:
+        with self._lock:
+            current = self.rides.get(ride_id)
+            if current is None or current.status != RideStatus.DRIVER_ASSIGNED or current.driver_id != driver_id:
+                return None
+            canceled = current.model_copy(update={"status": RideStatus.CANCELED, "driver_id": None})
+            self.rides[ride_id] = canceled
+            return canceled
+
+    def list_open_ride_requests(self, limit: int, after_seq: int = 0) -> list[tuple[int, RideRequest]]:
+        with self._lock:
+            start = bisect_right(self._open_entries, (after_seq, "\uffff"))
+            return [(seq, self.ride_requests[ride_request_id]) for seq, ride_request_id in self._open_entries[start:start + limit]]
+
+    def ride_request_changes(self, since: int, limit: int) -> list[tuple[int, str, bool]]:
+        with self._lock:
+            # A seq from before a restart is ahead of ours and just as unusable
+            if since > self._seq or (self._changes and since + 1 < self._changes[0][0]):
+                raise ChangelogExpiredError(since)
+            if not self._changes:
+                return []
+            first = self._changes[0][0]
+            start = since + 1 - first
+            return self._changes[start:start + limit]
+
+    def get_open_ride_requests(self, ride_request_ids: list[str]) -> list[RideRequest]:
+        with self._lock:
+            return [self.ride_requests[ride_request_id] for ride_request_id in ride_request_ids if ride_request_id in self._open]
+
+    def ride_request_seq(self) -> int:
+        return self._seq
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ride_requests (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    pickup_location TEXT NOT NULL,
+    dropoff_location TEXT NOT NULL,
+    requested_at TEXT NOT NULL,
+    updated_at TEXT,
+    status TEXT NOT NULL,
+    pickup_latitude REAL,
+    pickup_longitude REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ride_requests_user_id ON ride_requests (user_id, requested_at);
+CREATE INDEX IF NOT EXISTS idx_ride_requests_status ON ride_requests (status, requested_at);
+CREATE TABLE IF NOT EXISTS rides (
+    id TEXT PRIMARY KEY,
+    ride_request_id TEXT NOT NULL,
+    driver_id TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    fare REAL,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_rides_ride_request_id ON rides (ride_request_id);
+CREATE INDEX IF NOT EXISTS idx_rides_driver_id ON rides (driver_id);
+CREATE INDEX IF NOT EXISTS idx_rides_status ON rides (status);
+CREATE TABLE IF NOT EXISTS ride_request_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    ride_request_id TEXT NOT NULL,
+    opened INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS open_ride_requests (
+    seq INTEGER PRIMARY KEY,
+    ride_request_id TEXT NOT NULL UNIQUE
+);
+"""
+
+_RIDE_REQUEST_COLUMNS = (
+    "id, user_id, pickup_location, dropoff_location, requested_at, updated_at, status, pickup_latitude, pickup_longitude"
+)
+_RIDE_COLUMNS = "id, ride_request_id, driver_id, start_time, end_time, fare, status"
+
+def _isoformat(value):
+    return value.isoformat() if value else None
+
+class SQLiteRideRepository(RideRepository):
+    blocking = True
+
+    def __init__(self, path: str | None = None):
+        self.pool = SQLitePool(path or sqlite_path("rides.db"), SCHEMA)
+        self.pool.ensure_columns("ride_requests", {"pickup_latitude": "REAL", "pickup_longitude": "REAL"})
+
+    @staticmethod
+    def _ride_request_row(ride_request: RideRequest) -> tuple:
+        return (
+            ride_request.id, ride_request.user_id, ride_request.pickup_location, ride_request.dropoff_location,
+            ride_request.requested_at.isoformat(), _isoformat(ride_request.updated_at), ride_request.status.value,
+            ride_request.pickup_latitude, ride_request.pickup_longitude,
+        )
+
+    @staticmethod
+    def _ride_row(ride: Ride) -> tuple:
+        return (
+            ride.id, ride.ride_request_id, ride.driver_id, _isoformat(ride.start_time),
+            _isoformat(ride.end_time), ride.fare, RideStatus(ride.status).value,
+        )
+
+    def get_ride_request(self, ride_request_id: str) -> RideRequest | None:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {_RIDE_REQUEST_COLUMNS} FROM ride_requests WHERE id = ?", (ride_request_id,)).fetchone()
+        return RideRequest(**dict(row)) if row else None
+
+    def add_ride_request(self, ride_request: RideRequest):
+        with self.pool.transaction() as conn:
+            conn.execute(
+                f"INSERT INTO ride_requests ({_RIDE_REQUEST_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                self._ride_request_row(ride_request),
+            )
+            self._update_open_index(conn, ride_request)
+
+    def save_ride_request(self, ride_request: RideRequest):
+        row = self._ride_request_row(ride_request)
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "UPDATE ride_requests SET user_id = ?, pickup_location = ?, dropoff_location = ?, requested_at = ?,"
+                " updated_at = ?, status = ?, pickup_latitude = ?, pickup_longitude = ? WHERE id = ?",
+                row[1:] + row[:1],
+            )
+            self._update_open_index(conn, ride_request)
+
+    def transition_ride_request(self, ride_request_id: str, expected: RideRequestStatus, status: RideRequestStatus,
+                                updated_at: datetime) -> RideRequest | None:
+        with self.pool.transaction() as conn:
+            # The status in the WHERE clause makes this the compare-and-set;
+            # the write lock taken by BEGIN IMMEDIATE orders competing workers
+            updated = conn.execute(
+                "UPDATE ride_requests SET status = ?, updated_at = ? WHERE id = ? AND status = ?",
+                (status.value, updated_at.isoformat(), ride_request_id, expected.value),
+            ).rowcount
+            if not updated:
+                return None
+            row = conn.execute(f"SELECT {_RIDE_REQUEST_COLUMNS} FROM ride_requests WHERE id = ?", (ride_request_id,)).fetchone()
+            ride_request = RideRequest(**dict(row))
+            self._update_open_index(conn, ride_request)
+        return ride_request
+
+    @staticmethod
+    def _update_open_index(conn, ride_request: RideRequest):
+        was_open = conn.execute("SELECT 1 FROM open_ride_requests WHERE ride_request_id = ?", (ride_request.id,)).fetchone() is not None
+        is_open = _is_open(ride_request)
+        if was_open == is_open:
+            return
+        seq = conn.execute(
+            "INSERT INTO ride_request_changes (ride_request_id, opened) VALUES (?, ?)", (ride_request.id, int(is_open))
+        ).lastrowid
+        if is_open:
+            conn.execute("INSERT INTO open_ride_requests (seq, ride_request_id) VALUES (?, ?)", (seq, ride_request.id))
+        else:
+            conn.execute("DELETE FROM open_ride_requests WHERE ride_request_id = ?", (ride_request.id,))
+        conn.execute("DELETE FROM ride_request_changes WHERE seq <= ?", (seq - RIDE_REQUEST_CHANGELOG_SIZE,))
+
+    def get_ride(self, ride_id: str) -> Ride | None:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {_RIDE_COLUMNS} FROM rides WHERE id = ?", (ride_id,)).fetchone()
+        return Ride(**dict(row)) if row else None
+
+    def add_ride(self, ride: Ride):
+        with self.pool.transaction() as conn:
+            conn.execute(f"INSERT INTO rides ({_RIDE_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)", self._ride_row(ride))
+
+    def save_ride(self, ride: Ride):
+        row = self._ride_row(ride)
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "UPDATE rides SET ride_request_id = ?, driver_id = ?, start_time = ?, end_time = ?, fare = ?,"
+                " status = ? WHERE id = ?",
+                row[1:] + row[:1],
+            )
+
+    def cancel_ride(self, ride_id: str, driver_id: str) -> Ride | None:
+        with self.pool.transaction() as conn:
+            updated = conn.execute(
+                "UPDATE rides SET status = ?, driver_id = NULL WHERE id = ? AND status = ? AND driver_id = ?",
+                (RideStatus.CANCELED.value, ride_id, RideStatus.DRIVER_ASSIGNED.value, driver_id),
+            ).rowcount
+            if not updated:
+                return None
+            row = conn.execute(f"SELECT {_RIDE_COLUMNS} FROM rides WHERE id = ?", (ride_id,)).fetchone()
+        return Ride(**dict(row))
+
+    def list_open_ride_requests(self, limit: int, after_seq: int = 0) -> list[tuple[int, RideRequest]]:
+        columns = ", ".join(f"r.{column}" for column in _RIDE_REQUEST_COLUMNS.split(", "))
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT o.seq, {columns} FROM open_ride_requests o JOIN ride_requests r ON r.id = o.ride_request_id"
+                " WHERE o.seq > ? ORDER BY o.seq LIMIT ?",
+                (after_seq, limit),
+            ).fetchall()
+        return [(row["seq"], RideRequest(**{key: row[key] for key in row.keys() if key != "seq"})) for row in rows]
+
+    def ride_request_changes(self, since: int, limit: int) -> list[tuple[int, str, bool]]:
+        with self.pool.connection() as conn:
+            seq = self._seq(conn)
+            # Each write prunes changes at or below its seq minus the changelog size
+            if since > seq or since < seq - RIDE_REQUEST_CHANGELOG_SIZE:
+                raise ChangelogExpiredError(since)
+            rows = conn.execute(
+                "SELECT seq, ride_request_id, opened FROM ride_request_changes WHERE seq > ? ORDER BY seq LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [(row["seq"], row["ride_request_id"], bool(row["opened"])) for row in rows]
+
+    def get_open_ride_requests(self, ride_request_ids: list[str]) -> list[RideRequest]:
+        if not ride_request_ids:
+            return []
+        columns = ", ".join(f"r.{column}" for column in _RIDE_REQUEST_COLUMNS.split(", "))
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"SELECT {columns} FROM open_ride_requests o JOIN ride_requests r ON r.id = o.ride_request_id"
+                f" WHERE o.ride_request_id IN ({', '.join('?' * len(ride_request_ids))}) ORDER BY o.seq",
+                ride_request_ids,
+            ).fetchall()
+        return [RideRequest(**dict(row)) for row in rows]
+
+    @staticmethod
+    def _seq(conn) -> int:
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ride_request_changes'").fetchone()
+        return row[0] if row else 0
+
+    def ride_request_seq(self) -> int:
+        with self.pool.connection() as conn:
+            return self._seq(conn)
+
+
+def create_ride_repository() -> RideRepository:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteRideRepository()
+    return InMemoryRideRepository()
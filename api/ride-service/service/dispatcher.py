@@ -0,0 +1,233 @@
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime, timezone
+import numpy as np
+from common.sqlite_pool import run_blocking
+from ..models.ride_model import DispatchTickStats
+from .driver_locations import EARTH_RADIUS_KM, DriverLocationIndex
+
+# Seconds between batch dispatch ticks; 0 leaves matching to drivers accepting requests
+DISPATCH_TICK_SECONDS = float(os.getenv("DISPATCH_TICK_SECONDS", "0"))
+# "hungarian" (optimal), "greedy" (closest pair first) or "auto"
+DISPATCH_SOLVER = os.getenv("DISPATCH_SOLVER", "auto")
+# Under "auto", use the Hungarian solver while the smaller side is at most this big
+DISPATCH_HUNGARIAN_MAX = int(os.getenv("DISPATCH_HUNGARIAN_MAX", "200"))
+DISPATCH_MAX_REQUESTS = int(os.getenv("DISPATCH_MAX_REQUESTS", "1000"))
+DISPATCH_MAX_PICKUP_KM = float(os.getenv("DISPATCH_MAX_PICKUP_KM", "10"))
+# Closest drivers each request is matched against, so the cost matrix stays
+# the same size however big the fleet gets
+DISPATCH_CANDIDATE_DRIVERS = int(os.getenv("DISPATCH_CANDIDATE_DRIVERS", "10"))
+DISPATCH_STATS_HISTORY = int(os.getenv("DISPATCH_STATS_HISTORY", "100"))
+
+# Cost of a pair that must not be matched; finite so the solver arithmetic stays exact
+_INFEASIBLE = 1e9
+
+
+def distance_matrix(request_lat, request_lon, driver_lat, driver_lon) -> np.ndarray:
+    """Great-circle km between every request (rows) and driver (columns)."""
+    lat1 = np.radians(np.asarray(request_lat, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(request_lon, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(driver_lat, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(driver_lon, dtype=float))[None, :]
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def solve_greedy(cost: np.ndarray, max_cost: float = np.inf) -> list[tuple[int, int]]:
+    """Repeatedly match the cheapest remaining pair. Fast, usually within a few percent of optimal."""
+    rows, cols = np.nonzero(cost <= max_cost)
+    return solve_greedy_sparse(rows, cols, cost[rows, cols], cost.shape)
+
+
+def solve_greedy_sparse(rows: np.ndarray, cols: np.ndarray, costs: np.ndarray,
+                        shape: tuple[int, int]) -> list[tuple[int, int]]:
+    """solve_greedy over only the given (row, col, cost) candidate pairs."""
+    order = np.argsort(costs, kind="stable")
+    row_used = np.zeros(shape[0], dtype=bool)
+    col_used = np.zeros(shape[1], dtype=bool)
+    pairs = []
+    limit = min(shape)
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if not row_used[row] and not col_used[col]:
+            row_used[row] = col_used[col] = True
+            pairs.append((row, col))
+            if len(pairs) == limit:
+                break
+    return pairs
+
+
+def solve_hungarian(cost: np.ndarray, max_cost: float = np.inf) -> list[tuple[int, int]]:
+    """Minimum-total-cost assignment (shortest augmenting paths, O(n^2 m)).
+
+    Each row is added with one augmenting path whose inner loop over columns
+    runs in NumPy. Pairs costlier than max_cost are excluded from the result.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    work = np.where(cost <= max_cost, cost, _INFEASIBLE)
+    if transposed:
+        work = work.T
+    n, m = work.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    # p[j]: row (1-based) matched to column j; column 0 is the virtual start
+    p = np.zeros(m + 1, dtype=np.int64)
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            reduced = work[i0 - 1] - u[i0] - v[1:]
+            better = free & (reduced < minv[1:])
+            minv[1:][better] = reduced[better]
+            way[1:][better] = j0
+            candidates = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(candidates)) + 1
+            delta = candidates[j1 - 1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[1:][free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    pairs = []
+    for col in range(1, m + 1):
+        if p[col]:
+            row, column = int(p[col]) - 1, col - 1
+            if transposed:
+                row, column = column, row
+            if cost[row, column] <= max_cost:
+                pairs.append((row, column))
+    return pairs
+
+
+class BatchDispatcher:
+    """Matches open ride requests to available drivers in batches.
+
+    Every tick takes the open requests that have pickup coordinates and a
+    snapshot of the drivers in the location index, narrows each request to
+    its closest drivers, and assigns them so the total pickup distance is
+    minimal (or close to it with the greedy solver). Everything after the
+    snapshot runs in a worker thread. Per-tick latency and quality figures
+    are kept for GET /dispatch/stats.
+    """
+
+    def __init__(self, ride_service, solver: str = DISPATCH_SOLVER, max_pickup_km: float = DISPATCH_MAX_PICKUP_KM,
+                 max_requests: int = DISPATCH_MAX_REQUESTS, candidate_drivers: int = DISPATCH_CANDIDATE_DRIVERS):
+        self.ride_service = ride_service
+        self.solver = solver
+        self.max_pickup_km = max_pickup_km
+        self.max_requests = max_requests
+        self.candidate_drivers = candidate_drivers
+        self.history: deque[DispatchTickStats] = deque(maxlen=DISPATCH_STATS_HISTORY)
+
+    def _choose_solver(self, shape: tuple[int, int]) -> str:
+        if self.solver == "auto":
+            return "hungarian" if min(shape) <= DISPATCH_HUNGARIAN_MAX else "greedy"
+        return self.solver
+
+    def _plan(self, pending: list, drivers: list[tuple[str, float, float]], stats: DispatchTickStats):
+        """Pairs to assign as (request, driver id, km), from a snapshot; runs in a worker thread."""
+        matrix_start = time.perf_counter()
+        # A private index over the snapshot: the live one keeps taking heartbeats on the loop
+        index = DriverLocationIndex()
+        for driver_id, lat, lon in drivers:
+            index.update(driver_id, lat, lon)
+        columns: dict[str, int] = {}
+        rows, cols, costs = [], [], []
+        for row, ride_request in enumerate(pending):
+            for driver_id, km in index.nearest(ride_request.pickup_latitude, ride_request.pickup_longitude,
+                                               self.candidate_drivers, self.max_pickup_km):
+                if km <= self.max_pickup_km:
+                    rows.append(row)
+                    cols.append(columns.setdefault(driver_id, len(columns)))
+                    costs.append(km)
+        stats.candidate_drivers = len(columns)
+        if not columns:
+            stats.matrix_ms = (time.perf_counter() - matrix_start) * 1000
+            return []
+        rows, cols, costs = np.array(rows), np.array(cols), np.array(costs)
+        shape = (len(pending), len(columns))
+        stats.solver = self._choose_solver(shape)
+        cost = None
+        if stats.solver == "hungarian":
+            cost = np.full(shape, np.inf)
+            cost[rows, cols] = costs
+        solve_start = time.perf_counter()
+        if cost is not None:
+            pairs = solve_hungarian(cost, self.max_pickup_km)
+        else:
+            pairs = solve_greedy_sparse(rows, cols, costs, shape)
+        solve_end = time.perf_counter()
+        stats.matrix_ms = (solve_start - matrix_start) * 1000
+        stats.solve_ms = (solve_end - solve_start) * 1000
+
+        # Greedy is what first-come acceptance approximates at best, so it
+        # is the baseline the batch result is measured against
+        baseline = pairs if cost is None else solve_greedy(cost, self.max_pickup_km)
+        km = dict(zip(zip(rows.tolist(), cols.tolist()), costs.tolist()))
+        stats.greedy_assigned = len(baseline)
+        stats.greedy_total_pickup_km = round(sum(km[pair] for pair in baseline), 3)
+        driver_ids = list(columns)
+        return [(pending[row], driver_ids[col], km[(row, col)]) for row, col in pairs]
+
+    async def tick(self) -> DispatchTickStats:
+        started = time.perf_counter()
+        started_at = datetime.now(timezone.utc)
+        repository = self.ride_service.repository
+        pending = [
+            ride_request
+            for _, ride_request in await run_blocking(repository, repository.list_open_ride_requests, self.max_requests)
+            if ride_request.pickup_latitude is not None and ride_request.pickup_longitude is not None
+        ]
+        drivers = self.ride_service.locations.available()
+        stats = DispatchTickStats(started_at=started_at, pending_requests=len(pending), available_drivers=len(drivers))
+        if not pending or not drivers:
+            stats.total_ms = (time.perf_counter() - started) * 1000
+            self.history.append(stats)
+            return stats
+
+        pairs = await asyncio.to_thread(self._plan, pending, drivers, stats)
+        total = 0.0
+        for ride_request, driver_id, km in pairs:
+            # While the solver ran, a driver may have accepted a ride or gone
+            # offline, and the rider may have cancelled
+            if self.ride_service.locations.get(driver_id) is None:
+                continue
+            if await self.ride_service.assign_ride_request(ride_request, driver_id) is None:
+                continue
+            stats.assigned += 1
+            total += km
+        stats.total_pickup_km = round(total, 3)
+        stats.mean_pickup_km = round(total / stats.assigned, 3) if stats.assigned else None
+        stats.total_ms = (time.perf_counter() - started) * 1000
+        self.history.append(stats)
+        return stats
+
+    async def run(self, interval: float = DISPATCH_TICK_SECONDS):
+        while True:
+            await asyncio.sleep(interval)
+            await self.tick()
+
+    def summary(self) -> dict:
+        ticks = list(self.history)
+        assigned = sum(tick.assigned for tick in ticks)
+        return {
+            "tick_seconds": DISPATCH_TICK_SECONDS,
+            "ticks": len(ticks),
+            "assigned": assigned,
+            "mean_pickup_km": round(sum(tick.total_pickup_km for tick in ticks) / assigned, 3) if assigned else None,
+            "max_tick_ms": round(max((tick.total_ms for tick in ticks), default=0.0), 3),
+            "recent": [tick.model_dump() for tick in reversed(ticks)][:20],
+        }
@@ -0,0 +1,130 @@
+import heapq
+import math
+import os
+import time
+
+# Grid cell size in degrees (0.01 is roughly 1.1 km of latitude)
+DRIVER_GRID_CELL_DEGREES = float(os.getenv("DRIVER_GRID_CELL_DEGREES", "0.01"))
+# Drivers whose last heartbeat is older than this are not offered rides
+DRIVER_LOCATION_TTL_SECONDS = float(os.getenv("DRIVER_LOCATION_TTL_SECONDS", "30"))
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class DriverLocationIndex:
+    """Latest position of every available driver, bucketed into a lat/lon grid.
+
+    An update only touches the driver's entry and, when the driver crosses
+    into another cell, the two cells involved, so heartbeats are O(1).
+    Nearest-driver queries scan rings of cells outward from the pickup and
+    stop as soon as no unvisited cell can hold anyone closer than the k-th
+    driver found so far.
+    """
+
+    def __init__(self, cell_degrees: float = DRIVER_GRID_CELL_DEGREES, ttl_seconds: float = DRIVER_LOCATION_TTL_SECONDS):
+        self.cell_degrees = cell_degrees
+        self.ttl_seconds = ttl_seconds
+        # driver id -> [lat, lon, cell, monotonic time of the last heartbeat]
+        self._drivers: dict[str, list] = {}
+        self._cells: dict[tuple[int, int], set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._drivers)
+
+    def _cell(self, lat: float, lon: float) -> tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def update(self, driver_id: str, lat: float, lon: float, available: bool = True, now: float | None = None):
+        if not available:
+            self.remove(driver_id)
+            return
+        cell = (math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees))
+        entry = self._drivers.get(driver_id)
+        if entry is None:
+            self._drivers[driver_id] = [lat, lon, cell, now or time.monotonic()]
+            self._cells.setdefault(cell, set()).add(driver_id)
+            return
+        if entry[2] != cell:
+            self._discard(entry[2], driver_id)
+            self._cells.setdefault(cell, set()).add(driver_id)
+            entry[2] = cell
+        entry[0] = lat
+        entry[1] = lon
+        entry[3] = now or time.monotonic()
+
+    def remove(self, driver_id: str):
+        entry = self._drivers.pop(driver_id, None)
+        if entry is not None:
+            self._discard(entry[2], driver_id)
+
+    def _discard(self, cell: tuple[int, int], driver_id: str):
+        drivers = self._cells.get(cell)
+        if drivers is not None:
+            drivers.discard(driver_id)
+            if not drivers:
+                del self._cells[cell]
+
+    def get(self, driver_id: str) -> tuple[float, float] | None:
+        entry = self._drivers.get(driver_id)
+        return (entry[0], entry[1]) if entry else None
+
+    def _ring(self, center: tuple[int, int], radius: int):
+        ci, cj = center
+        if radius == 0:
+            yield center
+            return
+        for j in range(cj - radius, cj + radius + 1):
+            yield ci - radius, j
+            yield ci + radius, j
+        for i in range(ci - radius + 1, ci + radius):
+            yield i, cj - radius
+            yield i, cj + radius
+
+    def nearest(self, lat: float, lon: float, k: int, max_distance_km: float, now: float | None = None) -> list[tuple[str, float]]:
+        """Up to k available drivers within max_distance_km, closest first, as (driver id, km)."""
+        cutoff = (now or time.monotonic()) - self.ttl_seconds
+        center = self._cell(lat, lon)
+        # Every cell in ring r is at least (r - 1) cells away; longitude
+        # cells shrink with latitude, so use the narrower of the two sides
+        cell_km = self.cell_degrees * KM_PER_DEGREE * max(math.cos(math.radians(min(abs(lat), 89.0))), 0.01)
+        max_radius = math.ceil(max_distance_km / cell_km) + 1
+        # Rank on an equirectangular approximation (well under 1% off at
+        # city distances) and only compute great-circle distances for the result
+        lon_scale = math.cos(math.radians(lat))
+        max_squared = (max_distance_km / KM_PER_DEGREE) ** 2
+        best: list[tuple[float, str]] = []  # max-heap of the k closest, as (-squared degrees, driver id)
+        stale = []
+        for radius in range(max_radius + 1):
+            if len(best) == k and math.sqrt(-best[0][0]) * KM_PER_DEGREE <= (radius - 1) * cell_km:
+                break
+            for cell in self._ring(center, radius):
+                for driver_id in self._cells.get(cell, ()):
+                    entry = self._drivers[driver_id]
+                    if entry[3] < cutoff:
+                        stale.append(driver_id)
+                        continue
+                    squared = (entry[0] - lat) ** 2 + ((entry[1] - lon) * lon_scale) ** 2
+                    if squared > max_squared:
+                        continue
+                    if len(best) < k:
+                        heapq.heappush(best, (-squared, driver_id))
+                    elif squared < -best[0][0]:
+                        heapq.heapreplace(best, (-squared, driver_id))
+        for driver_id in stale:
+            self.remove(driver_id)
+        return [
+            (driver_id, haversine_km(lat, lon, *self._drivers[driver_id][:2]))
+            for _, driver_id in sorted(best, reverse=True)
+        ]
+
+    def available(self, now: float | None = None) -> list[tuple[str, float, float]]:
+        """Every driver with a fresh heartbeat, as (driver id, lat, lon)."""
+        cutoff = (now or time.monotonic()) - self.ttl_seconds
+        return [(driver_id, entry[0], entry[1]) for driver_id, entry in self._drivers.items() if entry[3] >= cutoff]
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import os
+from collections.abc import AsyncIterator, Iterable
+from dataclasses import dataclass, field
+
+# Events buffered per subscriber before it is considered too slow
+RIDE_EVENT_QUEUE_SIZE = int(os.getenv("RIDE_EVENT_QUEUE_SIZE", "100"))
+# Idle connections get a comment line this often so proxies keep them open
+RIDE_EVENT_HEARTBEAT_SECONDS = float(os.getenv("RIDE_EVENT_HEARTBEAT_SECONDS", "15"))
+
+RIDE_EVENT_TYPES = {
+    "ride_request.created",
+    "ride_request.offered",
+    "ride_request.cancelled",
+    "ride_request.accepted",
+    "ride_request.reopened",
+    "ride.status_changed",
+}
+
+# Sent instead of the events a subscriber could not keep up with; the
+# client should reload whatever it was tracking and reconnect
+_OVERFLOW = "event: overflow\ndata: {}\n\n"
+_KEEPALIVE = ": keepalive\n\n"
+
+
+@dataclass(eq=False)
+class Subscription:
+    user_id: str
+    role: str
+    types: frozenset[str] | None = None
+    queue: asyncio.Queue = field(default_factory=lambda: asyncio.Queue(RIDE_EVENT_QUEUE_SIZE))
+    overflowed: bool = False
+
+    def wants(self, event_type: str) -> bool:
+        return self.types is None or event_type in self.types
+
+
+class RideEventBroker:
+    """Fans ride events out to Server-Sent Events subscribers in this process.
+
+    Subscribers are indexed by user id and by role, so an event only touches
+    the connections in its audience. Publishing never waits on a subscriber:
+    each one has a bounded queue, and one that falls behind gets an overflow
+    event and is disconnected instead of holding up everyone else.
+    """
+
+    def __init__(self):
+        self._by_user: dict[str, set[Subscription]] = {}
+        self._by_role: dict[str, set[Subscription]] = {}
+        self._seq = 0
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, user_id: str, role: str, types: Iterable[str] | None = None) -> Subscription:
+        subscription = Subscription(user_id, role, frozenset(types) if types else None)
+        self._by_user.setdefault(user_id, set()).add(subscription)
+        self._by_role.setdefault(role, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for index, key in ((self._by_user, subscription.user_id), (self._by_role, subscription.role)):
+            subscribers = index.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del index[key]
+
+    def publish(self, event_type: str, data: dict, user_ids: Iterable[str | None] = (), roles: Iterable[str] = ()):
+        """Send an event to the given users and to every subscriber with one of the given roles."""
+        audience: set[Subscription] = set()
+        for user_id in user_ids:
+            audience.update(self._by_user.get(user_id, ()))
+        for role in roles:
+            audience.update(self._by_role.get(role, ()))
+        if not audience:
+            return
+
+        self._seq += 1
+        self.published += 1
+        # Encoded once and shared by every queue
+        message = f"id: {self._seq}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+        for subscription in audience:
+            if subscription.overflowed or not subscription.wants(event_type):
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self._overflow(subscription)
+
+    def _overflow(self, subscription: Subscription):
+        subscription.overflowed = True
+        self.overflows += 1
+        while not subscription.queue.empty():
+            subscription.queue.get_nowait()
+        subscription.queue.put_nowait(_OVERFLOW)
+        self.unsubscribe(subscription)
+
+    async def stream(self, subscription: Subscription) -> AsyncIterator[str]:
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                message = await subscription.queue.get()
+                yield message
+                if message is _OVERFLOW:
+                    return
+        finally:
+            self.unsubscribe(subscription)
+
+    async def run_heartbeat(self, interval: float = RIDE_EVENT_HEARTBEAT_SECONDS):
+        # One timer for every connection rather than a timeout per stream
+        while True:
+            await asyncio.sleep(interval)
+            for subscribers in list(self._by_user.values()):
+                for subscription in subscribers:
+                    # Only idle streams need it; busy ones are already sending
+                    if subscription.queue.empty():
+                        subscription.queue.put_nowait(_KEEPALIVE)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": sum(len(subscribers) for subscribers in self._by_user.values()),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
@@ -1,22 +1,43 @@
 from fastapi import HTTPException
-import requests
+import logging
+import os
 import uuid
 from datetime import datetime, timezone
-from ..models.ride_model import Ride, RideRequest, RideRequestCreate, RideRequestStatus, RideStatus
+from common.session_tokens import STREAM_TICKET_TTL_SECONDS, issue_token
+from common.sqlite_pool import run_blocking
+from common.tracing import span
+from common.user_client import UserServiceClient
+from ..models.ride_model import (
+    DriverLocationUpdate, DriverStatus, NearbyDriver, OpenRideRequests, Ride, RideRequest, RideRequestCreate,
+    RideRequestStatus, RideStatus,
+)
+from ..repository.ride_repository import ChangelogExpiredError, RideRepository, create_ride_repository
+from .dispatcher import BatchDispatcher
+from .driver_locations import DriverLocationIndex
+from .ride_events import RIDE_EVENT_TYPES, RideEventBroker, Subscription
 
-USER_SERVICE_URL = "http://localhost:8000"  # Example URL for the user service
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# A new request with pickup coordinates is offered to this many of the closest drivers
+RIDE_OFFER_DRIVERS = int(os.getenv("RIDE_OFFER_DRIVERS", "5"))
+RIDE_OFFER_RADIUS_KM = float(os.getenv("RIDE_OFFER_RADIUS_KM", "5"))
+# The only endpoint an event stream ticket is good for
+RIDE_EVENTS_SCOPE = "ride-events"
+
+logger = logging.getLogger(__name__)
 
 class RideService:
-    def __init__(self):
-        self.ride_requests = {}
-        self.rides = {}
+    def __init__(self, user_client: UserServiceClient | None = None, repository: RideRepository | None = None,
+                 events: RideEventBroker | None = None, locations: DriverLocationIndex | None = None):
+        self.repository = repository or create_ride_repository()
+        self.user_client = user_client or UserServiceClient()
+        self.events = events or RideEventBroker()
+        self.locations = locations or DriverLocationIndex()
+        self.dispatcher = BatchDispatcher(self)
 
-    def _validate_user(self, user_id: str):
-        # Simulate a call to the user service to validate user existence
-        response = requests.get(f"{USER_SERVICE_URL}/users/verify/{user_id}")
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="User service is unavailable")
-        data = response.json()
+    async def _validate_user(self, user_id: str, token: str | None = None):
+        # Validate the session token locally, or ask the user service
+        data = await self.user_client.verify_user(user_id, token)
         if not data.get("exists"):
             raise HTTPException(status_code=404, detail="User not found")
         elif not data.get("is_logged_in"):
@@ -25,10 +46,10 @@ class RideService:
             raise HTTPException(status_code=403, detail="Please login as a rider to request a ride")
         
 
-    def create_ride_request(self, create_ride_request: RideRequestCreate) -> RideRequest:
+    async def create_ride_request(self, create_ride_request: RideRequestCreate, token: str | None = None) -> RideRequest:
         # Placeholder logic for creating a ride
-        self._validate_user(create_ride_request.user_id)
-        print("User validated successfully.")
+        await self._validate_user(create_ride_request.user_id, token)
+        logger.debug("Rider %s validated", create_ride_request.user_id)
         ride_request = RideRequest(
             id=str(uuid.uuid4()),
             user_id=create_ride_request.user_id,
@@ -36,13 +57,17 @@ class RideService:
             dropoff_location=create_ride_request.dropoff_location,
             requested_at=datetime.now(timezone.utc),
             updated_at=datetime.now(timezone.utc),
-            status=RideRequestStatus.REQUESTED
+            status=RideRequestStatus.REQUESTED,
+            pickup_latitude=create_ride_request.pickup_latitude,
+            pickup_longitude=create_ride_request.pickup_longitude
         )
-        self.ride_requests[ride_request.id] = ride_request
+        await run_blocking(self.repository, self.repository.add_ride_request, ride_request)
+        self.events.publish("ride_request.created", {"ride_request": ride_request.model_dump(mode="json")},
+                            user_ids=[ride_request.user_id], roles=["driver"])
         return ride_request
     
-    def cancel_ride_request(self, ride_request_id: str, user_id: str) -> RideRequest:
-        ride_request = self.ride_requests.get(ride_request_id)
+    async def cancel_ride_request(self, ride_request_id: str, user_id: str) -> RideRequest:
+        ride_request = await run_blocking(self.repository, self.repository.get_ride_request, ride_request_id)
         if not ride_request:
             raise HTTPException(status_code=404, detail="Ride request not found")
         if ride_request.user_id != user_id:
@@ -50,35 +75,52 @@ class RideService:
         if ride_request.status != RideRequestStatus.REQUESTED:
             raise HTTPException(status_code=400, detail="Ride request cannot be cancelled in its current state")
         
-        ride_request.status = RideRequestStatus.CANCELED
-        ride_request.updated_at = datetime.now(timezone.utc)
+        ride_request = await run_blocking(
+            self.repository, self.repository.transition_ride_request,
+            ride_request_id, RideRequestStatus.REQUESTED, RideRequestStatus.CANCELED, datetime.now(timezone.utc)
+        )
+        if ride_request is None:
+            raise HTTPException(status_code=409, detail="Ride request was accepted before it could be cancelled")
+        self.events.publish("ride_request.cancelled", {"ride_request": ride_request.model_dump(mode="json")},
+                            user_ids=[ride_request.user_id], roles=["driver"])
         return ride_request
     
-    def _validate_accept_request(self, driver_id: str, ride_request_id: str):
-        ride_request = self.ride_requests.get(ride_request_id)
+    async def _validate_accept_request(self, driver_id: str, ride_request_id: str, token: str | None = None) -> RideRequest:
+        ride_request = await run_blocking(self.repository, self.repository.get_ride_request, ride_request_id)
         if not ride_request:
             raise HTTPException(status_code=404, detail="Ride request not found")
         if ride_request.status != RideRequestStatus.REQUESTED:
             raise HTTPException(status_code=400, detail="Ride request is not in a valid state to be accepted")
         
-        response = requests.get(f"{USER_SERVICE_URL}/users/verify/{driver_id}")
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="User service is unavailable")
-        data = response.json()
+        with span("verify driver"):
+            data = await self.user_client.verify_user(driver_id, token)
         if not data.get("exists"):
             raise HTTPException(status_code=404, detail="Driver not found")
         elif not data.get("is_logged_in"):
             raise HTTPException(status_code=401, detail="Driver is not logged in")
         elif data.get("role") != "driver":
             raise HTTPException(status_code=403, detail="Please login as a driver to accept a ride")
+        return ride_request
     
-    def accept_ride_request(self, ride_request_id: str, driver_id: str) -> Ride:
+    async def accept_ride_request(self, ride_request_id: str, driver_id: str, token: str | None = None) -> Ride:
         # Placeholder logic for accepting a ride request
-        self._validate_accept_request(driver_id, ride_request_id)
-        ride_request = self.ride_requests[ride_request_id]
-        
-        ride_request.status = RideRequestStatus.ACCEPTED
-        ride_request.updated_at = datetime.now(timezone.utc)
+        ride_request = await self._validate_accept_request(driver_id, ride_request_id, token)
+        ride = await self.assign_ride_request(ride_request, driver_id)
+        if ride is None:
+            raise HTTPException(status_code=409, detail="Ride request has already been accepted by another driver")
+        return ride
+
+    async def assign_ride_request(self, ride_request: RideRequest, driver_id: str) -> Ride | None:
+        """Give the request to the driver, or return None if someone else got it first."""
+        # Validation may have awaited, so the status seen there is only a hint;
+        # the compare-and-set decides the winner
+        with span("claim ride request"):
+            ride_request = await run_blocking(
+                self.repository, self.repository.transition_ride_request,
+                ride_request.id, RideRequestStatus.REQUESTED, RideRequestStatus.ACCEPTED, datetime.now(timezone.utc)
+            )
+        if ride_request is None:
+            return None
         ride = Ride(
             id=str(uuid.uuid4()),
             ride_request_id=ride_request.id,
@@ -88,20 +130,25 @@ class RideService:
             fare=None,
             status=RideStatus.DRIVER_ASSIGNED
         )
-        self.rides[ride.id] = ride
+        with span("store ride"):
+            await run_blocking(self.repository, self.repository.add_ride, ride)
+        # Busy until the driver's next heartbeat says otherwise
+        self.locations.remove(driver_id)
+        with span("publish ride events"):
+            self.events.publish("ride_request.accepted",
+                                {"ride_request": ride_request.model_dump(mode="json"), "ride": ride.model_dump(mode="json")},
+                                user_ids=[ride_request.user_id, driver_id], roles=["driver"])
+            self._publish_ride_status(ride, ride_request, driver_id)
         return ride
     
-    def cancel_ride_request_by_driver(self, ride_request_id: str, driver_id: str, ride_id: str) -> RideRequest:
-        ride_request = self.ride_requests.get(ride_request_id)
+    async def cancel_ride_request_by_driver(self, ride_request_id: str, driver_id: str, ride_id: str, token: str | None = None) -> RideRequest:
+        ride_request = await run_blocking(self.repository, self.repository.get_ride_request, ride_request_id)
         if not ride_request:
             raise HTTPException(status_code=404, detail="Ride request not found")
         if ride_request.status != RideRequestStatus.ACCEPTED:
             raise HTTPException(status_code=400, detail="Ride request cannot be cancelled in its current state")
         
-        response = requests.get(f"{USER_SERVICE_URL}/users/verify/{driver_id}")
-        if response.status_code != 200:
-            raise HTTPException(status_code=500, detail="User service is unavailable")
-        data = response.json()
+        data = await self.user_client.verify_user(driver_id, token)
         if not data.get("exists"):
             raise HTTPException(status_code=404, detail="Driver not found")
         elif not data.get("is_logged_in"):
@@ -109,11 +156,129 @@ class RideService:
         elif data.get("role") != "driver":
             raise HTTPException(status_code=403, detail="Please login as a driver to cancel a ride")
         
-        ride_request.status = RideRequestStatus.REQUESTED
-        ride_request.updated_at = datetime.now(timezone.utc)
-        ride = self.rides.get(ride_id)
-        if ride:
-            ride.status = RideStatus.CANCELED
-            ride.driver_id = None
+        ride = await run_blocking(self.repository, self.repository.get_ride, ride_id)
+        if not ride:
+            raise HTTPException(status_code=404, detail="Ride not found")
+        if ride.ride_request_id != ride_request_id or ride.driver_id != driver_id:
+            raise HTTPException(status_code=403, detail="You are not authorized to cancel this ride")
+        
+        # The ride's compare-and-set also checks the driver, so only the
+        # assigned driver can cancel, and only once
+        ride = await run_blocking(self.repository, self.repository.cancel_ride, ride_id, driver_id)
+        if ride is None:
+            raise HTTPException(status_code=409, detail="Ride changed before it could be cancelled")
+        ride_request = await run_blocking(
+            self.repository, self.repository.transition_ride_request,
+            ride_request_id, RideRequestStatus.ACCEPTED, RideRequestStatus.REQUESTED, datetime.now(timezone.utc)
+        )
+        if ride_request is None:
+            raise HTTPException(status_code=409, detail="Ride request changed before it could be cancelled")
+        self.events.publish("ride_request.reopened", {"ride_request": ride_request.model_dump(mode="json")},
+                            user_ids=[ride_request.user_id], roles=["driver"])
+        self._publish_ride_status(ride, ride_request, driver_id)
+
+        return ride_request
 
-        return ride_request
\ No newline at end of file
+    async def update_driver_location(self, driver_id: str, update: DriverLocationUpdate, token: str | None = None) -> DriverStatus:
+        data = await self.user_client.verify_user(driver_id, token)
+        if not data.get("exists"):
+            raise HTTPException(status_code=404, detail="Driver not found")
+        elif not data.get("is_logged_in"):
+            raise HTTPException(status_code=401, detail="Driver is not logged in")
+        elif data.get("role") != "driver":
+            raise HTTPException(status_code=403, detail="Please login as a driver to share your location")
+        
+        self.locations.update(driver_id, update.latitude, update.longitude, update.is_available)
+        return DriverStatus(
+            driver_id=driver_id,
+            is_available=update.is_available,
+            current_location=f"{update.latitude:.6f},{update.longitude:.6f}",
+            updated_at=datetime.now(timezone.utc)
+        )
+
+    def find_nearby_drivers(self, latitude: float, longitude: float, k: int = RIDE_OFFER_DRIVERS,
+                            radius_km: float = RIDE_OFFER_RADIUS_KM) -> list[NearbyDriver]:
+        return [
+            NearbyDriver(driver_id=driver_id, distance_km=round(distance, 3))
+            for driver_id, distance in self.locations.nearest(latitude, longitude, k, radius_km)
+        ]
+
+    def offer_ride_request(self, ride_request: RideRequest) -> list[NearbyDriver]:
+        """Offer a new request to the closest available drivers; any driver can still accept it."""
+        if ride_request.pickup_latitude is None or ride_request.pickup_longitude is None:
+            return []
+        offers = self.find_nearby_drivers(ride_request.pickup_latitude, ride_request.pickup_longitude)
+        if offers:
+            self.events.publish(
+                "ride_request.offered",
+                {"ride_request": ride_request.model_dump(mode="json"), "offers": [offer.model_dump() for offer in offers]},
+                user_ids=[offer.driver_id for offer in offers],
+            )
+        return offers
+
+    def _publish_ride_status(self, ride: Ride, ride_request: RideRequest, driver_id: str):
+        self.events.publish("ride.status_changed", {"ride": ride.model_dump(mode="json")},
+                            user_ids=[ride_request.user_id, driver_id])
+
+    async def issue_events_ticket(self, user_id: str, token: str | None = None) -> dict:
+        # EventSource can't send headers, so the session token is traded for
+        # a ticket that can go in the URL: it expires in seconds and opens
+        # nothing but the event stream
+        data = await self.user_client.verify_user(user_id, token)
+        if not data.get("exists"):
+            raise HTTPException(status_code=404, detail="User not found")
+        elif not data.get("is_logged_in"):
+            raise HTTPException(status_code=401, detail="User is not logged in")
+        ticket = issue_token(user_id, data.get("role"), self.user_client.token_secret, STREAM_TICKET_TTL_SECONDS,
+                             scope=RIDE_EVENTS_SCOPE)
+        return {"ticket": ticket, "expires_in": STREAM_TICKET_TTL_SECONDS}
+
+    async def subscribe_events(self, user_id: str, token: str | None = None, types: list[str] | None = None,
+                               ticket: str | None = None) -> Subscription:
+        unknown = set(types or ()) - RIDE_EVENT_TYPES
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown event types: {', '.join(sorted(unknown))}")
+        # The role comes from the verified session or ticket, not from the caller
+        if ticket is not None:
+            data = self.user_client.verify_ticket(user_id, ticket, RIDE_EVENTS_SCOPE)
+        else:
+            data = await self.user_client.verify_user(user_id, token)
+        if not data.get("exists"):
+            raise HTTPException(status_code=404, detail="User not found")
+        elif not data.get("is_logged_in"):
+            raise HTTPException(status_code=401, detail="User is not logged in")
+        return self.events.subscribe(user_id, data.get("role"), types)
+
+    def get_open_ride_requests(self, limit: int = DEFAULT_PAGE_SIZE, cursor: int | None = None, since: int | None = None) -> OpenRideRequests:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        if since is not None:
+            return self._open_ride_request_changes(since, limit)
+        # Read the seq first: a change racing with the listing is then
+        # replayed by the next poll instead of being missed
+        seq = self.repository.ride_request_seq()
+        entries = self.repository.list_open_ride_requests(limit + 1, cursor or 0)
+        next_cursor = None
+        if len(entries) > limit:
+            entries = entries[:limit]
+            next_cursor = entries[-1][0]
+        return OpenRideRequests(
+            ride_requests=[ride_request for _, ride_request in entries],
+            seq=seq,
+            next_cursor=next_cursor
+        )
+
+    def _open_ride_request_changes(self, since: int, limit: int) -> OpenRideRequests:
+        try:
+            changes = self.repository.ride_request_changes(since, limit)
+        except ChangelogExpiredError:
+            raise HTTPException(status_code=410, detail="Changes since this seq are no longer available, list the open ride requests again")
+        # Only the last change per request matters
+        opened = {}
+        for _, ride_request_id, is_open in changes:
+            opened[ride_request_id] = is_open
+        return OpenRideRequests(
+            ride_requests=self.repository.get_open_ride_requests([ride_request_id for ride_request_id, is_open in opened.items() if is_open]),
+            removed=[ride_request_id for ride_request_id, is_open in opened.items() if not is_open],
+            seq=changes[-1][0] if changes else since,
+            has_more=len(changes) == limit
+        )
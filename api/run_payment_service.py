@@ -0,0 +1,10 @@
+#!/usr/bin/env python3
+import sys
+import os
+
+# Add the api directory to the path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run("payment-service.main:app", host="0.0.0.0", port=8003, reload=True)
@@ -1,16 +1,25 @@
+import time
 from datetime import datetime, timezone
-from ..models.user_model import UserCreate
+from ..models.user_model import User, UserCreate, UserVerifyBatchRequest
+from ..repository.user_repository import EmailAlreadyExistsError
 from ..service.user_service import UserService
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
+from common.session_tokens import SESSION_TOKEN_TTL_SECONDS
+from common.sqlite_pool import run_blocking
 
 router = APIRouter(prefix="/users", tags=["users"])
 user_service = UserService()
 
+MAX_VERIFY_BATCH_SIZE = 1000
+
 @router.post("/register")
-def register_user(user_create: UserCreate):
-    if user_service.get_user_by_email(user_create.email):
+async def register_user(user_create: UserCreate):
+    if await run_blocking(user_service.repository, user_service.get_user_by_email, user_create.email):
+        return {"error": "User already exists"}
+    try:
+        new_user = await user_service.create_user(user_create)
+    except EmailAlreadyExistsError:
         return {"error": "User already exists"}
-    new_user = user_service.create_user(user_create)
     return {"message": "User registered successfully", 
             "user_details": {
                 "id": new_user.id,
@@ -23,7 +32,7 @@ def register_user(user_create: UserCreate):
 
 @router.get("/{user_id}")
 def get_user(user_id: str):
-    user = user_service.users.get(user_id)
+    user = user_service.get_user_by_id(user_id)
     if not user:
         return {"error": "User not found"}
     return {
@@ -35,11 +44,14 @@ def get_user(user_id: str):
     }
 
 @router.put("/{user_id}")
-def update_user(user_id: str, user_update: UserCreate):
-    user = user_service.users.get(user_id)
+async def update_user(user_id: str, user_update: UserCreate):
+    user = await run_blocking(user_service.repository, user_service.get_user_by_id, user_id)
     if not user:
         return {"error": "User not found"}
-    user = user_service.update_user(user_id, user_update)
+    try:
+        user = await user_service.update_user(user_id, user_update)
+    except EmailAlreadyExistsError:
+        return {"error": "Email is already in use"}
     return {"message": "User updated successfully", 
             "user_details": {
                 "id": user.id,
@@ -58,12 +70,13 @@ def delete_user(user_id: str):
     return {"message": "User deleted successfully"}
 
 @router.post("/login")
-def login_user(credentials: dict):
+async def login_user(credentials: dict):
     email = credentials.get("email")
     password = credentials.get("password")
     if not email or not password:
         return {"error": "Email and password are required"}
-    user = user_service.login_user(email, password).get("user_details")
+    result = await user_service.login_user(email, password)
+    user = result.get("user_details")
     if not user:
         return {"error": "Invalid email or password"}
     return {"message": "Login successful", 
@@ -72,12 +85,13 @@ def login_user(credentials: dict):
                 "username": user.username,
                 "email": user.email,
                 "role": user.role
-            }
+            },
+            "access_token": result["access_token"],
+            "token_type": "bearer",
+            "expires_in": SESSION_TOKEN_TTL_SECONDS
             }
 
-@router.get("/verify/{user_id}")
-def verify_user(user_id: str):
-    user = user_service.get_user_by_id(user_id)
+def _verification(user: User | None) -> dict:
     if not user:
         return {"exists": False}
     return {
@@ -86,6 +100,29 @@ def verify_user(user_id: str):
         "role": user.role
     }
 
+@router.get("/verify/{user_id}")
+def verify_user(user_id: str):
+    return _verification(user_service.get_user_by_id(user_id))
+
+@router.post("/verify:batch")
+def verify_users_batch(batch: UserVerifyBatchRequest):
+    if len(batch.user_ids) > MAX_VERIFY_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_VERIFY_BATCH_SIZE} user ids can be verified per request")
+    return {
+        "results": {
+            user_id: _verification(user_service.get_user_by_id(user_id))
+            for user_id in batch.user_ids
+        }
+    }
+
+@router.get("/sessions/revocations")
+def get_session_revocations(since: float = 0.0):
+    # Polled by the ride and payment services to keep their revocation lists current
+    return {
+        "now": time.time(),
+        "revocations": user_service.session_revocations(since)
+    }
+
 @router.post("/logout/{user_id}")
 def logout_user(user_id: str):
     result = user_service.logout_user(user_id)
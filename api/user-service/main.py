@@ -1,8 +1,19 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from common.metrics import MetricsMiddleware, create_metrics_router
+from common.tracing import TracingMiddleware, create_debug_traces_router
+from common.profiling import ProfilingMiddleware, create_debug_profile_router
 from .controllers import user_controller
+from .security.hashing import HashingSaturatedError, shutdown_hash_pool
 
-app = FastAPI(title="User Service API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    shutdown_hash_pool()
+
+app = FastAPI(title="User Service API", version="1.0.0", lifespan=lifespan)
 
 # Enable CORS
 app.add_middleware(
@@ -13,7 +24,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route latency, status and in-flight metrics, served at /metrics
+app.add_middleware(MetricsMiddleware)
+# Span waterfalls of recent slow requests, served at /debug/traces
+app.add_middleware(TracingMiddleware)
+# Outermost, so a profiled request includes the other middleware; needs PROFILING_TOKEN
+app.add_middleware(ProfilingMiddleware)
+
 app.include_router(user_controller.router)
+app.include_router(create_metrics_router())
+app.include_router(create_debug_traces_router())
+app.include_router(create_debug_profile_router())
+
+@app.exception_handler(HashingSaturatedError)
+async def hashing_saturated_handler(request: Request, exc: HashingSaturatedError):
+    # Shed login/register load instead of letting it starve /users/verify
+    return JSONResponse(status_code=429, content={"error": "Too many requests, please retry shortly"}, headers={"Retry-After": "1"})
 
 @app.get("/")
 def root():
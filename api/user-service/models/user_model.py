@@ -17,4 +17,7 @@ class UserCreate(BaseModel):
     email: str
     password: str
     dob: date | None = None
-    role: str
\ No newline at end of file
+    role: str
+
+class UserVerifyBatchRequest(BaseModel):
+    user_ids: list[str]
\ No newline at end of file
@@ -0,0 +1,197 @@
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from common.session_tokens import SESSION_TOKEN_TTL_SECONDS, RevocationList
+from common.sqlite_pool import STORAGE_BACKEND, SQLitePool, sqlite_path
+from ..models.user_model import User
+
+class EmailAlreadyExistsError(ValueError):
+    pass
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+class UserRepository(ABC):
+    # True when calls can wait on disk or locks, so async callers use run_blocking
+    blocking = False
+
+    @abstractmethod
+    def get(self, user_id: str) -> User | None: ...
+
+    @abstractmethod
+    def get_by_email(self, email: str) -> User | None: ...
+
+    @abstractmethod
+    def add(self, user: User):
+        """Store a new user; raises EmailAlreadyExistsError if the email is taken."""
+
+    @abstractmethod
+    def save(self, user: User):
+        """Persist changes to an existing user, including an email change."""
+
+    @abstractmethod
+    def delete(self, user_id: str) -> User | None: ...
+
+    @abstractmethod
+    def revoke_sessions(self, user_id: str): ...
+
+    @abstractmethod
+    def session_revocations(self, since: float) -> dict[str, float]: ...
+
+
+class InMemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.users = {}  # In-memory user storage for demonstration
+        self.email_index = {}  # Normalized email -> user id
+        # Guards users/email_index so the uniqueness check and the write are atomic
+        self._lock = threading.Lock()
+        self._revocations = RevocationList()
+
+    def get(self, user_id: str) -> User | None:
+        return self.users.get(user_id)
+
+    def get_by_email(self, email: str) -> User | None:
+        user_id = self.email_index.get(normalize_email(email))
+        return self.users.get(user_id) if user_id else None
+
+    def add(self, user: User):
+        email_key = normalize_email(user.email)
+        with self._lock:
+            if email_key in self.email_index:
+                raise EmailAlreadyExistsError(user.email)
+            self.users[user.id] = user
+            self.email_index[email_key] = user.id
+
+    def save(self, user: User):
+        new_key = normalize_email(user.email)
+        with self._lock:
+            owner = self.email_index.get(new_key)
+            if owner is not None and owner != user.id:
+                raise EmailAlreadyExistsError(user.email)
+            previous = self.users.get(user.id)
+            if previous is not None:
+                old_key = normalize_email(previous.email)
+                if old_key != new_key:
+                    self.email_index.pop(old_key, None)
+            self.users[user.id] = user
+            self.email_index[new_key] = user.id
+
+    def delete(self, user_id: str) -> User | None:
+        with self._lock:
+            user = self.users.pop(user_id, None)
+            if user:
+                self.email_index.pop(normalize_email(user.email), None)
+        return user
+
+    def revoke_sessions(self, user_id: str):
+        self._revocations.revoke(user_id)
+
+    def session_revocations(self, since: float) -> dict[str, float]:
+        return self._revocations.snapshot(since)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    username TEXT NOT NULL,
+    email TEXT NOT NULL,
+    email_key TEXT NOT NULL,
+    hashed_password TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    dob TEXT,
+    role TEXT NOT NULL,
+    is_logged_in INTEGER NOT NULL DEFAULT 0
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email_key ON users (email_key);
+CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at);
+CREATE TABLE IF NOT EXISTS session_revocations (
+    user_id TEXT PRIMARY KEY,
+    revoked_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_session_revocations_revoked_at ON session_revocations (revoked_at);
+"""
+
+_USER_COLUMNS = "id, username, email, hashed_password, created_at, updated_at, dob, role, is_logged_in"
+
+class SQLiteUserRepository(UserRepository):
+    blocking = True
+
+    def __init__(self, path: str | None = None):
+        self.pool = SQLitePool(path or sqlite_path("users.db"), SCHEMA)
+
+    @staticmethod
+    def _to_row(user: User) -> tuple:
+        return (
+            user.id, user.username, user.email, normalize_email(user.email), user.hashed_password,
+            user.created_at.isoformat(), user.updated_at.isoformat(),
+            user.dob.isoformat() if user.dob else None, user.role, int(user.is_logged_in),
+        )
+
+    @staticmethod
+    def _to_user(row) -> User | None:
+        return User(**dict(row)) if row else None
+
+    def get(self, user_id: str) -> User | None:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+        return self._to_user(row)
+
+    def get_by_email(self, email: str) -> User | None:
+        with self.pool.connection() as conn:
+            row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE email_key = ?", (normalize_email(email),)).fetchone()
+        return self._to_user(row)
+
+    def add(self, user: User):
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(
+                    "INSERT INTO users (id, username, email, email_key, hashed_password, created_at, updated_at, dob, role, is_logged_in)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self._to_row(user),
+                )
+        except sqlite3.IntegrityError:
+            raise EmailAlreadyExistsError(user.email)
+
+    def save(self, user: User):
+        row = self._to_row(user)
+        try:
+            with self.pool.transaction() as conn:
+                conn.execute(
+                    "UPDATE users SET username = ?, email = ?, email_key = ?, hashed_password = ?, created_at = ?,"
+                    " updated_at = ?, dob = ?, role = ?, is_logged_in = ? WHERE id = ?",
+                    row[1:] + row[:1],
+                )
+        except sqlite3.IntegrityError:
+            raise EmailAlreadyExistsError(user.email)
+
+    def delete(self, user_id: str) -> User | None:
+        with self.pool.transaction() as conn:
+            row = conn.execute(f"SELECT {_USER_COLUMNS} FROM users WHERE id = ?", (user_id,)).fetchone()
+            if row:
+                conn.execute("DELETE FROM users WHERE id = ?", (user_id,))
+        return self._to_user(row)
+
+    def revoke_sessions(self, user_id: str):
+        now = time.time()
+        with self.pool.transaction() as conn:
+            conn.execute(
+                "INSERT INTO session_revocations (user_id, revoked_at) VALUES (?, ?)"
+                " ON CONFLICT (user_id) DO UPDATE SET revoked_at = MAX(revoked_at, excluded.revoked_at)",
+                (user_id, now),
+            )
+            conn.execute("DELETE FROM session_revocations WHERE revoked_at < ?", (now - SESSION_TOKEN_TTL_SECONDS,))
+
+    def session_revocations(self, since: float) -> dict[str, float]:
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                "SELECT user_id, revoked_at FROM session_revocations WHERE revoked_at > ?", (since,)
+            ).fetchall()
+        return {row["user_id"]: row["revoked_at"] for row in rows}
+
+
+def create_user_repository() -> UserRepository:
+    if STORAGE_BACKEND == "sqlite":
+        return SQLiteUserRepository()
+    return InMemoryUserRepository()
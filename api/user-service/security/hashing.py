@@ -1,8 +1,24 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
 import bcrypt
 
-def hash_password(password: str) -> str:
+# Cost factor for new hashes; stored hashes with a different cost are upgraded on login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Size of the process pool that runs bcrypt off the event loop
+HASH_POOL_WORKERS = int(os.getenv("HASH_POOL_WORKERS", str(os.cpu_count() or 1)))
+# Hashing jobs allowed in flight (running or queued) before new ones are rejected
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", str(HASH_POOL_WORKERS * 8)))
+
+_executor: ProcessPoolExecutor | None = None
+_in_flight = 0
+
+class HashingSaturatedError(RuntimeError):
+    pass
+
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
     # Generate a salt
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds)
     # Hash the password with the salt
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     # Return the hashed password as a string
@@ -10,4 +26,39 @@ def hash_password(password: str) -> str:
 
 def verify_password(password: str, hashed: str) -> bool:
     # Verify a password against the hashed version
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
\ No newline at end of file
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+def get_rounds(hashed: str) -> int:
+    # bcrypt hashes look like $2b$<cost>$<salt+digest>
+    return int(hashed.split("$")[2])
+
+def needs_rehash(hashed: str) -> bool:
+    return get_rounds(hashed) != BCRYPT_ROUNDS
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=HASH_POOL_WORKERS)
+    return _executor
+
+async def _run_in_pool(fn, *args):
+    global _in_flight
+    if _in_flight >= HASH_QUEUE_LIMIT:
+        raise HashingSaturatedError("Password hashing queue is full")
+    _in_flight += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_executor(), fn, *args)
+    finally:
+        _in_flight -= 1
+
+async def hash_password_async(password: str) -> str:
+    return await _run_in_pool(hash_password, password, BCRYPT_ROUNDS)
+
+async def verify_password_async(password: str, hashed: str) -> bool:
+    return await _run_in_pool(verify_password, password, hashed)
+
+def shutdown_hash_pool():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
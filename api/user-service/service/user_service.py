@@ -1,15 +1,21 @@
 from datetime import datetime, timezone
 from ..models.user_model import User, UserCreate
 import uuid
-from ..security.hashing import hash_password, verify_password
+from common.session_tokens import issue_token
+from common.sqlite_pool import run_blocking
+from common.user_events import UserEventPublisher
+from ..repository.user_repository import UserRepository, create_user_repository
+from ..security.hashing import HashingSaturatedError, hash_password_async, needs_rehash, verify_password_async
 
 class UserService:
-    def __init__(self):
-        self.users = {}  # In-memory user storage for demonstration
+    def __init__(self, event_publisher: UserEventPublisher | None = None, repository: UserRepository | None = None):
+        self.repository = repository or create_user_repository()
+        # Tells the ride and payment services to drop cached verifications
+        self.event_publisher = event_publisher or UserEventPublisher()
 
-    def create_user(self, user_create: UserCreate) -> User:
+    async def create_user(self, user_create: UserCreate) -> User:
         user_id = str(uuid.uuid4())
-        hashed_password = hash_password(user_create.password)
+        hashed_password = await hash_password_async(user_create.password)
         new_user = User(
             id=user_id,
             username=user_create.username,
@@ -21,41 +27,60 @@ class UserService:
             role=user_create.role,
             is_logged_in=False
         )
-        self.users[user_id] = new_user
+        await run_blocking(self.repository, self.repository.add, new_user)
         return new_user
     
     def get_user_by_id(self, user_id: str) -> User | None:
-        return self.users.get(user_id)
+        return self.repository.get(user_id)
 
     def get_user_by_email(self, user_email: str) -> User | None:
-        for user in self.users.values():
-            if user.email == user_email:
-                return user
-        return None
+        return self.repository.get_by_email(user_email)
     
-    def update_user(self, user_id: str, user_update: UserCreate) -> User | None:
-        user = self.users.get(user_id)
+    async def update_user(self, user_id: str, user_update: UserCreate) -> User | None:
+        user = await run_blocking(self.repository, self.repository.get, user_id)
         if user:
-            user.username = user_update.username
-            user.email = user_update.email
-            user.hashed_password = hash_password(user_update.password)
-            user.dob = user_update.dob
-            user.role = user_update.role
-            user.updated_at = datetime.now(timezone.utc)
+            hashed_password = await hash_password_async(user_update.password)
+            user = user.model_copy(update={
+                "username": user_update.username,
+                "email": user_update.email,
+                "hashed_password": hashed_password,
+                "dob": user_update.dob,
+                "role": user_update.role,
+                "updated_at": datetime.now(timezone.utc)
+            })
+            await run_blocking(self.repository, self._save_and_revoke, user)
+            self.event_publisher.publish("update", user_id)
             return user
         return None
     
+    def _save_and_revoke(self, user: User):
+        self.repository.save(user)
+        self.repository.revoke_sessions(user.id)
+
     def delete_user(self, user_id: str) -> bool:
-        if user_id in self.users:
-            del self.users[user_id]
+        if self.repository.delete(user_id):
+            self.repository.revoke_sessions(user_id)
+            self.event_publisher.publish("delete", user_id)
             return True
         return False
     
-    def login_user(self, email: str, password: str) -> User | None:
-        user = self.get_user_by_email(email)
-        if user and verify_password(password, user.hashed_password):
+    async def login_user(self, email: str, password: str) -> User | None:
+        user = await run_blocking(self.repository, self.get_user_by_email, email)
+        if user and await verify_password_async(password, user.hashed_password):
+            if needs_rehash(user.hashed_password):
+                # Upgrade the stored hash to the configured cost while we have the plaintext
+                try:
+                    user.hashed_password = await hash_password_async(password)
+                except HashingSaturatedError:
+                    pass
             user.is_logged_in = True
-            return {"message": "Login successful", "user_details": user}
+            await run_blocking(self.repository, self.repository.save, user)
+            self.event_publisher.publish("login", user.id)
+            return {
+                "message": "Login successful",
+                "user_details": user,
+                "access_token": issue_token(user.id, user.role)
+            }
         return {"error": "Invalid email or password"}
     
     def is_logged_in(self, user_id: str) -> bool:
@@ -65,5 +90,10 @@ class UserService:
         user = self.get_user_by_id(user_id)
         if user and user.is_logged_in:
             user.is_logged_in = False
+            self._save_and_revoke(user)
+            self.event_publisher.publish("logout", user_id)
             return {"message": "Logout successful"}
-        return {"error": "User is not logged in"}
\ No newline at end of file
+        return {"error": "User is not logged in"}
+
+    def session_revocations(self, since: float) -> dict[str, float]:
+        return self.repository.session_revocations(since)
@@ -9,6 +9,10 @@ const API_CONFIG = {
 let currentUser = null;
 let activeRides = [];
 let availableRides = [];
+let openRidesSeq = null;
+let openRidesPoller = null;
+let rideEvents = null;
+const OPEN_RIDES_POLL_MS = 5000;
 
 // Initialize Application
 document.addEventListener('DOMContentLoaded', () => {
@@ -200,7 +204,7 @@ async function handleLogin(e) {
             addFlowItem('User Service', 'Login', 'error', data.error);
             alert(data.error);
         } else if (data.user_details) {
-            currentUser = data.user_details;
+            currentUser = { ...data.user_details, access_token: data.access_token };
             localStorage.setItem('currentUser', JSON.stringify(currentUser));
             addFlowItem('User Service', 'Login', 'success', `Logged in as ${currentUser.username} (${currentUser.role})`);
             updateUIForLoggedInUser();
@@ -289,15 +293,19 @@ function updateUIForLoggedInUser() {
         document.getElementById('rider-section').style.display = 'block';
         document.getElementById('driver-section').style.display = 'none';
         loadRiderRides();
+        connectRideEvents();
     } else if (currentUser.role === 'driver') {
         document.getElementById('driver-section').style.display = 'block';
         document.getElementById('rider-section').style.display = 'none';
-        loadAvailableRides();
+        // The event stream loads the open requests once it connects
+        if (!connectRideEvents()) loadAvailableRides();
         loadDriverRides();
     }
 }
 
 function updateUIForLoggedOutUser() {
+    disconnectRideEvents();
+    stopPollingAvailableRides();
     document.getElementById('auth-section').style.display = 'block';
     document.getElementById('user-info').style.display = 'none';
     document.getElementById('rider-section').style.display = 'none';
@@ -382,7 +390,7 @@ async function createRideRequest(pickupLocation, dropoffLocation) {
         
         const response = await fetch(url, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
+            headers: authHeaders(),
             body: JSON.stringify(rideData)
         });
         
@@ -430,12 +438,180 @@ async function cancelRideRequest(rideRequestId) {
 
 // Driver Functions
 async function loadAvailableRides() {
-    // In a real application, this would fetch available rides from the backend
-    // For now, we'll simulate with mock data stored in the service
-    addFlowItem('Ride Service', 'Fetch Available Rides', 'success', 'Loading available ride requests');
-    
+    // Page through the open requests once, then poll only for changes
+    try {
+        const rides = [];
+        let cursor = null;
+        let seq = null;
+        do {
+            const url = `${API_CONFIG.RIDE_SERVICE}/ride-requests/open?limit=200${cursor ? `&cursor=${cursor}` : ''}`;
+            const response = await fetch(url);
+            const data = await response.json();
+            logAPICall('GET', url, response.status, null, { seq: data.seq, count: data.ride_requests.length });
+            if (seq === null) seq = data.seq;
+            rides.push(...data.ride_requests);
+            cursor = data.next_cursor;
+        } while (cursor);
+
+        availableRides = rides;
+        openRidesSeq = seq;
+        addFlowItem('Ride Service', 'Fetch Available Rides', 'success', `${availableRides.length} open ride requests`);
+        renderAvailableRides();
+
+        // Without the event stream, fall back to polling for changes
+        if (!rideEvents && !openRidesPoller) {
+            openRidesPoller = setInterval(pollAvailableRides, OPEN_RIDES_POLL_MS);
+        }
+    } catch (error) {
+        addFlowItem('Ride Service', 'Fetch Available Rides', 'error', error.message);
+    }
+}
+
+async function pollAvailableRides() {
+    if (openRidesSeq === null) return;
+
+    try {
+        let hasMore = true;
+        let changed = false;
+        while (hasMore) {
+            const url = `${API_CONFIG.RIDE_SERVICE}/ride-requests/open?since=${openRidesSeq}`;
+            const response = await fetch(url);
+            if (response.status === 410) {
+                // Too far behind (or the service restarted), start over
+                await loadAvailableRides();
+                return;
+            }
+            const data = await response.json();
+            const stale = new Set([...data.removed, ...data.ride_requests.map(ride => ride.id)]);
+            availableRides = availableRides.filter(ride => !stale.has(ride.id)).concat(data.ride_requests);
+            changed = changed || stale.size > 0;
+            openRidesSeq = data.seq;
+            hasMore = data.has_more;
+        }
+        if (changed) renderAvailableRides();
+    } catch (error) {
+        console.error('Failed to poll open ride requests:', error);
+    }
+}
+
+function stopPollingAvailableRides() {
+    clearInterval(openRidesPoller);
+    openRidesPoller = null;
+    openRidesSeq = null;
+    availableRides = [];
+}
+
+// Ride events pushed by the ride service over Server-Sent Events
+function connectRideEvents() {
+    if (!window.EventSource || !currentUser || !currentUser.access_token) return false;
+    disconnectRideEvents();
+    const user = currentUser;
+
+    // The session token stays in the Authorization header; the URL only
+    // carries a ticket that expires in seconds and opens nothing else
+    const ticketUrl = `${API_CONFIG.RIDE_SERVICE}/ride-requests/events/ticket?user_id=${user.id}`;
+    fetch(ticketUrl, { method: 'POST', headers: authHeaders() })
+        .then(response => response.ok ? response.json() : Promise.reject(response.status))
+        .then(({ ticket }) => {
+            if (currentUser === user) openRideEvents(ticket);
+        })
+        .catch(() => {
+            // Rejected (e.g. expired session): go back to polling
+            if (currentUser === user && user.role === 'driver') loadAvailableRides();
+        });
+    return true;
+}
+
+function openRideEvents(ticket) {
+    disconnectRideEvents();
+    const url = `${API_CONFIG.RIDE_SERVICE}/ride-requests/events?user_id=${currentUser.id}&ticket=${encodeURIComponent(ticket)}`;
+    const source = new EventSource(url);
+    rideEvents = source;
+    let opened = false;
+
+    source.addEventListener('open', () => {
+        opened = true;
+        // Anything published while disconnected was missed, so resync
+        if (currentUser && currentUser.role === 'driver') loadAvailableRides();
+    });
+    source.addEventListener('error', () => {
+        if (source.readyState === EventSource.CLOSED && rideEvents === source) {
+            rideEvents = null;
+            if (opened) {
+                // The browser's own reconnect reused the expired ticket; get a fresh one
+                connectRideEvents();
+            } else if (currentUser && currentUser.role === 'driver') {
+                loadAvailableRides();
+            }
+        }
+    });
+    source.addEventListener('overflow', () => {
+        // We fell too far behind and the server dropped us
+        connectRideEvents();
+    });
+
+    const openRide = (event) => {
+        const { ride_request } = JSON.parse(event.data);
+        if (currentUser.role === 'driver') {
+            availableRides = availableRides.filter(ride => ride.id !== ride_request.id).concat([ride_request]);
+            renderAvailableRides();
+        }
+    };
+    const closeRide = (event) => {
+        const { ride_request } = JSON.parse(event.data);
+        if (currentUser.role === 'driver') {
+            availableRides = availableRides.filter(ride => ride.id !== ride_request.id);
+            renderAvailableRides();
+        }
+    };
+    source.addEventListener('ride_request.created', openRide);
+    source.addEventListener('ride_request.reopened', (event) => {
+        openRide(event);
+        if (currentUser.role === 'rider') {
+            addFlowItem('Ride Service', 'Driver Cancelled', 'pending', 'Your request is open again');
+        }
+    });
+    source.addEventListener('ride_request.cancelled', closeRide);
+    source.addEventListener('ride_request.accepted', (event) => {
+        closeRide(event);
+        const { ride_request, ride } = JSON.parse(event.data);
+        if (currentUser.role === 'rider' && ride_request.user_id === currentUser.id) {
+            addFlowItem('Ride Service', 'Ride Accepted', 'success', `Driver ${ride.driver_id} accepted your ride`);
+        }
+    });
+}
+
+function disconnectRideEvents() {
+    if (rideEvents) {
+        rideEvents.close();
+        rideEvents = null;
+    }
+}
+
+function renderAvailableRides() {
     const listDiv = document.getElementById('available-rides-list');
-    listDiv.innerHTML = '<div class="empty-state">Available rides would appear here. Create a ride request as a rider to see them.</div>';
+    if (availableRides.length === 0) {
+        listDiv.innerHTML = '<div class="empty-state">No open ride requests right now. New requests will appear here automatically.</div>';
+        return;
+    }
+
+    listDiv.innerHTML = '';
+    for (const ride of availableRides) {
+        const card = document.createElement('div');
+        card.className = 'ride-card';
+        card.innerHTML = `
+            <h4></h4>
+            <p>Requested: ${formatDate(ride.requested_at)}</p>
+            <span class="ride-status requested">Requested</span>
+            <div class="ride-actions">
+                <button class="btn btn-primary">Accept</button>
+            </div>
+        `;
+        // Locations are user input, so keep them out of innerHTML
+        card.querySelector('h4').textContent = `${ride.pickup_location} → ${ride.dropoff_location}`;
+        card.querySelector('button').addEventListener('click', () => acceptRideRequest(ride.id));
+        listDiv.appendChild(card);
+    }
 }
 
 async function acceptRideRequest(rideRequestId) {
@@ -447,7 +623,7 @@ async function acceptRideRequest(rideRequestId) {
         
         const response = await fetch(url, {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' }
+            headers: authHeaders()
         });
         
         const data = await response.json();
@@ -473,6 +649,15 @@ async function loadRiderRides() {
     listDiv.innerHTML = '<div class="empty-state">Your ride requests will appear here after you create them</div>';
 }
 
+// Session token header so the ride service can verify the user locally
+function authHeaders() {
+    const headers = { 'Content-Type': 'application/json' };
+    if (currentUser && currentUser.access_token) {
+        headers['Authorization'] = `Bearer ${currentUser.access_token}`;
+    }
+    return headers;
+}
+
 // Helper function to format dates
 function formatDate(dateString) {
     if (!dateString) return 'N/A';